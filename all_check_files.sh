@@ -1,7 +1,3 @@
 #!/bin/bash
 
-for f in samples/*.csv
-do
-   name="$(basename -s .csv "$f")"
-   ./check_files.py "$f" |& tee "samples/$name.log"
-done
+./check_files.py samples/*.csv "$@" |& tee samples/check_files.log
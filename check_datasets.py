@@ -1,35 +1,74 @@
 #!/usr/bin/env python
-
-
+"""Report branch differences between the files of the datasets."""
+import collections
 import pathlib
-import ROOT
+from stopscompressed import catalog
+from stopscompressed import transport
 
-NTUPLE_DIR = pathlib.Path("/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples")
+import click
 
+NTUPLE_DIR = transport.SCRATCH_PATH
+SKIMS = ["Met", "MetLepEnergy", "DoubleLep"]
 
-def main(skim: str) -> None:
 
-    for dir in NTUPLE_DIR.glob(f"*/{skim}/*Run*"):
-        if not dir.is_dir():
+def report(
+    sample: str,
+    schemas: dict[str, str],
+    branches: dict[str, set[str]],
+    hlt_only: bool,
+) -> None:
+    """Print the files deviating from the most common schema of a sample.
+
+    Args:
+        sample (str): Name of the sample
+        schemas (dict[str, str]): Schema hash by file
+        branches (dict[str, set[str]]): Branches by schema hash
+        hlt_only (bool): report only trigger branches
+    """
+    counts = collections.Counter(schemas.values())
+    if len(counts) < 2:
+        return
+    reference = branches[counts.most_common(1)[0][0]]
+    print(f"{sample}: {len(counts)} schemas in {len(schemas)} files")
+    for schema, nr in counts.most_common()[1:]:
+        missing = sorted(reference - branches[schema])
+        extra = sorted(branches[schema] - reference)
+        if hlt_only:
+            missing = [n for n in missing if n.startswith("HLT_")]
+            extra = [n for n in extra if n.startswith("HLT_")]
+        if not missing and not extra:
             continue
-        print(f"Scanning {dir.name} ...")
-        branches: list[set[str]] = []
-        for i, root_file in enumerate(dir.iterdir()):
-            inp_file = ROOT.TFile(str(root_file), "READ")
-            inp_chain = inp_file.Get("Events")
+        names = sorted(
+            pathlib.PurePath(f).name for f, s in schemas.items() if s == schema
+        )
+        print(f"  {nr} files: {', '.join(names)}")
+        if missing:
+            print(f"    missing: {', '.join(missing)}")
+        if extra:
+            print(f"    extra: {', '.join(extra)}")
+
 
-            branches.append(set(x.GetName() for x in inp_chain.GetListOfBranches()))
-            inp_file.Close()
+@click.command()
+@click.option("--skim", default="DoubleLep", type=click.Choice(SKIMS))
+@click.option("--pattern", default="*Run*", help="Pattern of the sample directories.")
+@click.option("--workers", type=int, help="Number of processes [default: all cores]")
+@click.option("--hlt-only/--no-hlt-only", default=False, help="Only HLT branches.")
+def main(skim: str, pattern: str, workers: int | None, hlt_only: bool) -> None:
+    """Report branch differences between the files of the datasets."""
+    dirs = sorted(d for d in NTUPLE_DIR.glob(f"*/{skim}/{pattern}") if d.is_dir())
+    files = {d: [str(p) for p in d.glob("*.root")] for d in dirs}
 
-        all = set()
-        for b in branches:
-            all |= b
+    files_catalog = catalog.Catalog()
+    # one scan for all samples, so that the headers are read in parallel
+    schemas = files_catalog.schemas([f for fs in files.values() for f in fs], workers)
+    branches = {s: set(files_catalog.branches(s)) for s in set(schemas.values())}
+    print(f"{len(schemas)} files, {len(branches)} schemas")
 
-        for i, b in enumerate(branches):
-            names = [n for n in all - b if not n.startswith("HLT_")]
-            if names:
-                print(i, names)
+    for d, fs in files.items():
+        report(
+            f"{d.parts[-3]}/{d.name}", {f: schemas[f] for f in fs}, branches, hlt_only
+        )
 
 
 if __name__ == "__main__":
-    main("DoubleLep")
+    main()
@@ -1,8 +1,14 @@
 #!/usr/bin/env python
 """Check files."""
+import asyncio
+import concurrent.futures
 import csv
 import logging
 import pathlib
+from stopscompressed import catalog
+from stopscompressed import manifest
+from stopscompressed import transport
+from typing import Any
 
 import click
 import ROOT
@@ -14,32 +20,163 @@ logging.basicConfig(
 )
 log = logging.getLogger(__name__)
 
-PATH = pathlib.Path("/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples/")
+PATH = transport.SCRATCH_PATH
 
+# files per RunGraphs call, limits the number of open files
+BATCH_SIZE = 200
+MAX_QUERY = 10
 
-def check_file(path: pathlib.Path):
-    """Chcke a file."""
+
+def print_result(
+    path: pathlib.Path, events: int, sum_weights: float | None
+) -> None:
+    """Print the result of a file."""
+    print(f"{'/'.join(path.parts[-2:])} - events {events} - weights {sum_weights}")
+
+
+def book_file(path: pathlib.Path) -> tuple[Any, Any]:
+    """Book event count and sum of weights of a file."""
     df = ROOT.RDataFrame("Events", str(path))
-    events = df.Count()
-    sum_weights = df.Sum("weight")
-    print(
-        f"{'/'.join(path.parts[-2:])} - events {events.GetValue()} - weights {sum_weights.GetValue()}"
-    )
+    return df.Count(), df.Sum("weight")
+
+
+def check_files(paths: list[pathlib.Path]) -> int:
+    """Read all events of the files.
+
+    The results of a batch of files are booked lazily and run concurrently
+    in one RunGraphs call. If a batch fails, its files are run one by one.
+
+    Args:
+        paths (list[Path]): The files
+
+    Returns:
+        int: Number of bad files
+    """
+    bad = 0
+    for start in range(0, len(paths), BATCH_SIZE):
+        batch = paths[start : start + BATCH_SIZE]
+        booked = {p: book_file(p) for p in batch}
+        try:
+            ROOT.RDF.RunGraphs([r for results in booked.values() for r in results])
+        except Exception as e:
+            log.warning("Exception %s, checking files one by one", e)
+            for p in batch:
+                try:
+                    booked[p] = book_file(p)
+                    ROOT.RDF.RunGraphs(list(booked[p]))
+                except Exception as e:
+                    log.error("Bad file %s: %s", p, e)
+                    booked.pop(p)
+                    bad += 1
+        for p, (events, sum_weights) in booked.items():
+            print_result(p, events.GetValue(), sum_weights.GetValue())
+    return bad
+
+
+async def check_checksums(paths: list[pathlib.Path], threads: int) -> int:
+    """Compare the adler32 checksums of the files with EOS.
+
+    The local checksums are computed in a thread pool without decompressing
+    the events. Matching checksums are stored in the manifest.
+
+    Args:
+        paths (list[Path]): The files
+        threads (int): Number of threads
+
+    Returns:
+        int: Number of bad files
+    """
+    remote = transport.XRootDTransport(transport.EOS_URL, transport.EOS_PATH)
+    loop = asyncio.get_running_loop()
+    sem_query = asyncio.Semaphore(MAX_QUERY)
+
+    async def check(name: pathlib.PurePath, staged: manifest.Manifest) -> bool:
+        async with sem_query:
+            try:
+                chksums = await asyncio.gather(
+                    remote.checksum(name),
+                    loop.run_in_executor(pool, manifest.adler32, PATH / name),
+                )
+            except Exception as e:
+                log.error("Exception %s checking %s", e, name)
+                return False
+        if chksums[0] != chksums[1]:
+            log.error("Checksum mismatch %s", name)
+            return False
+        staged.store(name, chksums[1])
+        return True
+
+    with (
+        manifest.Manifest(PATH) as staged,
+        concurrent.futures.ThreadPoolExecutor(threads) as pool,
+    ):
+        results = await asyncio.gather(
+            *(check(p.relative_to(PATH), staged) for p in paths)
+        )
+    return results.count(False)
 
 
 @click.command
-@click.argument("input", type=click.Path(exists=True, path_type=pathlib.Path))
+@click.argument(
+    "inputs", nargs=-1, type=click.Path(exists=True, path_type=pathlib.Path)
+)
+@click.option(
+    "--scan/--no-scan",
+    default=False,
+    help="Print entries and sum of weights from the file catalog.",
+)
 @click.option("--verify/--no-verify", default=False, help="Try reading the files.")
+@click.option(
+    "--checksum-only/--no-checksum-only",
+    default=False,
+    help="Compare only the checksums with EOS, without reading the events.",
+)
 @click.option("--root-threads", default=4, help="Number of root threads.")
-def main(input: pathlib.Path, verify: bool, root_threads: int) -> None:
+def main(
+    inputs: list[pathlib.Path],
+    scan: bool,
+    verify: bool,
+    checksum_only: bool,
+    root_threads: int,
+) -> None:
     """Verify datasets."""
     log.setLevel(logging.DEBUG)
     ROOT.gROOT.SetBatch()
     ROOT.EnableImplicitMT(root_threads)
+    paths: list[pathlib.Path] = []
+    for input in inputs:
+        paths += check_input(input)
+
+    if scan:
+        infos = catalog.Catalog().info([str(p) for p in paths])
+        for p in paths:
+            print_result(p, infos[str(p)].entries, infos[str(p)].sum_weights)
+
+    if checksum_only:
+        log.info("Checking checksums of %d files", len(paths))
+        bad = asyncio.run(check_checksums(paths, root_threads))
+    elif verify:
+        log.info("Reading %d files", len(paths))
+        bad = check_files(paths)
+    else:
+        return
+    log.info("Bad files: %d/%d", bad, len(paths))
+
+
+def check_input(input: pathlib.Path) -> list[pathlib.Path]:
+    """Check the files of a sample csv file.
+
+    Args:
+        input (Path): Sample csv file
+
+    Returns:
+        list[Path]: The files found
+    """
     skim, period = input.stem.split(" - ")
     log.info("Skim %s, Period %s", skim, period)
     tot1 = 0
     tot2 = 0
+    found: list[pathlib.Path] = []
     with open(input, "r") as csv_input:
         for e in csv.DictReader(csv_input):
             prefix = e["Path"]
@@ -58,8 +195,7 @@ def main(input: pathlib.Path, verify: bool, root_threads: int) -> None:
                     path = sample_dir / f"{name}.root"
                     try:
                         files.remove(path)
-                        if verify:
-                            check_file(path)
+                        found.append(path)
                         icnt += 1
                     except KeyError:
                         log.debug("Missing %s", path)
@@ -68,8 +204,7 @@ def main(input: pathlib.Path, verify: bool, root_threads: int) -> None:
                         path = sample_dir / f"{name}_{i}.root"
                         try:
                             files.remove(path)
-                            if verify:
-                                check_file(path)
+                            found.append(path)
                             icnt += 1
                         except KeyError:
                             log.debug("Missing %s", path)
@@ -90,6 +225,7 @@ def main(input: pathlib.Path, verify: bool, root_threads: int) -> None:
             else:
                 log.info("%-50s: %3d/%3d", f"{prefix}/{name}", icnt, nr)
     log.info("Total: %3d/%3d", tot1, tot2)
+    return found
 
 
 if __name__ == "__main__":
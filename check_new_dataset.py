@@ -2,28 +2,27 @@
 
 import pathlib
 import sys
+from stopscompressed import catalog
+from stopscompressed import transport
 
 import ROOT
 
-PATH = pathlib.Path(
-    "/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples/compstops_UL16v9_nano_v9/DoubleLep/DYJetsToLL_M50_LO"
-)
+PATH = transport.SCRATCH_PATH / "compstops_UL16v9_nano_v9/DoubleLep/DYJetsToLL_M50_LO"
 
 
 def check(path: pathlib.Path) -> None:
 
     # ROOT.EnableImplicitMT()
-    chain = ROOT.TChain("Events")
-    for p in path.iterdir():
-        chain.Add(str(p))
+    files = [str(p) for p in path.iterdir()]
+    events, sum_weights = catalog.Catalog().totals(files)
+    print(f"Chain {events}")
 
-    print(f"Chain {chain.GetEntries()}")
+    chain = ROOT.TChain("Events")
+    for f in files:
+        chain.Add(f)
 
     df = ROOT.RDataFrame(chain)
 
-    # events = df.Count()
-    # sum_weights = df.Sum("weight")
-
     weights = [
         "weight",
         "reweightPU",
@@ -38,8 +37,8 @@ def check(path: pathlib.Path) -> None:
 
     df = df.Define("the_weight", "*".join(weights).format(27.5))
     sum_new_weights = df.Sum("the_weight")
-    print(f"Events {events.GetValue()}")
-    print(f"Sum weights {sum_weights.GetValue()}")
+    print(f"Events {events}")
+    print(f"Sum weights {sum_weights}")
     print(f"Sum new weights {sum_new_weights.GetValue()}")
 
 
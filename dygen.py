@@ -1,13 +1,27 @@
 #!/usr/bin/env python
-# Find DY gen info
+"""Drell Yan generator info."""
 import logging
 import os
 import pathlib
+from mrtools import analysis
+from mrtools import cache
+from mrtools import config
+from mrtools import model
 from mrtools import utils
+from stopscompressed import base
+from stopscompressed import checkpoint
+from stopscompressed import expressions
+from stopscompressed import headers
+from stopscompressed import stitching
 from typing import Any
 
 import click
 import ROOT
+import dask.distributed as dd
+
+DataFrame = Any
+
+ROOT.PyConfig.IgnoreCommandLineOptions = True
 
 logging.basicConfig(
     format="%(asctime)s - %(levelname)s -  %(name)s - %(message)s",
@@ -15,17 +29,31 @@ logging.basicConfig(
     level=logging.WARNING,
 )
 log = logging.getLogger("mrtools")
+cfg = config.get()
 
-ROOT.PyConfig.IgnoreCommandLineOptions = True
+BASE_DIR = pathlib.Path(__file__).absolute().parent
+HEADERS = [BASE_DIR / "dygen_inc.h"]
+DEFAULT_OUTPUT = pathlib.Path(
+    "/scratch-cbe/users", os.environ["USER"], "StopsCompressed/plots"
+)
 
-PATH = pathlib.Path("/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples")
+PERIODS = [
+    "Run2016preVFP",
+    "Run2016postVFP",
+    "Run2017",
+    "Run2018",
+]
 
-TAG = {
-    "Run2016preVFP": "compstops_UL16APVv9_nano_v8",
-    "Run2016postVFP": "compstops_UL16v9_nano_v8",
-    "Run2017": "compstops_UL17v9_nano_v8",
-    "Run2018": "compstops_UL17v9_nano_v8",
-}
+DEFAULT_NAME = "dygen"
+
+DEFAULT_SAMPLE_FILE = BASE_DIR / "samples/DoubleLep_nanoNtuple_v8.yaml"
+DEFAULT_HISTOS_FILE = BASE_DIR / "dygen_histos.yaml"
+
+# generator level study, all events
+PRESELECTION = "true"
+
+# Sample group containing the Drell Yan samples
+DATASETS = ["DYJets"]
 
 HT_BINS = [
     "70to100",
@@ -38,33 +66,149 @@ HT_BINS = [
     "2500toInf",
 ]
 
+INCLUSIVE_SAMPLES = ["DYJetsToLL_M50_LO", "DYJetsToLL_M50_LO_ext"]
+LOW_MASS_SAMPLE = "DYJetsToLL_M10to50_LO"
+HT_SAMPLES = [f"DYJetsToLL_M50_HT{ht}" for ht in HT_BINS]
+
+HISTO_NAMES = ["pt", "mass", "nJet", "HT", "pt1", "mass1", "found"]
+
+
+class DYGenAnalysis(base.BaseAnalysis):
+    """Drell Yan generator info."""
+
+    cpp_headers = HEADERS
+
+    def __init__(
+        self,
+        histo_file: pathlib.Path,
+        output: pathlib.Path,
+        small: bool,
+        checkpoint_dir: pathlib.Path | None = None,
+        resume: bool = False,
+        stitch_weights: dict[str, stitching.Weight] | None = None,
+    ) -> None:
+        """Init Drell Yan generator analysis.
+
+        Args:
+            histo_file (Path): Yaml file with histogram definitions
+            output (Path): Output directory
+            small (bool): reduce sample size for debugging
+            checkpoint_dir (Path | None): Directory for histograms per sample
+            resume (bool): take completed samples from the checkpoints
+            stitch_weights (dict[str, Weight] | None): Stitching weights by
+                sample
+        """
+        super().__init__(
+            histo_file,
+            output,
+            small,
+            PRESELECTION,
+            [],
+            {},
+            checkpoint_dir=checkpoint_dir,
+            resume=resume,
+            stitching=stitch_weights,
+        )
 
-def make_post_chains(period: str, ht_bins: bool) -> dict[str, Any]:
-    """Create ROOT Chains for the various datasets."""
-    if ht_bins:
-        datasets = [f"DYJetsToLL_M50_HT{ht}" for ht in HT_BINS]
+    def select(self, sample: model.Sample, df: DataFrame) -> dict[str, DataFrame]:
+        """Define dataframes.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            dataframe (RDataFrame): Dataframe of the preselected events
+
+        Returns:
+            dict[str, DataFrame]: Dict of dataframes
+        """
+        for column, expression in [
+            (
+                "genDY",
+                "find_gen_dy(GenPart_pt, GenPart_eta, GenPart_phi, GenPart_mass, GenPart_pdgId, GenPart_statusFlags)",  # noqa: B950
+            ),
+            ("genDY_pt", "genDY.accepted && genDY.central ? genDY.pt : -1.f"),
+            ("genDY_mass", "genDY.accepted ? genDY.mass : -1.f"),
+        ]:
+            df = expressions.define(df, column, expression)
+        return {"gen": df, "gen_ht": expressions.cut(df, "HT>100")}
+
+
+class MyWorkerPlugin(analysis.WorkerPlugin):
+    """Worker plugin for initialisation of workers."""
+
+    def setup(self, worker: dd.Worker) -> None:
+        """Setup ROOT on worker process."""
+        super().setup(worker)
+        headers.load("dygen", HEADERS)
+
+
+def read_histos(
+    root_file: Any, sc: cache.SamplesCache, period: str
+) -> dict[str, Any]:
+    """Read the histograms of the Drell Yan samples.
+
+    Args:
+        root_file (TFile): Output of the analysis
+        sc (SamplesCache): Samples
+        period (str): Datataking period
+
+    Returns:
+        dict[str, TH1]: Histograms named `<dataset>_<histogram>`
+    """
+    histos: dict[str, Any] = {}
+    for dataset in INCLUSIVE_SAMPLES + [LOW_MASS_SAMPLE] + HT_SAMPLES:
+        sample = next(sc.find(period, dataset), None)
+        if sample is None:
+            log.debug("No sample %s for %s", dataset, period)
+            continue
+        subdir = checkpoint.sample_dir(sample)
+        for name in HISTO_NAMES:
+            h = root_file.Get(f"{subdir}/{name}")
+            if not h:
+                log.error("Histogram %s/%s not found.", subdir, name)
+                continue
+            h.SetDirectory(ROOT.nullptr)
+            h.SetName(f"{dataset}_{name}")
+            histos[f"{dataset}_{name}"] = h
+
+        found = histos.get(f"{dataset}_found")
+        if found and (nr_missing := found.GetBinContent(1)):
+            log.warning("%s: not all leptons found in %d events", dataset, nr_missing)
+    return histos
+
+
+def combine(
+    histos: dict[str, Any], ht_bins: bool, stitched: bool = False
+) -> tuple[dict[str, Any], str]:
+    """Add the Drell Yan samples.
+
+    Args:
+        histos (dict[str, TH1]): Histograms of the datasets
+        ht_bins (bool): use the HT binned samples
+        stitched (bool): the histograms are filled with stitching weights,
+            all samples are added
+
+    Returns:
+        tuple[dict[str, TH1], str]: Histograms including the sums and title
+    """
+    histos = dict(histos)
+    if stitched:
+        datasets = INCLUSIVE_SAMPLES + HT_SAMPLES
+        title = "Z^{*} / #gamma #rightarrow Jets + l^{+}l^{-} (Stitched)"
+    elif ht_bins:
+        datasets = HT_SAMPLES[1:]
+        title = "Z^{*} / #gamma #rightarrow Jets + l^{+}l^{-} (HT Bins)"
     else:
-        datasets = ["DYJetsToLL_M50_LO", "DYJetsToLL_M50_LO_ext"]
-
-    datasets.append("DYJetsToLL_M10to50_LO")
+        datasets = INCLUSIVE_SAMPLES[:1]
+        title = "Z^{*} / #gamma #rightarrow Jets + l^{+}l^{-} (No HT Bins)"
 
-    chains: dict[str, Any] = {}
-    for dataset in os.listdir(PATH / TAG[period] / "DoubleLep"):
-        # if (
-        #     dataset.startswith("DYJetsToLL_M50_HT")
-        #     or dataset == "DYJetsToLL_M10to50_LO"
-        # ):
-        if dataset in datasets:
-            chains[dataset] = ROOT.TChain("Events")
-            cnt = 0
-            for name in os.listdir(PATH / TAG[period] / "DoubleLep" / dataset):
-                path = PATH / TAG[period] / "DoubleLep" / dataset / name
-                print(path)
-                chains[dataset].Add(str(path))
-                cnt += 1
-            log.debug("Dataset %s with %d files", dataset, cnt)
+    for name in ["pt", "mass", "pt1", "mass1"]:
+        h = histos[f"{LOW_MASS_SAMPLE}_{name}"].Clone(f"DYJetsToLL_{name}")
+        for dataset in datasets:
+            if f"{dataset}_{name}" in histos:
+                h.Add(histos[f"{dataset}_{name}"])
+        histos[f"DYJetsToLL_{name}"] = h
 
-    return chains
+    return histos, title
 
 
 def draw_header(canvas: Any, sample: str, period: str) -> Any:
@@ -92,136 +236,18 @@ def draw_header(canvas: Any, sample: str, period: str) -> Any:
     return t1, t2, t3
 
 
-@click.command(context_settings=dict(max_content_width=120))
-@click.option(
-    "-p",
-    "--period",
-    default="Run2016preVFP",
-    type=click.Choice(list(TAG.keys()), case_sensitive=False),
-    help="Datataking period",
-    show_default=True,
-)
-@click.option("--ht-bins/--no-ht-bins", default=False)
-@click.option("--small/--no-small", default=False)
-@click.option(
-    "-o",
-    "--output",
-    default="dygen.root",
-    type=click.Path(dir_okay=False, writable=True, path_type=pathlib.Path),
-    help="Output file",
-    show_default=True,
-)
-@utils.click_option_logging(log)
-def main(period: str, small: bool, ht_bins: bool, output: pathlib.Path):
-    """Drell Yan Generator Info."""
-    log.info("Analysis of Drell Yan Generator info")
-    ROOT.gROOT.SetBatch()
-    ROOT.gErrorIgnoreLevel = ROOT.kError
-    if not small:
-        ROOT.EnableImplicitMT()
-    ROOT.gInterpreter.Declare('#include "dygen_inc.h"')
-
-    log.info("Period %s", period)
-    chains = make_post_chains(period, ht_bins)
-
-    df: dict[str, Any] = {}
-    histos: dict[str, Any] = {}
-    events: dict[str, Any] = {}
-    for dataset, chain in chains.items():
-        df[dataset] = ROOT.RDataFrame(chain)
-        if small:
-            df[dataset] = df[dataset].Range(0, 10)
-
-        df[dataset] = df[dataset].Define(
-            "genDY_pt",
-            "GenDY_pt(GenPart_pt, GenPart_eta, GenPart_phi, GenPart_mass, GenPart_pdgId, GenPart_status, GenPart_statusFlags)",
-        )
-
-        df[dataset] = df[dataset].Define(
-            "genDY_mass",
-            "GenDY_mass(GenPart_pt, GenPart_eta, GenPart_phi, GenPart_mass, GenPart_pdgId, GenPart_status, GenPart_statusFlags)",
-        )
-
-        histos[f"{dataset}_pt"] = (
-            df[dataset]
-            .Filter("abs(genDY_mass-91.2)<10. && genDY_pt > 0.")
-            .Histo1D((f"{dataset}_pt", "p_{T}", 100, -2.0, 500.0), "genDY_pt", "weight")
-        )
-        histos[f"{dataset}_mass"] = df[dataset].Histo1D(
-            (f"{dataset}_mass", "Mass", 100, -2.0, 200.0), "genDY_mass", "weight"
-        )
-        histos[f"{dataset}_nJet"] = df[dataset].Histo1D(
-            (f"{dataset}_nJet", "nJet", 21, -0.5, 20.5), "nJet", "weight"
-        )
-        histos[f"{dataset}_HT"] = df[dataset].Histo1D(
-            (f"{dataset}_HT", "HT", 100, 0, 500.0), "HT", "weight"
-        )
-        df[dataset] = df[dataset].Filter("HT>100")
-        histos[f"{dataset}_pt1"] = (
-            df[dataset]
-            .Filter("abs(genDY_mass-91.2)<10. && genDY_pt > 0.")
-            .Histo1D(
-                (f"{dataset}_pt1", "p_{T}", 100, -2.0, 500.0), "genDY_pt", "weight"
-            )
-        )
-        histos[f"{dataset}_mass1"] = df[dataset].Histo1D(
-            (f"{dataset}_mass1", "Mass", 100, -2.0, 200.0), "genDY_mass", "weight"
-        )
-        events[dataset] = df[dataset].Count()
-
-    ROOT.RDF.RunGraphs(list(histos.values()) + list(events.values()))
-
-    for dataset, evt in events.items():
-        print(f"Number of events for dataset {dataset} is {evt.GetValue()}")
-
-    histos = {key: h.GetValue() for key, h in histos.items()}
-
-    histos["DYJetsToLL_pt"] = histos["DYJetsToLL_M10to50_LO_pt"].Clone("DYJetsToLL_pt")
-    histos["DYJetsToLL_mass"] = histos["DYJetsToLL_M10to50_LO_mass"].Clone(
-        "DYJetsToLL_mass"
-    )
-    histos["DYJetsToLL_pt1"] = histos["DYJetsToLL_M10to50_LO_pt1"].Clone(
-        "DYJetsToLL_pt1"
-    )
-    histos["DYJetsToLL_mass1"] = histos["DYJetsToLL_M10to50_LO_mass1"].Clone(
-        "DYJetsToLL_mass1"
-    )
-
-    if ht_bins:
-        for ht in HT_BINS[1:]:
-            histos["DYJetsToLL_pt"] = (
-                histos["DYJetsToLL_pt"] + histos[f"DYJetsToLL_M50_HT{ht}_pt"]
-            )
-            histos["DYJetsToLL_mass"] = (
-                histos["DYJetsToLL_mass"] + histos[f"DYJetsToLL_M50_HT{ht}_mass"]
-            )
-            histos["DYJetsToLL_pt1"] = (
-                histos["DYJetsToLL_pt1"] + histos[f"DYJetsToLL_M50_HT{ht}_pt1"]
-            )
-            histos["DYJetsToLL_mass1"] = (
-                histos["DYJetsToLL_mass1"] + histos[f"DYJetsToLL_M50_HT{ht}_mass1"]
-            )
-            sample = "Z^{*} / #gamma #rightarrow Jets + l^{+}l^{-} (HT Bins)"
-    else:
-        histos["DYJetsToLL_pt"] = (
-            histos["DYJetsToLL_pt"] + histos["DYJetsToLL_M50_LO_pt"]
-        )
-        histos["DYJetsToLL_mass"] = (
-            histos["DYJetsToLL_mass"] + histos["DYJetsToLL_M50_LO_mass"]
-        )
-        histos["DYJetsToLL_pt1"] = (
-            histos["DYJetsToLL_pt1"] + histos["DYJetsToLL_M50_LO_pt1"]
-        )
-        histos["DYJetsToLL_mass1"] = (
-            histos["DYJetsToLL_mass1"] + histos["DYJetsToLL_M50_LO_mass1"]
-        )
-        sample = "Z^{*} / #gamma #rightarrow Jets + l^{+}l^{-} (No HT Bins)"
-
-    out = ROOT.TFile(str(output), "RECREATE")
-    for h in histos.values():
-        h.Write()
-    out.Close()
+def draw(
+    histos: dict[str, Any], ht_bins: bool, sample: str, period: str, output: pathlib.Path
+) -> None:
+    """Draw the plots.
 
+    Args:
+        histos (dict[str, TH1]): Histograms including the sums
+        ht_bins (bool): use the HT binned samples
+        sample (str): Title of the sample
+        period (str): Datataking period
+        output (Path): Output ROOT file, the plots are saved next to it
+    """
     c1 = ROOT.TCanvas("c1", "", 800, 600)
 
     c1.Divide(2, 2, 0.01, 0.01)
@@ -296,5 +322,133 @@ def main(period: str, small: bool, ht_bins: bool, output: pathlib.Path):
     c2.SaveAs(str(output.with_name(f"{output.stem}_ht.png")))
 
 
+@click.command(context_settings=dict(max_content_width=120))
+@click.option(
+    "-s",
+    "--sample-file",
+    multiple=True,
+    default=[DEFAULT_SAMPLE_FILE],
+    type=click.Path(
+        exists=True, file_okay=True, dir_okay=False, path_type=pathlib.Path
+    ),
+    help="Sample file",
+    show_default=True,
+)
+@click.option(
+    "-p",
+    "--period",
+    default=PERIODS,
+    type=click.Choice(PERIODS, case_sensitive=False),
+    multiple=True,
+    help="Datataking period [default: all]",
+)
+@click.option(
+    "-n",
+    "--name",
+    metavar="NAME",
+    default=DEFAULT_NAME,
+    help="Name for output files",
+    show_default=True,
+)
+@click.option(
+    "-o",
+    "--output",
+    default=DEFAULT_OUTPUT,
+    type=click.Path(file_okay=False, writable=True, path_type=pathlib.Path),
+    help="Output directory",
+    show_default=True,
+)
+@click.option(
+    "-f",
+    "--histos-file",
+    type=click.Path(exists=True, resolve_path=True),
+    default=DEFAULT_HISTOS_FILE,
+    help="Histogram definitions",
+    show_default=True,
+)
+@click.option("--small/--no-small", default=False, help="Reduce sample size.")
+@click.option("--histos/--no-histos", default=True, help="Fill histograms.")
+@click.option("--plots/--no-plots", default=True, help="Make plots from histograms.")
+@click.option(
+    "--stitch/--no-stitch",
+    default=False,
+    help="Stitch the inclusive and HT binned samples.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Skip samples completed in a previous run.",
+)
+@config.click_options()
+@cache.click_options()
+@analysis.click_options()
+@utils.click_option_logging(log)
+def main(
+    sample_file: list[pathlib.Path],
+    period: list[str],
+    name: str,
+    output: pathlib.Path,
+    histos_file: pathlib.Path,
+    small: bool,
+    histos: bool,
+    plots: bool,
+    stitch: bool,
+    resume: bool,
+):
+    """Drell Yan Generator Info."""
+    cfg.load()
+
+    output.mkdir(exist_ok=True)
+
+    with cache.SamplesCache() as sc:
+        for sf in sample_file:
+            sc.load(sf)
+
+        if histos:
+            proc = analysis.Processor(MyWorkerPlugin())
+            for p in period:
+                log.info("Filling histos for %s", p)
+                if stitch:
+                    stitch_counts = stitching.StitchCounts(small)
+                    proc.run(sc, p, stitch_counts, DATASETS)
+                    stitch_weights = stitching.weights(stitch_counts.counts)
+                else:
+                    stitch_weights = {}
+                dygen_analysis = DYGenAnalysis(
+                    histos_file,
+                    output / f"{name}_{p}",
+                    small,
+                    output / "checkpoints" / f"{name}_{p}",
+                    resume,
+                    stitch_weights,
+                )
+                proc.run(sc, p, dygen_analysis, DATASETS)
+
+            del proc  # shutdown dask cluster
+
+        if plots:
+            ROOT.gROOT.SetBatch()
+            for p in period:
+                log.info("Drawing plots for %s", p)
+                inp_root = ROOT.TFile(str(output / f"{name}_{p}.root"), "READ")
+                dataset_histos = read_histos(inp_root, sc, p)
+                inp_root.Close()
+
+                if stitch:
+                    variants = {"stitched": True}
+                else:
+                    variants = {"no_ht_bins": False, "ht_bins": True}
+                for suffix, ht_bins in variants.items():
+                    out_root_path = output / f"{name}_{p}_{suffix}.root"
+                    all_histos, sample = combine(dataset_histos, ht_bins, stitch)
+
+                    out = ROOT.TFile(str(out_root_path), "RECREATE")
+                    for h in all_histos.values():
+                        h.Write()
+                    out.Close()
+
+                    draw(all_histos, ht_bins, sample, p, out_root_path)
+
+
 if __name__ == "__main__":
     main()
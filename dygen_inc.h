@@ -1,7 +1,10 @@
-#ifndef DYPT_INC_H_
-#define DYPT_INC_H_
+#ifndef DYGEN_INC_H_
+#define DYGEN_INC_H_
+#include <Math/Vector4D.h>
+#include <ROOT/RVec.hxx>
+
+#include <algorithm>
 #include <cmath>
-#include <set>
 
 #include <string>
 #include <sstream>
@@ -22,81 +25,61 @@ inline std::string int_to_hex(T val, size_t width=sizeof(T)*2)
     return ss.str();
 }
 
-float GenDY_pt(
-    const ROOT::RVecF & pt,
-    const ROOT::RVecF & eta,
-    const ROOT::RVecF & phi,
-    const ROOT::RVecF & mass,
-    const ROOT::RVecI & pdgId, 
-    const ROOT::RVecI & status, 
-    const ROOT::RVecI & statusFlags)
-{
-    std::set<int> leptons { 11, 13, 15 };
-
-    int l1 = -1;
-    int l2 = -1;
-    for (size_t i = 0; i<pt.size(); i++ )
-    {
-        if ((statusFlags[i] & 0x1181) == 0x1181 ) {
-            if (l1 == -1 && leptons.find(abs(pdgId[i])) != leptons.end())
-            {
-                l1 = i;
-            } else if (pdgId[i] == - pdgId[l1]) {
-                l2 = i;
-            }           
-        }         
-    }
-    float dy_pt = -1.;
-    if ( l2 > 0) {
-        if (min(pt[l1], pt[l2]) > 15. && max(pt[l1], pt[l2]) > 40 && abs(eta[l1])<1.5 && abs(eta[l2])<1.5) {
-            auto v1 = ROOT::Math::PtEtaPhiMVector(pt[l1], eta[l1], phi[l1], mass[l1]);
-            auto v2 = ROOT::Math::PtEtaPhiMVector(pt[l2], eta[l2], phi[l2], mass[l2]);
-            dy_pt = (v1+v2).Pt();
-        }
-    } else {
-        std::cout << "Not all leptons found" << std::endl;
-    }
-    return dy_pt;
-}
+// Generator level Drell-Yan lepton pair
+// idx1/idx2 are -1 if no pair was found, the kinematics are then zero.
+struct GenDY {
+    float pt = 0.;
+    float mass = 0.;
+    float eta = 0.;
+    float rapidity = 0.;
+    int idx1 = -1;
+    int idx2 = -1;
+    // both leptons pass the pt thresholds
+    bool accepted = false;
+    // both leptons are central
+    bool central = false;
+};
 
-float GenDY_mass(
+// Find the lepton pair from the hard process in one pass over GenPart
+// Usage: genDY = find_gen_dy(GenPart_pt, GenPart_eta, GenPart_phi,
+//                            GenPart_mass, GenPart_pdgId, GenPart_statusFlags)
+inline GenDY find_gen_dy(
     const ROOT::RVecF & pt,
     const ROOT::RVecF & eta,
     const ROOT::RVecF & phi,
     const ROOT::RVecF & mass,
-    const ROOT::RVecI & pdgId, 
-    const ROOT::RVecI & status, 
+    const ROOT::RVecI & pdgId,
     const ROOT::RVecI & statusFlags)
 {
-    std::set<int> leptons { 11, 13, 15 };
+    // isPrompt, fromHardProcess, isFirstCopy
+    constexpr int kFlags = 0x1181;
 
-    // int event_type = 0;
-    // int z =  -1;
-    int l1 = -1;
-    int l2 = -1;
-    for (size_t i = 0; i<pt.size(); i++ )
-    {
-        if ((statusFlags[i] & 0x1181) == 0x1181 ) {
-            if (l1 == -1 && leptons.find(abs(pdgId[i])) != leptons.end())
-            {
-                l1 = i;
-            } else if (pdgId[i] == - pdgId[l1]) {
-                l2 = i;
-            }           
-        } 
+    GenDY dy;
+    for (int i = 0; i < static_cast<int>(pt.size()); i++) {
+        if ((statusFlags[i] & kFlags) != kFlags) continue;
+        if (dy.idx1 == -1) {
+            const int id = std::abs(pdgId[i]);
+            if (id == 11 || id == 13 || id == 15) dy.idx1 = i;
+        } else if (pdgId[i] == -pdgId[dy.idx1]) {
+            dy.idx2 = i;
+        }
     }
-//    std::cout << "Found" << z << " " << l1 << " " << l2 << std::endl;
-    float m = -1.;
-    if ( l2 > 0 ) {
-        if (min(pt[l1], pt[l2]) > 15. && max(pt[l1], pt[l2]) > 40) {
-            auto v1 = ROOT::Math::PtEtaPhiMVector(pt[l1], eta[l1], phi[l1], mass[l1]);
-            auto v2 = ROOT::Math::PtEtaPhiMVector(pt[l2], eta[l2], phi[l2], mass[l2]);
-            m = (v1+v2).M();
-        }        
-    } else {
-        std::cout << "not all leptons found" << std::endl;
+    if (dy.idx2 == -1) {
+        dy.idx1 = -1;
+        return dy;
     }
-    return m;
+
+    const int l1 = dy.idx1;
+    const int l2 = dy.idx2;
+    auto v = ROOT::Math::PtEtaPhiMVector(pt[l1], eta[l1], phi[l1], mass[l1])
+           + ROOT::Math::PtEtaPhiMVector(pt[l2], eta[l2], phi[l2], mass[l2]);
+    dy.pt = v.Pt();
+    dy.mass = v.M();
+    dy.eta = v.Eta();
+    dy.rapidity = v.Rapidity();
+    dy.accepted = std::min(pt[l1], pt[l2]) > 15. && std::max(pt[l1], pt[l2]) > 40.;
+    dy.central = std::abs(eta[l1]) < 1.5 && std::abs(eta[l2]) < 1.5;
+    return dy;
 }
 
-#endif
\ No newline at end of file
+#endif
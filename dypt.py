@@ -9,6 +9,12 @@ from mrtools import config
 from mrtools import model
 from mrtools import plotter
 from mrtools import utils
+from stopscompressed import base
+from stopscompressed import expressions
+from stopscompressed import headers
+from stopscompressed import leptonsf
+from stopscompressed import triggers
+from stopscompressed import variations
 from typing import Any
 
 import click
@@ -33,6 +39,11 @@ CORRECTIONLIB_DIR = (
     pathlib.Path(os.environ["CONDA_PREFIX"])
     / "lib/python3.11/site-packages/correctionlib"
 )
+HEADERS = [
+    BASE_DIR / "dypt_inc.h",
+    BASE_DIR / "triggers_inc.h",
+    BASE_DIR / "leptonsf_inc.h",
+]
 DEFAULT_OUTPUT = pathlib.Path(
     "/scratch-cbe/users", os.environ["USER"], "StopsCompressed/plots"
 )
@@ -49,57 +60,48 @@ DEFAULT_NAME = "dypt"
 DEFAULT_SAMPLE_FILE = BASE_DIR / "samples/DoubleLep_nanoNtuple_v8.yaml"
 DEFAULT_HISTOS_FILE = BASE_DIR / "dypt_histos.yaml"
 
+PRESELECTION = "HT>100"
 
-def filter_flags(df: Any, flags: list[str]) -> Any:
-    """DF Filter from flags.
-
-    Check if flgas are present in the file before applying the filter.
-    Not so clear, why this is necessary.
-
-    Args:
-        df (RDataFrame): ROOT dataframe
-        flags (list[str]): List of flags
-    """
-    cols = df.GetColumnNames()
-    if bad := ", ".join(t for t in flags if t not in cols):
-        log.warning("Missing flags: %s", bad)
-
-    if good := " || ".join(t for t in flags if t in cols):
-        log.debug("Flag Selection: %s", good)
-        return df.Filter(good)
-    else:
-        log.error("No valid flags.")
-        return df
+# Lepton selections and scale factors filled in the same event loop
+VARIATIONS = {
+    "tight_sf": {"tight": True, "lepton_sf": True},
+    "tight_nosf": {"tight": True, "lepton_sf": False},
+    "medium_sf": {"tight": False, "lepton_sf": True},
+    "medium_nosf": {"tight": False, "lepton_sf": False},
+}
 
+# Working points with scale factors
+MUON_IDS = ["TightID", "MediumID"]
+ELEC_WORKING_POINTS = ["Medium", "Loose"]
 
-def init_muon_sf(period: str, file: str, muon_id: str):
-    """Init muon scale factor."""
-    try:
-        ROOT.muon_sf
-    except AttributeError:
-        ROOT.gROOT.ProcessLine("std::unique_ptr<MuonSF> muon_sf;")
 
-    ROOT.gROOT.ProcessLine(
-        f'muon_sf = std::make_unique<MuonSF>("{period}", "{file}", "{muon_id}");'
+def muon_sf(
+    period: str, file: str, muon_id: str, edges: tuple[list[float], list[float]]
+) -> Any:
+    """Muon scale factor object from the registry in leptonsf_inc.h."""
+    return ROOT.get_muon_sf(
+        period, file, muon_id, leptonsf.vector(edges[0]), leptonsf.vector(edges[1])
     )
 
 
-def init_elec_sf(period: str, file: str, working_point: str):
-    """Init electroin scale factor."""
-    try:
-        ROOT.elec_sf
-    except AttributeError:
-        ROOT.gROOT.ProcessLine("std::unique_ptr<ElectronSF> elec_sf;")
-
-    ROOT.gROOT.ProcessLine(
-        "elec_sf = "
-        f'std::make_unique<ElectronSF>("{period}", "{file}", "{working_point}");'
+def elec_sf(
+    period: str, file: str, working_point: str, edges: tuple[list[float], list[float]]
+) -> Any:
+    """Electron scale factor object from the registry in leptonsf_inc.h."""
+    return ROOT.get_electron_sf(
+        period,
+        file,
+        working_point,
+        leptonsf.vector(edges[0]),
+        leptonsf.vector(edges[1]),
     )
 
 
-class DYPTAnalysis(analysis.HistoAnalysis):
+class DYPTAnalysis(base.BaseAnalysis):
     """Dell Yan p_T analysis."""
 
+    cpp_headers = HEADERS
+
     tight: bool
     lepton_sf: bool
     period: str
@@ -109,6 +111,8 @@ class DYPTAnalysis(analysis.HistoAnalysis):
     elec_trigger: list[str]
     muon_sf_path: str
     elec_sf_path: str
+    muon_sf_edges: dict[str, tuple[list[float], list[float]]]
+    elec_sf_edges: dict[str, tuple[list[float], list[float]]]
 
     def __init__(
         self,
@@ -120,6 +124,14 @@ class DYPTAnalysis(analysis.HistoAnalysis):
         period: str,
         muon_attrs: dict[str, Any],
         elec_attrs: dict[str, Any],
+        skim_dir: pathlib.Path | None = None,
+        variations: list[str] | None = None,
+        histo_cache_dir: pathlib.Path | None = None,
+        checkpoint_dir: pathlib.Path | None = None,
+        resume: bool = False,
+        chunk_entries: int = 0,
+        catalog_file: pathlib.Path | None = None,
+        prefetch_depth: int = 0,
     ) -> None:
         """Init w_pt analysis.
 
@@ -132,8 +144,31 @@ class DYPTAnalysis(analysis.HistoAnalysis):
             period: str
             muon_attrs (dict[str, Any]): Attributes of muon sample
             elec_attrs (dict[str, Any]): attributes of electron sample
+            skim_dir (Path | None): Directory for skims of preselected events
+            variations (list[str] | None): Variations filled in addition
+            histo_cache_dir (Path | None): Directory for histograms per file
+            checkpoint_dir (Path | None): Directory for histograms per sample
+            resume (bool): take completed samples from the checkpoints
+            chunk_entries (int): Entries per task, 0 for one task per sample
+            catalog_file (Path | None): File catalog with the entries per file
+            prefetch_depth (int): Files copied ahead to scratch, 0 to disable
         """
-        super().__init__(histo_file, output, small)
+        super().__init__(
+            histo_file,
+            output,
+            small,
+            PRESELECTION,
+            muon_attrs["trigger"] + elec_attrs["trigger"],
+            {"tight": tight, "lepton_sf": lepton_sf},
+            skim_dir,
+            {v: VARIATIONS[v] for v in variations or []},
+            histo_cache_dir,
+            checkpoint_dir,
+            resume,
+            chunk_entries,
+            catalog_file,
+            prefetch_depth=prefetch_depth,
+        )
         self.tight = tight
         self.lepton_sf = lepton_sf
         self.period = period
@@ -157,105 +192,110 @@ class DYPTAnalysis(analysis.HistoAnalysis):
         log.debug("Electron inv lumi: %.2f", self.elec_int_lumi)
         log.debug("Electron sf path: %s", self.elec_sf_path)
 
-    def define(self, sample: model.Sample, df: DataFrame) -> dict[str, DataFrame]:
+        self.muon_sf_edges = {
+            muon_id: leptonsf.sf_edges(
+                self.muon_sf_path,
+                f"NUM_{muon_id}_DEN_genTracks",
+                [f"{period[3:]}_UL", "sf"],
+            )
+            for muon_id in MUON_IDS
+        }
+        self.elec_sf_edges = {
+            wp: leptonsf.sf_edges(
+                self.elec_sf_path, "UL-Electron-ID-SF", [period[3:], "sf", wp]
+            )
+            for wp in ELEC_WORKING_POINTS
+        }
+
+    def select(
+        self, sample: model.Sample, df: DataFrame, tight: bool, lepton_sf: bool
+    ) -> dict[str, DataFrame]:
         """Define dataframes.
 
         A number of different dataframes can be defined for various histograms.
 
         Args:
             sample (Sample): The sample to be analysed
-            dataframe (RDataFrame): ROOT Dataframe of the sample
+            dataframe (RDataFrame): Dataframe of the preselected events
+            tight (bool): use tight lepton definitions
+            lepton_sf (bool): apply lepton scale factors
 
         Returns:
             dict[str, DataFrame]: Dict of dataframes
         """
-        df = df.Filter("HT>100")
-        if self.tight:
-            df = df.Define(
-                "GoodMuon",
-                "Muon_tightId && abs(Muon_eta) < 1.5 && Muon_pfRelIso03_all < 0.1 && Muon_pt > 15.",
-            ).Define(
-                "GoodElectron",
-                "Electron_cutBased > 2 && abs(Electron_eta) < 1.5 && Electron_pfRelIso03_all < 0.1 && Electron_pt > 15.",  # noqa: B950
-            )
-            init_muon_sf(self.period, self.muon_sf_path, "TightID")
-            init_elec_sf(self.period, self.elec_sf_path, "Medium")
+        if tight:
+            # id column and its minimal value
+            muon_id = "Muon_tightId, 1"
+            elec_id = "Electron_cutBased, 3"
+            muon_wp = "TightID"
+            elec_wp = "Medium"
         else:
-            df = df.Define(
-                "GoodMuon",
-                "Muon_mediumId && abs(Muon_eta) < 1.5 && Muon_pfRelIso03_all < 0.1 && Muon_pt > 15.",
-            ).Define(
-                "GoodElectron",
-                "Electron_cutBased > 1 && abs(Electron_eta) < 1.5 && Electron_pfRelIso03_all < 0.1 && Electron_pt > 15.",  # noqa: B950
-            )
-            init_muon_sf(self.period, self.muon_sf_path, "MediumID")
-            init_elec_sf(self.period, self.elec_sf_path, "Loose")
-
-        df = (
-            df.Define("GoodMuon_pt", "Muon_pt[GoodMuon]")
-            .Define("GoodMuon_phi", "Muon_phi[GoodMuon]")
-            .Define("GoodMuon_eta", "Muon_eta[GoodMuon]")
-            .Define("GoodMuon_charge", "Muon_charge[GoodMuon]")
-            .Define("GoodMuon_mass", "Muon_mass[GoodMuon]")
-            .Define("GoodElectron_pt", "Electron_pt[GoodElectron]")
-            .Define("GoodElectron_phi", "Electron_phi[GoodElectron]")
-            .Define("GoodElectron_eta", "Electron_eta[GoodElectron]")
-            .Define("GoodElectron_charge", "Electron_charge[GoodElectron]")
-            .Define("GoodElectron_mass", "Electron_mass[GoodElectron]")
-        )
+            muon_id = "Muon_mediumId, 1"
+            elec_id = "Electron_cutBased, 2"
+            muon_wp = "MediumID"
+            elec_wp = "Loose"
+
+        # eta, isolation and pt cuts are in dypt_inc.h
+        muon_good = f"{muon_id}, Muon_eta, Muon_pfRelIso03_all, Muon_pt"
+        elec_good = f"{elec_id}, Electron_eta, Electron_pfRelIso03_all, Electron_pt"
+        df = expressions.define(df, "GoodMuon", f"good_leptons({muon_good})")
+        df = expressions.define(df, "GoodElectron", f"good_leptons({elec_good})")
+        # only read by the histograms of the selected events
+        for column, expression in [
+            ("GoodMuon_pt", "Muon_pt[GoodMuon]"),
+            ("GoodMuon_phi", "Muon_phi[GoodMuon]"),
+            ("GoodMuon_eta", "Muon_eta[GoodMuon]"),
+            ("GoodMuon_charge", "Muon_charge[GoodMuon]"),
+            ("GoodMuon_mass", "Muon_mass[GoodMuon]"),
+            ("GoodElectron_pt", "Electron_pt[GoodElectron]"),
+            ("GoodElectron_phi", "Electron_phi[GoodElectron]"),
+            ("GoodElectron_eta", "Electron_eta[GoodElectron]"),
+            ("GoodElectron_charge", "Electron_charge[GoodElectron]"),
+            ("GoodElectron_mass", "Electron_mass[GoodElectron]"),
+        ]:
+            df = expressions.define(df, column, expression)
 
         # Event weights
 
-        df_muon = filter_flags(df, self.muon_trigger)
-        df_elec = filter_flags(df, self.elec_trigger)
-
-        df_muon = (
-            df_muon.Filter("GoodMuon_pt.size() == 2 && Max(GoodMuon_pt) > 40")
-            .Filter("GoodMuon_charge[0] == - GoodMuon_charge[1]")
-            .Define("lx1_idx", "ArgMax(GoodMuon_pt)")
-            .Define("lx1_pt", "GoodMuon_pt[lx1_idx]")
-            .Define("lx1_eta", "GoodMuon_eta[lx1_idx]")
-            .Define("lx2_idx", "ArgMin(GoodMuon_pt)")
-            .Define("lx2_pt", "GoodMuon_pt[lx2_idx]")
-            .Define("lx2_eta", "GoodMuon_eta[lx2_idx]")
-            .Define(
-                "ll_mass",
-                "InvariantMass(GoodMuon_pt,GoodMuon_eta,GoodMuon_phi,GoodMuon_mass)",
-            )
-            .Define("ll_pt", "TransverseMomentum(GoodMuon_pt,GoodMuon_phi)")
-        )
+        df_muon = triggers.filter_flags(df, self.muon_trigger)
+        df_elec = triggers.filter_flags(df, self.elec_trigger)
 
-        df_elec = (
-            df_elec.Filter("GoodElectron_pt.size() == 2 && Max(GoodElectron_pt) > 40")
-            .Filter("GoodElectron_charge[0] == - GoodElectron_charge[1]")
-            .Define("lx1_idx", "ArgMax(GoodElectron_pt)")
-            .Define("lx1_pt", "GoodElectron_pt[lx1_idx]")
-            .Define("lx1_eta", "GoodElectron_eta[lx1_idx]")
-            .Define("lx2_idx", "ArgMin(GoodElectron_pt)")
-            .Define("lx2_pt", "GoodElectron_pt[lx2_idx]")
-            .Define("lx2_eta", "GoodElectron_eta[lx2_idx]")
-            .Define(
-                "ll_mass",
-                "InvariantMass(GoodElectron_pt,GoodElectron_eta,GoodElectron_phi,GoodElectron_mass)",
-            )
-            .Define("ll_pt", "TransverseMomentum(GoodElectron_pt,GoodElectron_phi)")
+        df_muon = self.dilepton(
+            df_muon, f"{muon_good}, Muon_phi, Muon_mass, Muon_charge"
         )
+        df_elec = self.dilepton(
+            df_elec, f"{elec_good}, Electron_phi, Electron_mass, Electron_charge"
+        )
+
         if sample.type == model.SampleType.DATA:
-            muon_weight = "1"
-            elec_weight = "1"
-            df_muon = df_muon.Define("lx1_sf", "1.0").Define("lx2_sf", "1.0")
-            df_elec = df_elec.Define("lx1_sf", "1.0").Define("lx2_sf", "1.0")
+            weight = "1"
+            df_muon = self.no_sf(df_muon)
+            df_elec = self.no_sf(df_elec)
         else:
-            if self.lepton_sf:
-                df_muon = df_muon.Define(
-                    "lx1_sf", "(*muon_sf)(lx1_pt, lx1_eta)"
-                ).Define("lx2_sf", "(*muon_sf)(lx2_pt, lx2_eta)")
-                df_elec = df_elec.Define(
-                    "lx1_sf", "(*elec_sf)(lx1_pt, lx1_eta)"
-                ).Define("lx2_sf", "(*elec_sf)(lx2_pt, lx2_eta)")
+            if lepton_sf:
+                muon = muon_sf(
+                    self.period,
+                    self.muon_sf_path,
+                    muon_wp,
+                    self.muon_sf_edges[muon_wp],
+                )
+                elec = elec_sf(
+                    self.period,
+                    self.elec_sf_path,
+                    elec_wp,
+                    self.elec_sf_edges[elec_wp],
+                )
+                # the objects differ by period, they are bound without jitting
+                for lx in ("lx1", "lx2"):
+                    df_muon = leptonsf.define_sf(
+                        df_muon, f"{lx}_sf", muon, f"{lx}_pt", f"{lx}_eta"
+                    )
+                    df_elec = leptonsf.define_sf(
+                        df_elec, f"{lx}_sf", elec, f"{lx}_pt", f"{lx}_eta"
+                    )
             else:
-                df_muon = df_muon.Define("lx1_sf", "1.0").Define("lx2_sf", "1.0")
-                df_elec = df_elec.Define("lx1_sf", "1.0").Define("lx2_sf", "1.0")
+                df_muon = self.no_sf(df_muon)
+                df_elec = self.no_sf(df_elec)
 
             weights = [
                 "weight",
@@ -264,7 +304,7 @@ class DYPTAnalysis(analysis.HistoAnalysis):
                 "reweightL1Prefire",
                 "lx1_sf",
                 "lx2_sf",
-                "{}",
+                "lumi",
             ]
 
             # if sample.name == "DYJetsToLL_M50_LO":
@@ -272,14 +312,48 @@ class DYPTAnalysis(analysis.HistoAnalysis):
             #     weights.append("reweightLeptonSF")
             # else:
             #     log.debug("%s", sample.name)
-            muon_weight = "*".join(weights).format(self.muon_int_lumi)
-            elec_weight = "*".join(weights).format(self.elec_int_lumi)
-        log.debug("Muon weight %s", muon_weight)
-        log.debug("Electron weight %s", elec_weight)
-        df_muon = df_muon.Define("the_weight", muon_weight)
-        df_elec = df_elec.Define("the_weight", elec_weight)
+            weight = "*".join(weights)
+        log.debug("Weight %s", weight)
+        # the luminosity is a column, so that the periods share the function
+        df_muon = expressions.constant(df_muon, "lumi", self.muon_int_lumi)
+        df_elec = expressions.constant(df_elec, "lumi", self.elec_int_lumi)
+        df_muon = expressions.define(df_muon, "the_weight", weight)
+        df_elec = expressions.define(df_elec, "the_weight", weight)
         return {"muon": df_muon, "elec": df_elec}
 
+    def dilepton(self, df: DataFrame, args: str) -> DataFrame:
+        """Select two opposite charged leptons and define the pair.
+
+        The pair is selected by dilepton in dypt_inc.h, the columns only read
+        its members.
+
+        Args:
+            df (DataFrame): Dataframe
+            args (str): Lepton columns passed to dilepton
+
+        Returns:
+            DataFrame: Dataframe with the lepton pair
+        """
+        df = expressions.define(df, "ll", f"dilepton({args})")
+        df = expressions.cut(df, "ll.selected")
+        for column, expression in [
+            ("lx1_idx", "ll.idx1"),
+            ("lx1_pt", "ll.pt1"),
+            ("lx1_eta", "ll.eta1"),
+            ("lx2_idx", "ll.idx2"),
+            ("lx2_pt", "ll.pt2"),
+            ("lx2_eta", "ll.eta2"),
+            ("ll_mass", "ll.mass"),
+            ("ll_pt", "ll.pt"),
+        ]:
+            df = expressions.define(df, column, expression)
+        return df
+
+    def no_sf(self, df: DataFrame) -> DataFrame:
+        """Define unit lepton scale factors."""
+        df = expressions.define(df, "lx1_sf", "1.0")
+        return expressions.define(df, "lx2_sf", "1.0")
+
 
 class MyWorkerPlugin(analysis.WorkerPlugin):
     """Worker plugin for initialisation of workers."""
@@ -287,10 +361,12 @@ class MyWorkerPlugin(analysis.WorkerPlugin):
     def setup(self, worker: dd.Worker) -> None:
         """Setup ROOT on worker process."""
         super().setup(worker)
-        ROOT.gROOT.ProcessLine(f'#include "{BASE_DIR}/dypt_inc.h"')
-        ROOT.gROOT.ProcessLine(f".include {CORRECTIONLIB_DIR}/include")
-        ROOT.gSystem.Load(f"{CORRECTIONLIB_DIR}/lib/libcorrectionlib.so")
-        ROOT.gROOT.ProcessLine(f'#include "{BASE_DIR}/leptonsf_inc.h"')
+        headers.load(
+            "dypt",
+            HEADERS,
+            [CORRECTIONLIB_DIR / "include"],
+            [CORRECTIONLIB_DIR / "lib/libcorrectionlib.so"],
+        )
 
 
 @click.command(context_settings=dict(max_content_width=120))
@@ -343,6 +419,44 @@ class MyWorkerPlugin(analysis.WorkerPlugin):
 @click.option("--plots/--no-plots", default=True, help="Make plots from histograms.")
 @click.option("--tight/--no-tight", default=True, help="Tight lepton selection.")
 @click.option("--lepton-sf/--no-lepton-sf", default=True, help="Apply lepton sf")
+@click.option("--skim/--no-skim", default=False, help="Cache preselected events.")
+@click.option(
+    "--histo-cache/--no-histo-cache",
+    default=False,
+    help="Fill histograms only for new files or definitions.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Skip samples completed in a previous run.",
+)
+@click.option(
+    "--chunk-entries",
+    metavar="N",
+    default=0,
+    type=click.IntRange(0, None),
+    help="Split samples into tasks of about N entries [default: per sample]",
+)
+@click.option(
+    "--prefetch",
+    metavar="N",
+    default=0,
+    type=click.IntRange(0, None),
+    help="Copy the next N files of a task to scratch [default: no prefetch]",
+)
+@click.option(
+    "--catalog",
+    "catalog_file",
+    metavar="FILE",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="File catalog for the chunks and trigger groups [default: none]",
+)
+@click.option(
+    "--variations/--no-variations",
+    "fill_variations",
+    default=False,
+    help="Fill also the other lepton selections and scale factors.",
+)
 @config.click_options()
 @cache.click_options()
 @analysis.click_options()
@@ -359,6 +473,13 @@ def main(
     plots: bool,
     tight: bool,
     lepton_sf: bool,
+    skim: bool,
+    histo_cache: bool,
+    resume: bool,
+    chunk_entries: int,
+    prefetch: int,
+    catalog_file: pathlib.Path | None,
+    fill_variations: bool,
 ):
     """W_pt Analysis."""
     cfg.load()
@@ -370,6 +491,17 @@ def main(
             sc.load(sf)
 
         if histos:
+            if fill_variations:
+                nominal = {"tight": tight, "lepton_sf": lepton_sf}
+                var_names = [v for v, o in VARIATIONS.items() if o != nominal]
+                var_histos_file = variations.expand_histos(
+                    histos_file, var_names, output / f"{name}_histos.yaml"
+                )
+                log.info("Filling also variations %s", ", ".join(var_names))
+            else:
+                var_names = []
+                var_histos_file = histos_file
+
             proc = analysis.Processor(MyWorkerPlugin())
             for p in period:
                 log.info("Filling histos for %s", p)
@@ -384,7 +516,7 @@ def main(
                 elec_sample = next(sc.find(p, elec_sample_name))
 
                 dypt_analysis = DYPTAnalysis(
-                    histos_file,
+                    var_histos_file,
                     output / f"{name}_{p}",
                     small,
                     tight,
@@ -392,9 +524,20 @@ def main(
                     p,
                     muon_sample.attrs,
                     elec_sample.attrs,
+                    output / "skim" if skim else None,
+                    var_names,
+                    output / "histo_cache" if histo_cache else None,
+                    output / "checkpoints" / f"{name}_{p}",
+                    resume,
+                    chunk_entries,
+                    catalog_file,
+                    prefetch,
                 )
+                dypt_analysis.fill_catalog(sc.list(p))
 
                 proc.run(sc, p, dypt_analysis, dataset)
+                if var_names:
+                    variations.move_to_subdirs(output / f"{name}_{p}.root", var_names)
 
             del proc  # shutdown dask cluster
 
@@ -1,5 +1,8 @@
 #ifndef DYPT_INC_H_
 #define DYPT_INC_H_
+#include <Math/Vector4D.h>
+#include <ROOT/RVec.hxx>
+
 #include <cmath>
 // Transverse momentum of lepton pair
 // Usage: pt = pt_lep_met(lep_pt, lep_phi)
@@ -9,4 +12,84 @@ float TransverseMomentum(const T& pt, const T& phi) {
   float py = Sum(pt * sin(phi));
   return sqrt(px * px + py * py);
 }
-#endif
\ No newline at end of file
+
+// Lepton selection, the id has to be at least id_min
+constexpr float kMaxEta = 1.5;
+constexpr float kMaxRelIso = 0.1;
+constexpr float kMinPt = 15.;
+constexpr float kMinLeadingPt = 40.;
+
+template <typename ID>
+inline bool is_good_lepton(ID id, int id_min, float eta, float iso, float pt) {
+  return static_cast<int>(id) >= id_min && std::abs(eta) < kMaxEta &&
+         iso < kMaxRelIso && pt > kMinPt;
+}
+
+// Mask of the good leptons
+// Usage: GoodMuon = good_leptons(Muon_tightId, 1, Muon_eta,
+//                                Muon_pfRelIso03_all, Muon_pt)
+template <typename ID>
+ROOT::RVec<bool> good_leptons(const ROOT::RVec<ID>& id, int id_min,
+                              const ROOT::RVecF& eta, const ROOT::RVecF& iso,
+                              const ROOT::RVecF& pt) {
+  ROOT::RVec<bool> good(pt.size());
+  for (size_t i = 0; i < pt.size(); ++i) {
+    good[i] = is_good_lepton(id[i], id_min, eta[i], iso[i], pt[i]);
+  }
+  return good;
+}
+
+// Pair of good leptons
+// idx1/idx2 index the leading/subleading lepton in the good leptons, i.e.
+// GoodMuon_pt[idx1] is the leading pt as before.
+// selected is true for exactly two good leptons of opposite charge with
+// the leading one above kMinLeadingPt, the kinematics are otherwise zero.
+struct Dilepton {
+  int idx1 = -1;
+  int idx2 = -1;
+  float pt1 = 0.;
+  float eta1 = 0.;
+  float pt2 = 0.;
+  float eta2 = 0.;
+  float mass = 0.;
+  float pt = 0.;
+  bool selected = false;
+};
+
+// Select the lepton pair in one pass without masked collections
+// Usage: ll = dilepton(Muon_tightId, 1, Muon_eta, Muon_pfRelIso03_all,
+//                      Muon_pt, Muon_phi, Muon_mass, Muon_charge)
+template <typename ID, typename Q>
+Dilepton dilepton(const ROOT::RVec<ID>& id, int id_min, const ROOT::RVecF& eta,
+                  const ROOT::RVecF& iso, const ROOT::RVecF& pt,
+                  const ROOT::RVecF& phi, const ROOT::RVecF& mass,
+                  const ROOT::RVec<Q>& charge) {
+  Dilepton ll;
+  int good[2];
+  int n = 0;
+  for (int i = 0; i < static_cast<int>(pt.size()); ++i) {
+    if (!is_good_lepton(id[i], id_min, eta[i], iso[i], pt[i])) continue;
+    if (n == 2) return ll;
+    good[n++] = i;
+  }
+  if (n != 2 || charge[good[0]] != -charge[good[1]]) return ll;
+
+  const bool first = pt[good[0]] >= pt[good[1]];
+  const int l1 = first ? good[0] : good[1];
+  const int l2 = first ? good[1] : good[0];
+  if (pt[l1] <= kMinLeadingPt) return ll;
+
+  auto v = ROOT::Math::PtEtaPhiMVector(pt[l1], eta[l1], phi[l1], mass[l1]) +
+           ROOT::Math::PtEtaPhiMVector(pt[l2], eta[l2], phi[l2], mass[l2]);
+  ll.idx1 = first ? 0 : 1;
+  ll.idx2 = first ? 1 : 0;
+  ll.pt1 = pt[l1];
+  ll.eta1 = eta[l1];
+  ll.pt2 = pt[l2];
+  ll.eta2 = eta[l2];
+  ll.mass = v.M();
+  ll.pt = v.Pt();
+  ll.selected = true;
+  return ll;
+}
+#endif
@@ -0,0 +1,69 @@
+#! /usr/bin/env python
+"""Evict least recently used Ntuples from scratch."""
+import logging
+import pathlib
+from mrtools import utils
+from stopscompressed import eviction
+from stopscompressed import manifest
+from stopscompressed import scheduler
+from stopscompressed import transport
+
+import click
+
+logging.basicConfig(
+    format="%(asctime)s - %(levelname)s -  %(name)s - %(message)s",
+    datefmt="%y-%m-%d %H:%M:%S",
+    level=logging.WARNING,
+)
+log = logging.getLogger("evict")
+
+
+@click.command()
+@click.option(
+    "--quota",
+    required=True,
+    type=click.FloatRange(0),
+    help="Maximal size of the scratch tree in GB",
+)
+@click.option(
+    "--pin",
+    multiple=True,
+    type=click.Path(exists=True, dir_okay=False, path_type=pathlib.Path),
+    help="Sample file, whose samples are never evicted",
+)
+@click.option("--by-tag/--by-file", default=False, help="Evict whole tags.")
+@click.option("--dry-run/--no-dry-run", default=False, help="Only list the files.")
+@click.option(
+    "--scratch",
+    default=transport.SCRATCH_PATH,
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    help="Top directory of the staged files",
+)
+@utils.click_option_logging(log)
+def main(
+    quota: float,
+    pin: list[pathlib.Path],
+    by_tag: bool,
+    dry_run: bool,
+    scratch: pathlib.Path,
+) -> None:
+    """Evict least recently used Ntuples from scratch to stay under a quota."""
+    pinned = eviction.pinned_dirs(pin)
+    with manifest.Manifest(scratch) as staged:
+        entries = eviction.scan(scratch, staged)
+        evict = eviction.select(entries, int(quota * 1e9), pinned, by_tag)
+        total = sum(e.size for e in entries)
+        freed = sum(e.size for e in evict)
+        print(
+            f"{len(entries)} files, {scheduler.format_bytes(total)}, "
+            f"evicting {len(evict)} files, {scheduler.format_bytes(freed)}"
+        )
+        if dry_run:
+            for e in evict:
+                print(e.name)
+        else:
+            eviction.evict(scratch, staged, evict)
+
+
+if __name__ == "__main__":
+    main()
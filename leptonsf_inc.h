@@ -1,10 +1,20 @@
 #ifndef LEPTONSF_INC_H
 #define LEPTONSF_INC_H
 
+#include <ROOT/RDataFrame.hxx>
+#include <ROOT/RVec.hxx>
+
 #include <algorithm>
 #include <cmath>
+#include <limits>
+#include <map>
+#include <memory>
+#include <mutex>
 #include <stdexcept>
 #include <string>
+#include <tuple>
+#include <utility>
+#include <vector>
 
 #include "correction.h"
 
@@ -15,11 +25,154 @@
 // /groups/hephy/cms/dietrich.liko/conda/envs/mrt/lib/python3.10/site-packages/correctionlib/include")
 // ROOT.gSystem.Load("/groups/hephy/cms/dietrich.liko/conda/envs/mrt/lib/python3.10/site-packages/correctionlib/lib/libcorrectionlib.so")
 // ROOT.gROOT.processLine('#include "leptonsf_inc.h"')
-class MuonSF {
+
+// Correction sets are parsed only once per process
+inline std::shared_ptr<const correction::CorrectionSet> load_cset(
+    const std::string& cset_file) {
+  static std::mutex mutex;
+  static std::map<std::string, std::shared_ptr<const correction::CorrectionSet>>
+      csets;
+  std::lock_guard<std::mutex> lock(mutex);
+  auto& cset = csets[cset_file];
+  if (!cset) {
+    cset = correction::CorrectionSet::from_file(cset_file);
+  }
+  return cset;
+}
+
+// Scale factor objects are created once per process and shared by all
+// dataframes using the same period, correction set and working point.
+// Further arguments are passed to the constructor on first use.
+// Usage: get_sf<MuonSF>("Run2016preVFP", "muon_Z.json.gz", "TightID",
+//                       eta_edges, pt_edges)
+template <class SF, class... Args>
+const SF& get_sf(const std::string& period, const std::string& cset_file,
+                 const std::string& working_point, Args&&... args) {
+  static std::mutex mutex;
+  static std::map<std::tuple<std::string, std::string, std::string>,
+                  std::unique_ptr<const SF>>
+      registry;
+  std::lock_guard<std::mutex> lock(mutex);
+  auto& sf = registry[{period, cset_file, working_point}];
+  if (!sf) {
+    sf = std::make_unique<const SF>(period, cset_file, working_point,
+                                    std::forward<Args>(args)...);
+  }
+  return *sf;
+}
+
+// Scale factor binned in eta and pt
+//
+// The correction is flattened at construction into contiguous arrays of
+// edges and content, filled by correctionlib at the bin centers and
+// validated at the bin boundaries. Values outside of the table are
+// delegated to correctionlib, which applies the flow behaviour.
+// The edges are read from the json file by stopscompressed.leptonsf.
+class BinnedSF {
+ public:
+  static constexpr double kTolerance = 1e-12;
+
+  virtual ~BinnedSF() = default;
+
+  double operator()(double pt, double eta) const {
+    const double x = abs_eta_ ? std::abs(eta) : eta;
+    const int ix = find_bin(eta_edges_, x);
+    const int iy = find_bin(pt_edges_, pt);
+    if (ix < 0 || iy < 0) {
+      return evaluate(pt, eta);
+    }
+    return content_[ix * (pt_edges_.size() - 1) + iy];
+  }
+
+  ROOT::RVecD operator()(const ROOT::RVecF& pt,
+                         const ROOT::RVecF& eta) const {
+    ROOT::RVecD sf(pt.size());
+    for (size_t i = 0; i < pt.size(); ++i) {
+      sf[i] = (*this)(pt[i], eta[i]);
+    }
+    return sf;
+  }
+
+ protected:
+  // Correctionlib evaluation
+  virtual double evaluate(double pt, double eta) const = 0;
+
+  void compile(std::vector<double> eta_edges, std::vector<double> pt_edges,
+               bool abs_eta) {
+    eta_edges_ = std::move(eta_edges);
+    pt_edges_ = std::move(pt_edges);
+    abs_eta_ = abs_eta;
+    if (eta_edges_.size() < 2 || pt_edges_.size() < 2) {
+      throw std::invalid_argument("Scale factor table without bins");
+    }
+    const size_t nx = eta_edges_.size() - 1;
+    const size_t ny = pt_edges_.size() - 1;
+    content_.resize(nx * ny);
+    for (size_t ix = 0; ix < nx; ++ix) {
+      const double x = center(eta_edges_[ix], eta_edges_[ix + 1]);
+      for (size_t iy = 0; iy < ny; ++iy) {
+        const double y = center(pt_edges_[iy], pt_edges_[iy + 1]);
+        content_[ix * ny + iy] = evaluate(y, x);
+      }
+    }
+    // Lower edge and just below the upper edge of each bin, the upper edge
+    // itself belongs to the next bin
+    for (size_t ix = 0; ix < nx; ++ix) {
+      for (size_t iy = 0; iy < ny; ++iy) {
+        for (const double x : {eta_edges_[ix], below(eta_edges_[ix + 1])}) {
+          for (const double y : {pt_edges_[iy], below(pt_edges_[iy + 1])}) {
+            if (!std::isfinite(x) || !std::isfinite(y)) {
+              continue;
+            }
+            if (std::abs((*this)(y, x) - evaluate(y, x)) > kTolerance) {
+              throw std::runtime_error(
+                  "Scale factor table differs from correctionlib at pt " +
+                  std::to_string(y) + ", eta " + std::to_string(x));
+            }
+          }
+        }
+      }
+    }
+  }
+
+ private:
+  // Largest value below an edge
+  static double below(double edge) {
+    return std::nextafter(edge, -std::numeric_limits<double>::infinity());
+  }
+
+  // A value inside a bin, also for open bins
+  static double center(double low, double high) {
+    if (std::isinf(low)) {
+      return below(high);
+    }
+    if (std::isinf(high)) {
+      return low;
+    }
+    return 0.5 * (low + high);
+  }
+
+  // Same convention as correctionlib, -1 if outside
+  static int find_bin(const std::vector<double>& edges, double x) {
+    auto it = std::upper_bound(edges.begin(), edges.end(), x);
+    if (it == edges.begin() || it == edges.end()) {
+      return -1;
+    }
+    return std::distance(edges.begin(), it) - 1;
+  }
+
+  std::vector<double> eta_edges_;
+  std::vector<double> pt_edges_;
+  std::vector<double> content_;
+  bool abs_eta_ = false;
+};
+
+class MuonSF : public BinnedSF {
  public:
   MuonSF(const std::string& period, const std::string& cset_file,
-         const std::string& muon_id) {
-    cset_ = correction::CorrectionSet::from_file(cset_file);
+         const std::string& muon_id, std::vector<double> abseta_edges,
+         std::vector<double> pt_edges) {
+    cset_ = load_cset(cset_file);
     std::string corr_name = "NUM_" + muon_id + "_DEN_genTracks";
     period_ = period.rfind("Run", 0) == 0 ? period.substr(3) : period;
     period_.append("_UL");
@@ -31,36 +184,74 @@ class MuonSF {
       throw std::invalid_argument("No correction for " + muon_id);
     }
     corr_ = cset_->at(corr_name);
+    compile(std::move(abseta_edges), std::move(pt_edges), true);
   }
 
-  double operator()(double pt, double eta) const {
+ protected:
+  double evaluate(double pt, double eta) const override {
     return corr_->evaluate({period_, std::abs(eta), pt, "sf"});
   }
 
  private:
-  std::unique_ptr<correction::CorrectionSet> cset_;
+  std::shared_ptr<const correction::CorrectionSet> cset_;
   correction::Correction::Ref corr_;
   std::string period_;
 };
 
-class ElectronSF {
+class ElectronSF : public BinnedSF {
  public:
   ElectronSF(const std::string& period, const std::string& cset_file,
-             const std::string& working_point) {
-    cset_ = correction::CorrectionSet::from_file(cset_file);
+             const std::string& working_point, std::vector<double> eta_edges,
+             std::vector<double> pt_edges) {
+    cset_ = load_cset(cset_file);
+    corr_ = cset_->at("UL-Electron-ID-SF");
     working_point_ = working_point;
 
     period_ = period.rfind("Run", 0) == 0 ? period.substr(3) : period;
+    compile(std::move(eta_edges), std::move(pt_edges), false);
   }
-  double operator()(double pt, double eta) const {
-    return cset_->at("UL-Electron-ID-SF")
-        ->evaluate({period_, "sf", working_point_, eta, pt});
+
+ protected:
+  double evaluate(double pt, double eta) const override {
+    return corr_->evaluate({period_, "sf", working_point_, eta, pt});
   }
 
  private:
-  std::unique_ptr<correction::CorrectionSet> cset_;
+  std::shared_ptr<const correction::CorrectionSet> cset_;
+  correction::Correction::Ref corr_;
   std::string working_point_;
   std::string period_;
 };
 
-#endif
\ No newline at end of file
+// Accessors of the registry without template arguments, called from Python
+inline const BinnedSF& get_muon_sf(const std::string& period,
+                                   const std::string& cset_file,
+                                   const std::string& muon_id,
+                                   const std::vector<double>& abseta_edges,
+                                   const std::vector<double>& pt_edges) {
+  return get_sf<MuonSF>(period, cset_file, muon_id, abseta_edges, pt_edges);
+}
+
+inline const BinnedSF& get_electron_sf(const std::string& period,
+                                       const std::string& cset_file,
+                                       const std::string& working_point,
+                                       const std::vector<double>& eta_edges,
+                                       const std::vector<double>& pt_edges) {
+  return get_sf<ElectronSF>(period, cset_file, working_point, eta_edges,
+                            pt_edges);
+}
+
+// Column of scale factors, the object is bound to a compiled lambda, so
+// that nothing depending on the period is jitted. The objects live in the
+// registry until the end of the process.
+// Usage: df = define_sf(df, "lx1_sf", sf, "lx1_pt", "lx1_eta")
+inline ROOT::RDF::RNode define_sf(ROOT::RDF::RNode df,
+                                  const std::string& column,
+                                  const BinnedSF& sf, const std::string& pt,
+                                  const std::string& eta) {
+  return df.Define(
+      column, [&sf](float lx_pt, float lx_eta) { return sf(lx_pt, lx_eta); },
+      {pt, eta});
+}
+
+#endif
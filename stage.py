@@ -1,11 +1,16 @@
 #! /usr/bin/env python
 """Stage Ntuples."""
 import asyncio
+import concurrent.futures
 import csv
+import functools
 import logging
 import os
 import pathlib
 from mrtools import utils
+from stopscompressed import manifest
+from stopscompressed import scheduler
+from stopscompressed import transport
 
 import click
 
@@ -21,92 +26,135 @@ DEFAULT_SKIM = "Met"
 PERIODS = ["Run2016preVFP", "Run2016postVFP", "Run2017", "Run2018"]
 DEFAULT_PERIODS = PERIODS
 
-EOS_URL = "root://eos.grid.vbc.ac.at"
-EOS_PATH = pathlib.Path(
-    "/eos/vbc/experiments/cms/store/user/liko/StopsCompressed/nanoTuples"
-)
-SCRATCH_PATH = pathlib.Path(
-    "/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples"
-)
-
+MAX_QUERY = 10
 MAX_STAGE = 10
+MAX_CHECKSUM = 4
+
+
+async def local_checksum(
+    name: pathlib.PurePath,
+    files: manifest.Manifest,
+    pool: concurrent.futures.Executor,
+) -> str:
+    """Checksum of a staged file, computed only if it changed."""
+    if (chksum := files.checksum(name)) is not None:
+        return chksum
+    loop = asyncio.get_running_loop()
+    chksum = await loop.run_in_executor(pool, manifest.adler32, files.root / name)
+    files.store(name, chksum)
+    return chksum
+
+
+async def check_file(
+    name: pathlib.PurePath,
+    remote: transport.Transport,
+    files: manifest.Manifest,
+    pool: concurrent.futures.Executor,
+    sem_query: asyncio.Semaphore,
+    trust_manifest: bool = False,
+) -> scheduler.Transfer | None:
+    """Check a file and return its transfer, if it has to be staged.
+
+    The remote checksum is compared with the local one, which is only
+    computed if the file is not in the manifest. With trust_manifest files
+    in the manifest are not queried at all, a file replaced on EOS is then
+    not detected.
+    """
+    target = files.root / name
+    if trust_manifest and target.exists() and files.checksum(name) is not None:
+        log.info("File %s exists.", name)
+        return None
+
+    async with sem_query:
+        try:
+            remote_chksum = await remote.checksum(name)
+        except Exception as e:
+            log.error("Exception %s. File %s skipped.", e, name)
+            return None
 
-XRDCP = "/groups/hephy/cms/dietrich.liko/conda/envs/mrt-root626-py310/bin/xrdcp"
-XRDADLER32 = (
-    "/groups/hephy/cms/dietrich.liko/conda/envs/mrt-root626-py310/bin/xrdadler32"
-)
-
-sem_stage_file = asyncio.Semaphore(MAX_STAGE)
-
-
-async def xrd_checksum(name: str) -> str:
-    """Wrapper xrdadler32."""
-    proc = await asyncio.create_subprocess_exec(
-        XRDADLER32, name, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
-    )
-    stdout, stderr = await proc.communicate()
-    if proc.returncode:
-        raise Exception(
-            f"Return code {proc.returncode} getting remore adler32 for {name}"
-        )
-    return stdout.decode("UTF-8").split()[0]
-
-
-async def xrd_stage(source: str, target: str) -> None:
-    """Wrapper xrdcp."""
-
-    proc = await asyncio.create_subprocess_exec(
-        XRDCP,
-        "--nopbar",
-        "--parallel",
-        "4",
-        "--retry",
-        "3",
-        "--cksum",
-        "adler32",
-        "--force",
-        source,
-        target,
+        if target.exists():
+            if remote_chksum != await local_checksum(name, files, pool):
+                log.info("Checksum mismatch %s", name)
+                files.remove(name)
+                os.unlink(target)
+            else:
+                log.info("File %s exists.", name)
+                return None
+
+        try:
+            size = await remote.size(name)
+        except Exception as e:
+            log.error("Exception %s. File %s skipped.", e, name)
+            return None
+
+    return scheduler.Transfer(
+        str(name),
+        size,
+        functools.partial(stage_file, name, remote_chksum, remote, files),
     )
-    status = await proc.wait()
-    if status:
-        log.error(f"Return code {status} copying {source}")
 
 
-async def stage_file(name: pathlib.PurePath) -> None:
+async def stage_file(
+    name: pathlib.PurePath,
+    remote_chksum: str,
+    remote: transport.Transport,
+    files: manifest.Manifest,
+) -> bool:
     """Stage a file."""
-    async with sem_stage_file:
-        source = EOS_PATH / name
-        target = SCRATCH_PATH / name
-
-        if target.exists():
-            try:
-                chksums = await asyncio.gather(
-                    xrd_checksum(f"{EOS_URL}/{source}"),
-                    xrd_checksum(str(target)),
-                )
-                if chksums[0] != chksums[1]:
-                    log.info("Checksum mismatch %s", name)
-                    os.unlink(target)
-                else:
-                    log.info("File %s exists.", name)
-                    return
-            except Exception as e:
-                log.error("Exception %s. File %s skipped.", e, name)
-                return
-
-        log.info("Copying %s", name)
-        await xrd_stage(f"{EOS_URL}/{source}", str(target))
-
-
-async def stage_all_files(skim: str, period: list[str]) -> None:
+    log.info("Copying %s", name)
+    if not await remote.copy(name, files.root / name):
+        return False
+    # verified by the transport
+    files.store(name, remote_chksum)
+    return True
+
+
+async def stage_all_files(
+    skim: str,
+    period: list[str],
+    max_stage: int,
+    bandwidth: float | None,
+    order: str,
+    source: pathlib.Path | None,
+    scratch: pathlib.Path,
+    trust_manifest: bool,
+) -> None:
     """Stage all files."""
     file_names = []
     for p in period:
         log.info("Skim %s - Period %s", skim, p)
         file_names += get_files_from_csv(skim, p)
 
-    await asyncio.gather(*(stage_file(f) for f in file_names))
+    with (
+        manifest.Manifest(scratch) as files,
+        concurrent.futures.ThreadPoolExecutor(MAX_CHECKSUM) as pool,
+    ):
+        remote: transport.Transport
+        if source is None:
+            remote = transport.XRootDTransport(
+                transport.EOS_URL, transport.EOS_PATH
+            )
+        else:
+            remote = transport.LocalTransport(source, pool)
+
+        sem_query = asyncio.Semaphore(MAX_QUERY)
+        transfers = [
+            t
+            for t in await asyncio.gather(
+                *(
+                    check_file(f, remote, files, pool, sem_query, trust_manifest)
+                    for f in file_names
+                )
+            )
+            if t is not None
+        ]
+        log.info("Staging %d of %d files", len(transfers), len(file_names))
+
+        sched = scheduler.Scheduler(
+            max_stage, bandwidth=bandwidth * 1e6 if bandwidth else None
+        )
+        if failed := await sched.run(scheduler.order(transfers, order)):
+            log.error("%d transfers failed", failed)
 
 
 def get_files_from_csv(skim: str, period: str) -> list[pathlib.PurePath]:
@@ -134,10 +182,52 @@ def get_files_from_csv(skim: str, period: str) -> list[pathlib.PurePath]:
 @click.option(
     "--period", multiple=True, default=DEFAULT_PERIODS, type=click.Choice(PERIODS)
 )
+@click.option(
+    "--max-stage",
+    default=MAX_STAGE,
+    type=click.IntRange(1),
+    help="Maximal number of concurrent transfers",
+)
+@click.option("--bandwidth", type=float, help="Bandwidth cap in MB/s")
+@click.option(
+    "--order",
+    default="none",
+    type=click.Choice(scheduler.ORDERS),
+    help="Transfer order by file size",
+)
+@click.option(
+    "--source",
+    type=click.Path(exists=True, file_okay=False, path_type=pathlib.Path),
+    help="Local directory as stand-in for EOS",
+)
+@click.option(
+    "--scratch",
+    default=transport.SCRATCH_PATH,
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    help="Top directory of the staged files",
+)
+@click.option(
+    "--trust-manifest",
+    is_flag=True,
+    help="Skip the remote queries for files in the manifest",
+)
 @utils.click_option_logging(log)
-def main(skim: str, period: list[str]) -> None:
+def main(
+    skim: str,
+    period: list[str],
+    max_stage: int,
+    bandwidth: float | None,
+    order: str,
+    source: pathlib.Path | None,
+    scratch: pathlib.Path,
+    trust_manifest: bool,
+) -> None:
     """Stage Ntuples from EOS to scratch."""
-    asyncio.run(stage_all_files(skim, period))
+    asyncio.run(
+        stage_all_files(
+            skim, period, max_stage, bandwidth, order, source, scratch, trust_manifest
+        )
+    )
 
 
 if __name__ == "__main__":
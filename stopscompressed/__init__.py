@@ -0,0 +1,7 @@
+"""Helpers shared by the StopsCompressed analysis scripts."""
+import sys
+
+import cloudpickle
+
+# The dask workers do not necessarily have this directory on their path
+cloudpickle.register_pickle_by_value(sys.modules[__name__])
@@ -0,0 +1,559 @@
+"""Common base of the histogram analyses."""
+import abc
+import dataclasses
+import hashlib
+import inspect
+import json
+import logging
+import pathlib
+import sqlite3
+from mrtools import analysis
+from mrtools import model
+from stopscompressed import catalog
+from stopscompressed import checkpoint
+from stopscompressed import chunks
+from stopscompressed import columns
+from stopscompressed import eviction
+from stopscompressed import expressions
+from stopscompressed import histocache
+from stopscompressed import histos
+from stopscompressed import leptonsf
+from stopscompressed import prefetch
+from stopscompressed import reduction
+from stopscompressed import skim
+from stopscompressed import stitching
+from stopscompressed import triggers
+from stopscompressed import variations
+from typing import Any
+from typing import Iterable
+
+import ROOT
+import dask.distributed as dd
+
+DataFrame = Any
+Histos = dict[str, histos.Histo]
+
+log = logging.getLogger(__name__)
+
+SMALL_MAX_FILES = 1
+
+# Modules used by the selections, their source is part of the fingerprint
+SOURCE_MODULES = (expressions, histos, leptonsf, triggers, variations)
+
+# Attributes, which do not change the content of the histograms, the
+# branches read follow from the source, the preselection and the triggers
+FINGERPRINT_EXCLUDE = (
+    "names",
+    "histos",
+    "output",
+    "small",
+    "checkpoint_dir",
+    "resume",
+    "chunk_entries",
+    "skim_cache",
+    "histo_cache",
+    "catalog",
+    "prefetcher",
+    "chains",
+)
+
+
+def _json_default(value: Any) -> Any:
+    """Json representation of the attribute types used by the analyses."""
+    if isinstance(value, pathlib.PurePath):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__} for the fingerprint")
+
+
+class BaseAnalysis(analysis.HistoAnalysis, abc.ABC):
+    """Histogram analysis reading only the referenced branches.
+
+    The branches are determined from the string literals in the source of the
+    derived class, the histogram definitions, the preselection and the
+    triggers. Optionally the preselected events are cached in skims.
+
+    The derived classes implement the selection in `select`, which is called
+    with the options of the nominal selection and of each variation.
+
+    The histograms are booked and written here. With a histogram cache the
+    histograms are filled per input file and only for the files and the
+    histogram definitions not found in the cache. Large samples can be split
+    into chunks, which are filled as separate tasks on the cluster. The
+    weight of stitched samples is multiplied with their stitching weight.
+    Files not yet staged can be prefetched to scratch while the previous
+    files of a task are processed. The access of the files is recorded on
+    the client for the eviction from scratch. With a catalog the files are
+    grouped by the triggers present, so that a trigger missing in some files
+    is only dropped for those. The catalog is filled on the client by
+    `fill_catalog` and only read by the workers.
+    """
+
+    small: bool
+    output: pathlib.Path
+    preselection: str
+    trigger: list[str]
+    names: set[str]
+    histos: list[histos.Definition]
+    source_hash: str
+    skim_cache: skim.SkimCache | None
+    histo_cache: histocache.HistoCache | None
+    checkpoint_dir: pathlib.Path | None
+    resume: bool
+    chunk_entries: int
+    catalog: catalog.Catalog | None
+    stitching: dict[str, stitching.Weight]
+    prefetcher: prefetch.Prefetcher | None
+    chains: list[Any]
+    nominal: dict[str, Any]
+    variations: dict[str, dict[str, Any]]
+
+    # C++ headers used by the selection, part of the fingerprint
+    cpp_headers: list[pathlib.Path] = []
+
+    def __init__(
+        self,
+        histo_file: pathlib.Path,
+        output: pathlib.Path,
+        small: bool,
+        preselection: str,
+        trigger: list[str],
+        nominal: dict[str, Any],
+        skim_dir: pathlib.Path | None = None,
+        variations: dict[str, dict[str, Any]] | None = None,
+        histo_cache_dir: pathlib.Path | None = None,
+        checkpoint_dir: pathlib.Path | None = None,
+        resume: bool = False,
+        chunk_entries: int = 0,
+        catalog_file: pathlib.Path | None = None,
+        stitching: dict[str, stitching.Weight] | None = None,
+        prefetch_depth: int = 0,
+    ) -> None:
+        """Init base analysis.
+
+        Args:
+            histo_file (Path): Yaml file with histogram definitions
+            output (Path): Output file without suffix
+            small (bool): reduce sample size for debugging
+            preselection (str): Event selection applied first
+            trigger (list[str]): Triggers used by the analysis
+            nominal (dict[str, Any]): Options of the nominal selection
+            skim_dir (Path | None): Directory for skims of preselected events
+            variations (dict[str, dict[str, Any]] | None): Options of the
+                selection variations
+            histo_cache_dir (Path | None): Directory for histograms per file
+            checkpoint_dir (Path | None): Directory for histograms per sample
+            resume (bool): take completed samples from the checkpoints
+            chunk_entries (int): Entries per task, 0 for one task per sample
+            catalog_file (Path | None): File catalog with the entries per file
+            stitching (dict[str, Weight] | None): Stitching weights by sample
+                name
+            prefetch_depth (int): Files copied ahead to scratch, 0 to disable
+        """
+        super().__init__(histo_file, output, small)
+        self.small = small
+        self.output = output
+        self.preselection = preselection
+        self.trigger = trigger
+        self.names = (
+            columns.source_identifiers(type(self))
+            | columns.histos_identifiers(histo_file)
+            | columns.identifiers(preselection)
+            | set(trigger)
+        )
+        self.histos = histos.load(histo_file)
+        # the source is not available on the workers
+        sha = hashlib.sha1()
+        for cls in type(self).__mro__:
+            if issubclass(cls, BaseAnalysis):
+                sha.update(inspect.getsource(cls).encode())
+        for module in SOURCE_MODULES:
+            sha.update(inspect.getsource(module).encode())
+        for header in self.cpp_headers:
+            sha.update(header.read_bytes())
+        self.source_hash = sha.hexdigest()
+        if skim_dir is None:
+            self.skim_cache = None
+        else:
+            self.skim_cache = skim.SkimCache(skim_dir, preselection)
+        if histo_cache_dir is None:
+            self.histo_cache = None
+        else:
+            self.histo_cache = histocache.HistoCache(histo_cache_dir)
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.chunk_entries = chunk_entries
+        if catalog_file is None:
+            self.catalog = None
+        else:
+            # filled on the client by fill_catalog
+            self.catalog = catalog.Catalog(catalog_file, readonly=True)
+        self.stitching = stitching or {}
+        for stitch in self.stitching.values():
+            if stitch.variable is not None:
+                self.names.add(stitch.variable)
+        if prefetch_depth:
+            self.prefetcher = prefetch.Prefetcher(prefetch_depth)
+        else:
+            self.prefetcher = None
+        self.chains = []
+        self.nominal = nominal
+        self.variations = variations or {}
+
+    def fingerprint(self) -> str:
+        """Hash of the analysis code, the C++ headers and the settings.
+
+        The histogram definitions are not included, each cached histogram is
+        keyed by the digest of its definition.
+
+        All attributes not in FINGERPRINT_EXCLUDE are included, an attribute
+        which cannot be serialised is an error.
+        """
+        sha = hashlib.sha1(self.source_hash.encode())
+        for key, value in sorted(vars(self).items()):
+            if key in FINGERPRINT_EXCLUDE:
+                continue
+            text = json.dumps(value, sort_keys=True, default=_json_default)
+            sha.update(f"{key}={text}".encode())
+        return sha.hexdigest()[:16]
+
+    def checkpoints(self) -> checkpoint.Checkpoints | None:
+        """Checkpoints of this analysis, if enabled."""
+        if self.checkpoint_dir is None:
+            return None
+        sha = hashlib.sha1(self.fingerprint().encode())
+        for definition in self.histos:
+            sha.update(histos.digest(definition).encode())
+        sha.update(str(self.small).encode())
+        return checkpoint.Checkpoints(self.checkpoint_dir, sha.hexdigest()[:16])
+
+    def source(self, sample: model.Sample, chunk: chunks.Chunk) -> DataFrame:
+        """Dataframe of the preselected events.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            chunk (Chunk): Input files, optionally an entry range
+
+        Returns:
+            DataFrame: Dataframe reading only the used branches
+        """
+        files = chunk.files
+        if chunk.entry_range is not None:
+            # only whole files are skimmed or cached
+            spec = (
+                ROOT.RDF.Experimental.RDatasetSpec()
+                .AddSample(("", skim.TREE_NAME, files))
+                .WithGlobalRange(chunk.entry_range)
+            )
+            df = ROOT.RDataFrame(spec)
+        else:
+            chain = ROOT.TChain(skim.TREE_NAME)
+            for f in files:
+                chain.Add(f)
+            used = columns.used_columns(
+                ROOT.RDataFrame(chain).GetColumnNames(), self.names
+            )
+            if self.skim_cache is not None:
+                df = self.skim_cache.source(sample, files, used)
+            else:
+                columns.prune_branches(chain, used)
+                # RDataFrame does not take ownership of the chain
+                self.chains.append(chain)
+                df = ROOT.RDataFrame(chain)
+
+        if stitch := self.stitching.get(sample.name):
+            log.debug("Stitching weight for %s: %s", sample, stitch)
+            df = stitching.apply(df, stitch)
+
+        return df.Filter(self.preselection)
+
+    def book(
+        self,
+        sample: model.Sample,
+        chunk: chunks.Chunk,
+        definitions: list[histos.Definition],
+    ) -> dict[str, Any]:
+        """Book histograms for a chunk of a sample.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            chunk (Chunk): Input files, optionally an entry range
+            definitions (list[Definition]): Histogram definitions
+
+        Returns:
+            dict[str, RResultPtr]: Booked histograms by name
+        """
+        df = self.source(sample, chunk)
+        return histos.book(self.define(sample, df), definitions)
+
+    def map(self, sample: model.Sample) -> Histos:
+        """Fill the histograms of a sample.
+
+        With chunks enabled the chunks are submitted as tasks from within this
+        task and their histograms are added in a tree of tasks.
+
+        Args:
+            sample (Sample): The sample to be analysed
+
+        Returns:
+            Histos: Histograms by name
+        """
+        log.info("Processing %s", sample)
+        files = self.sample_files(sample)
+        checkpoints = self.checkpoints()
+        if self.resume and checkpoints is not None:
+            if (result := checkpoints.load(sample, files)) is not None:
+                return result
+
+        if not self.chunk_entries or not self.cataloged(files):
+            return self.fill(sample, chunks.Chunk(files))
+
+        split_files = self.skim_cache is None and self.histo_cache is None
+        sample_chunks = chunks.split(
+            self.catalog.entries(files),
+            self.chunk_entries,
+            split_files,
+        )
+        if len(sample_chunks) < 2:
+            return self.fill(sample, chunks.Chunk(files))
+
+        log.info("Splitting %s into %d chunks", sample, len(sample_chunks))
+        self.chains = []
+        with dd.worker_client() as client:
+            futures = [
+                client.submit(self.fill, sample, c, pure=False) for c in sample_chunks
+            ]
+            return reduction.tree_reduce(client, histos.merge, futures).result()
+
+    def sample_files(self, sample: model.SampleBase) -> list[str]:
+        """Input files of a sample, none for a group of samples.
+
+        Args:
+            sample (SampleBase): The sample
+
+        Returns:
+            list[str]: Input files
+        """
+        if not isinstance(sample, model.Sample):
+            return []
+        chain = sample.chain(SMALL_MAX_FILES) if self.small else sample.chain()
+        return skim.chain_files(chain)
+
+    def fill_catalog(self, samples: Iterable[model.SampleBase]) -> None:
+        """Read the headers of the input files unknown to the catalog.
+
+        Called on the client before the tasks are submitted, the headers are
+        read in parallel processes. The workers only read the catalog.
+
+        Args:
+            samples (Iterable[SampleBase]): Samples to be analysed
+        """
+        if self.catalog is None or not (self.chunk_entries or self.trigger):
+            return
+        files = [f for sample in samples for f in self.sample_files(sample)]
+        catalog.Catalog(self.catalog.path).schemas(files)
+
+    def cataloged(self, files: list[str]) -> bool:
+        """Whether all files are known to the catalog.
+
+        Args:
+            files (list[str]): Input files
+
+        Returns:
+            bool: True, if entries and schemas can be taken from the catalog
+        """
+        if self.catalog is None:
+            return False
+        try:
+            unknown = self.catalog.unknown(files)
+        except sqlite3.Error as e:
+            log.warning("Cannot read the catalog %s: %s", self.catalog.path, e)
+            return False
+        if unknown:
+            log.warning("%d files not in the catalog: %s", len(unknown), unknown[0])
+        return not unknown
+
+    def fill(self, sample: model.Sample, chunk: chunks.Chunk) -> Histos:
+        """Fill the histograms of a chunk of a sample.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            chunk (Chunk): Input files, optionally an entry range
+
+        Returns:
+            Histos: Histograms by name
+        """
+        self.chains = []
+        definitions = histos.for_sample(self.histos, sample)
+        if not definitions:
+            return {}
+        if chunk.entry_range is not None:
+            return histos.values(self.book(sample, chunk, definitions))
+        if self.histo_cache is None:
+            if self.prefetcher is None:
+                groups = self.trigger_groups(chunk.files)
+                if len(groups) == 1:
+                    return histos.values(self.book(sample, chunk, definitions))
+                log.info("%s: %d trigger groups", sample, len(groups))
+                booked = [
+                    self.book(sample, chunks.Chunk(g), definitions) for g in groups
+                ]
+                ROOT.RDF.RunGraphs([r for results in booked for r in results.values()])
+                return histos.merge([histos.values(results) for results in booked])
+            # one event loop per file, while the next files are copied
+            return histos.merge(
+                [
+                    histos.values(self.book(sample, chunks.Chunk([f]), definitions))
+                    for f in self.prefetcher.files(chunk.files)
+                ]
+            )
+
+        files = chunk.files
+
+        fingerprint = self.fingerprint()
+        partial: list[Histos] = []
+        booked: dict[str, tuple[Histos, list[histos.Definition], dict[str, Any]]] = {}
+        for path in files:
+            cached = self.histo_cache.load(sample, path, fingerprint, definitions)
+            if missing := [d for d in definitions if d["name"] not in cached]:
+                log.debug("Filling %d histograms for %s", len(missing), path)
+                results = self.book(sample, chunks.Chunk([path]), missing)
+                booked[path] = (cached, missing, results)
+            else:
+                partial.append(cached)
+        log.info("%s: %d of %d files from cache", sample, len(partial), len(files))
+
+        if booked:
+            ROOT.RDF.RunGraphs([r for *_, res in booked.values() for r in res.values()])
+        for path, (cached, missing, results) in booked.items():
+            filled = histos.values(results)
+            self.histo_cache.store(sample, path, fingerprint, missing, filled)
+            partial.append(cached | filled)
+
+        return histos.merge(partial)
+
+    def trigger_groups(self, files: list[str]) -> list[list[str]]:
+        """Group files by the triggers present, if a catalog is available.
+
+        Args:
+            files (list[str]): Input files
+
+        Returns:
+            list[list[str]]: Groups of files
+        """
+        if not self.trigger or len(files) < 2 or not self.cataloged(files):
+            return [files]
+        present = self.catalog.present(files, self.trigger)
+        return triggers.group_files(files, present)
+
+    def reduce(self, sample: model.SampleBase, results: list[Histos]) -> Histos:
+        """Add the histograms of the children of a SampleGroup.
+
+        Args:
+            sample (SampleBase): The sample to combine
+            results (list[Histos]): Histograms of the children
+
+        Returns:
+            Histos: Added histograms
+        """
+        return histos.merge(results)
+
+    def gather(self, future_to_sample: dict[dd.Future, model.SampleBase]) -> None:
+        """Write the histograms of all samples.
+
+        With checkpoints each sample is written by a task on the worker
+        holding its histograms as soon as it is completed. The output file is
+        then assembled from the checkpoints, one sample at a time, so that the
+        histograms are not transferred to the client. A sample, whose
+        checkpoint was not written in this run, is missing in the output.
+
+        Args:
+            future_to_sample (dict[dd.Future, SampleBase]): Mapping of futures
+                to samples
+        """
+        checkpoints = self.checkpoints()
+        files = {f: self.sample_files(s) for f, s in future_to_sample.items()}
+        # futures of the samples, whose checkpoint was written in this run
+        stored: set[dd.Future] = set()
+        if checkpoints is None:
+            dd.wait(future_to_sample.keys())
+        else:
+            client = dd.get_client()
+            store_to_future = {
+                client.submit(
+                    checkpoints.store, sample, future, files[future], pure=False
+                ): future
+                for future, sample in future_to_sample.items()
+            }
+            for store in dd.as_completed(store_to_future.keys()):
+                future = store_to_future[store]
+                if store.status == "finished":
+                    stored.add(future)
+                else:
+                    sample = future_to_sample[future]
+                    log.error("Processing %s failed: %s", sample, store.exception())
+
+        output_file = self.output.parent / f"{self.output.name}.root"
+        log.info("Writing histograms to %s", output_file)
+        root_file = ROOT.TFile(str(output_file), "RECREATE")
+        failed = 0
+        for future, sample in future_to_sample.items():
+            if checkpoints is None:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # the other samples are written nevertheless
+                    log.error("No histograms for %s: %s", sample, e)
+                    result = None
+            elif future in stored:
+                result = checkpoints.load(sample, files[future])
+            else:
+                # a checkpoint of an earlier run is not used
+                result = None
+            if result is None:
+                failed += 1
+                continue
+            directory = root_file.mkdir(checkpoint.sample_dir(sample), "", True)
+            histos.write(directory, result)
+        root_file.Close()
+        if failed:
+            log.error("%d of %d samples missing", failed, len(future_to_sample))
+
+        # once on the client instead of on every worker
+        eviction.record_access([f for names in files.values() for f in names])
+
+    def define(self, sample: model.Sample, df: DataFrame) -> dict[str, DataFrame]:
+        """Define dataframes for the nominal selection and its variations.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            df (RDataFrame): Dataframe of the preselected events
+
+        Returns:
+            dict[str, DataFrame]: Dict of dataframes
+        """
+        dfs = self.select(sample, df, **self.nominal)
+        for variation, options in self.variations.items():
+            log.debug("Variation %s: %s", variation, options)
+            for key, df_var in self.select(sample, df, **options).items():
+                dfs[variations.name(key, variation)] = df_var
+
+        return dfs
+
+    @abc.abstractmethod
+    def select(
+        self, sample: model.Sample, df: DataFrame, **options: Any
+    ) -> dict[str, DataFrame]:
+        """Define dataframes for the preselected events.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            df (RDataFrame): Dataframe of the preselected events
+            options: Options of the selection
+
+        Returns:
+            dict[str, DataFrame]: Dict of dataframes
+        """
@@ -0,0 +1,388 @@
+"""Catalog of the input files.
+
+Metadata of the input files is stored in a SQLite database, so that the
+files are not opened again just to learn what is already known. Local files
+are keyed by path, size and modification time; a changed file is scanned
+again.
+
+Per file the number of entries, the sum of weights, the hash of the branch
+list and, if known from the stage manifest, the adler32 checksum are
+stored. The branch lists are stored once per hash. The schemas can be
+scanned on their own from the file headers in parallel, the sum of weights
+is then filled in when it is first needed.
+
+SQLite locking is not reliable on the shared filesystems, therefore the
+catalog is written by one process only. The analyses fill it on the client
+and the workers open it read-only.
+"""
+import concurrent.futures
+import contextlib
+import dataclasses
+import hashlib
+import logging
+import os
+import pathlib
+import sqlite3
+from stopscompressed import manifest
+from stopscompressed import skim
+from stopscompressed import transport
+from typing import Iterator
+
+import ROOT
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PATH = transport.SCRATCH_PATH / ".catalog.db"
+
+# increased on changes of the tables, the catalog is then rebuilt
+VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    entries INTEGER,
+    sum_weights REAL,
+    schema TEXT,
+    adler32 TEXT,
+    complete INTEGER
+);
+CREATE TABLE IF NOT EXISTS schemas (
+    hash TEXT PRIMARY KEY,
+    branches TEXT
+);
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class FileInfo:
+    """Metadata of an input file."""
+
+    entries: int
+    sum_weights: float | None
+    schema: str
+    adler32: str | None = None
+
+
+def stat(path: str) -> tuple[int, int] | tuple[None, None]:
+    """Size and modification time of a local file."""
+    if not os.path.exists(path):
+        return None, None
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def schema_hash(branches: list[str]) -> str:
+    """Hash of a branch list."""
+    return hashlib.sha1("\n".join(sorted(branches)).encode()).hexdigest()[:16]
+
+
+def read_header(path: str) -> tuple[int, list[str]]:
+    """Entries and branches of a file, without reading any events.
+
+    Args:
+        path (str): Input file
+
+    Returns:
+        tuple[int, list[str]]: Entries and sorted branch names
+    """
+    root_file = ROOT.TFile.Open(path)
+    if not root_file or root_file.IsZombie():
+        raise OSError(f"Cannot open {path}")
+    tree = root_file.Get(skim.TREE_NAME)
+    if not tree:
+        root_file.Close()
+        return 0, []
+    entries = int(tree.GetEntries())
+    branches = sorted(str(b.GetName()) for b in tree.GetListOfBranches())
+    root_file.Close()
+    return entries, branches
+
+
+def scan_file(path: str) -> tuple[FileInfo, list[str]]:
+    """Entries, sum of weights and branches of a file.
+
+    Only the weight branch is read.
+
+    Args:
+        path (str): Input file
+
+    Returns:
+        tuple[FileInfo, list[str]]: Metadata and branch list
+    """
+    entries, branches = read_header(path)
+    sum_weights = None
+    if entries and "weight" in branches:
+        df = ROOT.RDataFrame(skim.TREE_NAME, path)
+        sum_weights = float(df.Sum("weight").GetValue())
+    return FileInfo(entries, sum_weights, schema_hash(branches)), branches
+
+
+def staged_checksums(files: list[str]) -> dict[str, str]:
+    """Checksums of staged files from the stage manifest."""
+    root = transport.SCRATCH_PATH
+    staged_files = [f for f in files if f.startswith(f"{root}/")]
+    if not staged_files or not root.exists():
+        return {}
+    checksums = {}
+    with manifest.Manifest(root) as staged:
+        for f in staged_files:
+            name = pathlib.PurePath(f).relative_to(root)
+            if (chksum := staged.checksum(name)) is not None:
+                checksums[f] = chksum
+    return checksums
+
+
+class Catalog:
+    """File catalog in a SQLite database."""
+
+    path: pathlib.Path
+    readonly: bool
+
+    def __init__(
+        self, path: pathlib.Path = DEFAULT_PATH, readonly: bool = False
+    ) -> None:
+        """Init catalog.
+
+        Args:
+            path (Path): SQLite database
+            readonly (bool): open the database read-only, e.g. on the workers
+        """
+        self.path = path
+        self.readonly = readonly
+
+    @contextlib.contextmanager
+    def connect(self) -> Iterator[sqlite3.Connection]:
+        """Connection to the database, committed on success."""
+        if self.readonly:
+            con = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=60)
+            try:
+                version = con.execute("PRAGMA user_version").fetchone()[0]
+                if version != VERSION:
+                    raise sqlite3.DatabaseError(
+                        f"Catalog {self.path} has version {version}, not {VERSION}"
+                    )
+                yield con
+            finally:
+                con.close()
+            return
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(self.path, timeout=60)
+        try:
+            if con.execute("PRAGMA user_version").fetchone()[0] != VERSION:
+                log.info("Creating catalog %s", self.path)
+                con.executescript(
+                    "DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS schemas;"
+                )
+                con.execute(f"PRAGMA user_version = {VERSION}")
+            con.executescript(SCHEMA)
+            yield con
+            con.commit()
+        finally:
+            con.close()
+
+    def info(self, files: list[str]) -> dict[str, FileInfo]:
+        """Metadata per file, scanning the unknown files.
+
+        Args:
+            files (list[str]): Input files
+
+        Returns:
+            dict[str, FileInfo]: Metadata by file
+        """
+        stats = {f: stat(f) for f in files}
+        known: dict[str, FileInfo] = {}
+        with self.connect() as con:
+            for f in files:
+                row = con.execute(
+                    "SELECT size, mtime, entries, sum_weights, schema, adler32 "
+                    "FROM files WHERE path = ? AND complete",
+                    (f,),
+                ).fetchone()
+                if row is not None and stats[f] == tuple(row[:2]):
+                    known[f] = FileInfo(*row[2:])
+
+        if scan := [f for f in files if f not in known]:
+            log.info("Scanning %d files", len(scan))
+            checksums = staged_checksums(scan)
+            scanned: dict[str, tuple[FileInfo, list[str]]] = {}
+            for f in scan:
+                info, branches = scan_file(f)
+                info = dataclasses.replace(info, adler32=checksums.get(f))
+                scanned[f] = (info, branches)
+            self.store(scanned, stats)
+            known.update({f: i for f, (i, _) in scanned.items()})
+
+        return {f: known[f] for f in files}
+
+    def store(
+        self,
+        scanned: dict[str, tuple[FileInfo, list[str]]],
+        stats: dict[str, tuple[int, int] | tuple[None, None]],
+        complete: bool = True,
+    ) -> None:
+        """Store the metadata and the branch lists of files.
+
+        Args:
+            scanned (dict[str, tuple[FileInfo, list[str]]]): Metadata and
+                branch list by file
+            stats (dict): Size and modification time by file
+            complete (bool): the sum of weights is known
+        """
+        with self.connect() as con:
+            con.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        f,
+                        *stats[f],
+                        i.entries,
+                        i.sum_weights,
+                        i.schema,
+                        i.adler32,
+                        complete,
+                    )
+                    for f, (i, _) in scanned.items()
+                ],
+            )
+            con.executemany(
+                "INSERT OR IGNORE INTO schemas VALUES (?, ?)",
+                [(i.schema, "\n".join(b)) for i, b in scanned.values()],
+            )
+
+    def unknown(self, files: list[str]) -> list[str]:
+        """Files without a schema in the catalog or changed since.
+
+        Args:
+            files (list[str]): Input files
+
+        Returns:
+            list[str]: Files whose headers have to be read
+        """
+        scan = []
+        with self.connect() as con:
+            for f in files:
+                row = con.execute(
+                    "SELECT size, mtime FROM files WHERE path = ?", (f,)
+                ).fetchone()
+                if row is None or stat(f) != tuple(row):
+                    scan.append(f)
+        return scan
+
+    def store_headers(self, headers: dict[str, tuple[int, list[str]]]) -> None:
+        """Store entries and schemas read from the headers.
+
+        Args:
+            headers (dict[str, tuple[int, list[str]]]): Entries and branches
+                by file, as returned by read_header
+        """
+        checksums = staged_checksums(list(headers))
+        scanned: dict[str, tuple[FileInfo, list[str]]] = {}
+        for f, (entries, branches) in headers.items():
+            info = FileInfo(entries, None, schema_hash(branches), checksums.get(f))
+            scanned[f] = (info, branches)
+        self.store(scanned, {f: stat(f) for f in headers}, complete=False)
+
+    def schemas(self, files: list[str], workers: int | None = None) -> dict[str, str]:
+        """Schema hash per file, reading the headers of the unknown files.
+
+        The headers are read in parallel processes.
+
+        Args:
+            files (list[str]): Input files
+            workers (int | None): Number of processes, default all cores,
+                1 to read the headers in this process
+
+        Returns:
+            dict[str, str]: Schema hash by file
+        """
+        if scan := self.unknown(files):
+            log.info("Reading headers of %d files", len(scan))
+            if workers == 1:
+                headers = [read_header(f) for f in scan]
+            else:
+                with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+                    headers = list(pool.map(read_header, scan, chunksize=16))
+            self.store_headers(dict(zip(scan, headers)))
+
+        with self.connect() as con:
+            return {
+                f: con.execute(
+                    "SELECT schema FROM files WHERE path = ?", (f,)
+                ).fetchone()[0]
+                for f in files
+            }
+
+    def present(
+        self, files: list[str], names: list[str], workers: int | None = None
+    ) -> dict[str, set[str]]:
+        """Branches present per file out of a list of names.
+
+        Args:
+            files (list[str]): Input files
+            names (list[str]): Branch names, e.g. triggers
+            workers (int | None): Number of processes to read unknown headers
+
+        Returns:
+            dict[str, set[str]]: Names present by file
+        """
+        schemas = self.schemas(files, workers)
+        by_schema = {
+            s: set(self.branches(s)).intersection(names) for s in set(schemas.values())
+        }
+        return {f: by_schema[s] for f, s in schemas.items()}
+
+    def entries(self, files: list[str], workers: int | None = None) -> dict[str, int]:
+        """Number of entries per file, reading the headers of unknown files.
+
+        No events are read, the sum of weights is left to totals.
+
+        Args:
+            files (list[str]): Input files
+            workers (int | None): Number of processes to read unknown headers
+
+        Returns:
+            dict[str, int]: Entries by file
+        """
+        self.schemas(files, workers)
+        with self.connect() as con:
+            return {
+                f: con.execute(
+                    "SELECT entries FROM files WHERE path = ?", (f,)
+                ).fetchone()[0]
+                for f in files
+            }
+
+    def totals(self, files: list[str]) -> tuple[int, float]:
+        """Number of entries and sum of weights of files, e.g. of a sample.
+
+        Args:
+            files (list[str]): Input files
+
+        Returns:
+            tuple[int, float]: Entries and sum of weights
+        """
+        infos = self.info(files).values()
+        return (
+            sum(i.entries for i in infos),
+            sum(i.sum_weights or 0.0 for i in infos),
+        )
+
+    def branches(self, schema: str) -> list[str]:
+        """Branch list of a schema hash.
+
+        Args:
+            schema (str): Schema hash
+
+        Returns:
+            list[str]: Sorted branch names
+        """
+        with self.connect() as con:
+            row = con.execute(
+                "SELECT branches FROM schemas WHERE hash = ?", (schema,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(schema)
+        return row[0].split("\n") if row[0] else []
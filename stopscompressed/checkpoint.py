@@ -0,0 +1,108 @@
+"""Checkpoints of the histograms of completed samples.
+
+The histograms of each sample are written to their own ROOT file as soon as
+the sample is completed. A resumed run takes the samples found here instead
+of processing them again. The checkpoints are keyed by a hash of the
+analysis and of the input files of the sample, so that a changed analysis
+or a sample with added or restaged files does not pick up stale
+histograms.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+from mrtools import model
+from stopscompressed import histos
+
+import ROOT
+
+log = logging.getLogger(__name__)
+
+
+def sample_dir(sample: model.SampleBase) -> str:
+    """Directory of a sample in the output file."""
+    return "_".join(sample.path.parts[3:])
+
+
+class Checkpoints:
+    """Histograms of the completed samples."""
+
+    directory: pathlib.Path
+    key: str
+
+    def __init__(self, directory: pathlib.Path, key: str) -> None:
+        """Init checkpoints.
+
+        Args:
+            directory (Path): Directory for the checkpoint files
+            key (str): Hash of the analysis
+        """
+        self.directory = directory
+        self.key = key
+
+    def path(self, sample: model.SampleBase, files: list[str]) -> pathlib.Path:
+        """Checkpoint file of a sample.
+
+        Size and modification time are included for local files, so that
+        a restaged file leads to a new checkpoint.
+
+        Args:
+            sample (SampleBase): The sample
+            files (list[str]): Input files of the sample
+        """
+        sha = hashlib.sha1(self.key.encode())
+        for path in sorted(files):
+            sha.update(path.encode())
+            if os.path.exists(path):
+                stat = os.stat(path)
+                sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        return self.directory / f"{sample_dir(sample)}_{sha.hexdigest()[:16]}.root"
+
+    def load(
+        self, sample: model.SampleBase, files: list[str]
+    ) -> dict[str, histos.Histo] | None:
+        """Histograms of a completed sample.
+
+        Args:
+            sample (SampleBase): The sample
+            files (list[str]): Input files of the sample
+
+        Returns:
+            dict[str, Histo] | None: Histograms by name, None if not completed
+        """
+        path = self.path(sample, files)
+        if not path.exists():
+            return None
+
+        log.info("Using checkpoint %s", path)
+        result: dict[str, histos.Histo] = {}
+        root_file = ROOT.TFile(str(path), "READ")
+        for key in root_file.GetListOfKeys():
+            histo = key.ReadObj()
+            histo.SetDirectory(ROOT.nullptr)
+            result[str(key.GetName())] = histo
+        root_file.Close()
+        return result
+
+    def store(
+        self,
+        sample: model.SampleBase,
+        result: dict[str, histos.Histo],
+        files: list[str],
+    ) -> None:
+        """Write the histograms of a completed sample.
+
+        Args:
+            sample (SampleBase): The sample
+            result (dict[str, Histo]): Histograms by name
+            files (list[str]): Input files of the sample
+        """
+        path = self.path(sample, files)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # an interrupted write must not look like a completed sample
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        root_file = ROOT.TFile(str(tmp_path), "RECREATE")
+        histos.write(root_file, result)
+        root_file.Close()
+        os.replace(tmp_path, path)
+        log.debug("Wrote checkpoint %s", path)
@@ -0,0 +1,49 @@
+"""Splitting of samples into chunks of roughly equal number of events.
+
+A chunk is either a group of whole files or an entry range of a single
+file. Small files are grouped until the chunk size is reached, large files
+are split into ranges of about the chunk size.
+"""
+import dataclasses
+import math
+
+
+@dataclasses.dataclass(frozen=True)
+class Chunk:
+    """Input files of a task, optionally restricted to an entry range."""
+
+    files: list[str]
+    entry_range: tuple[int, int] | None = None
+
+
+def split(
+    entries: dict[str, int], chunk_entries: int, split_files: bool = True
+) -> list[Chunk]:
+    """Split files into chunks.
+
+    Args:
+        entries (dict[str, int]): Entries by file
+        chunk_entries (int): Approximate number of entries per chunk
+        split_files (bool): split large files into entry ranges
+
+    Returns:
+        list[Chunk]: The chunks
+    """
+    chunks: list[Chunk] = []
+    group: list[str] = []
+    group_entries = 0
+    for path, n in entries.items():
+        if group and group_entries + n > chunk_entries:
+            chunks.append(Chunk(group))
+            group, group_entries = [], 0
+        if n > chunk_entries and split_files:
+            nr_ranges = round(n / chunk_entries)
+            bounds = [math.ceil(i * n / nr_ranges) for i in range(nr_ranges + 1)]
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                chunks.append(Chunk([path], (start, stop)))
+        else:
+            group.append(path)
+            group_entries += n
+    if group:
+        chunks.append(Chunk(group))
+    return chunks
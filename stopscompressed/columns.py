@@ -0,0 +1,129 @@
+"""Columns referenced by an analysis.
+
+The identifiers are collected from the string literals in the source of the
+analysis class and from the expressions in the histogram definitions. Only
+those identifiers, which are also branches of the input tree, are kept.
+"""
+import ast
+import inspect
+import logging
+import pathlib
+import re
+import textwrap
+from typing import Any
+from typing import Iterable
+
+import ruamel.yaml
+
+log = logging.getLogger(__name__)
+
+IDENTIFIER = re.compile(r"\b[A-Za-z_][A-Za-z0-9_]*\b")
+
+# Keys of the histogram definitions containing expressions
+HISTO_KEYS = ("name", "var", "var1", "var2", "when", "weight")
+
+
+def identifiers(expression: str) -> set[str]:
+    """Identifiers in a C++ expression.
+
+    Args:
+        expression (str): Expression as passed to Define or Filter
+
+    Returns:
+        set[str]: all words that could be column names
+    """
+    return set(IDENTIFIER.findall(expression))
+
+
+def source_identifiers(obj: Any) -> set[str]:
+    """Identifiers in the string literals of a class or function.
+
+    Args:
+        obj (Any): Class or function
+
+    Returns:
+        set[str]: Identifiers
+    """
+    tree = ast.parse(textwrap.dedent(inspect.getsource(obj)))
+    names: set[str] = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            names |= identifiers(node.value)
+    return names
+
+
+def histos_identifiers(histos_file: pathlib.Path) -> set[str]:
+    """Identifiers in the expressions of the histogram definitions.
+
+    Args:
+        histos_file (Path): Yaml file with histogram definitions
+
+    Returns:
+        set[str]: Identifiers
+    """
+    yaml = ruamel.yaml.YAML(typ="safe")
+    with open(histos_file, "r") as inp:
+        definitions = yaml.load(inp)
+
+    names: set[str] = set()
+
+    def walk(item: Any) -> None:
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key in HISTO_KEYS and isinstance(value, str):
+                    names.update(identifiers(value))
+                else:
+                    walk(value)
+        elif isinstance(item, list):
+            for value in item:
+                walk(value)
+
+    walk(definitions)
+    return names
+
+
+def used_columns(branches: Iterable[str], names: Iterable[str]) -> list[str]:
+    """Select the branches referenced by name.
+
+    NanoAOD collections need their counter branch, which is added if
+    present in the tree.
+
+    Args:
+        branches (Iterable[str]): Branches of the input tree
+        names (Iterable[str]): Referenced identifiers
+
+    Returns:
+        list[str]: Sorted list of referenced branches
+    """
+    branches = set(str(b) for b in branches)
+    used = branches & set(names)
+    for name in list(used):
+        collection, sep, _ = name.partition("_")
+        if sep and f"n{collection}" in branches:
+            used.add(f"n{collection}")
+    return sorted(used)
+
+
+def prune_branches(chain: Any, used: list[str]) -> list[str]:
+    """Disable all branches of a chain, which are not used.
+
+    Args:
+        chain (TChain): Chain of the input files
+        used (list[str]): Branches to be read
+
+    Returns:
+        list[str]: Sorted list of the disabled branches
+    """
+    branches = set(str(b.GetName()) for b in chain.GetListOfBranches())
+    chain.SetBranchStatus("*", 0)
+    for name in used:
+        chain.SetBranchStatus(name, 1)
+
+    dropped = sorted(branches - set(used))
+    log.debug(
+        "Reading %d of %d branches, dropped: %s",
+        len(branches) - len(dropped),
+        len(branches),
+        ", ".join(dropped),
+    )
+    return dropped
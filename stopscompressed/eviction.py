@@ -0,0 +1,159 @@
+"""Eviction of the least recently used files from the scratch tree.
+
+The scratch tree has the layout of stage.py (tag/skim/sample/file). The
+last access of a file is taken from the manifest, where it is recorded by
+the analyses, or from its modification time if it has never been read.
+Files of the samples in pinned sample files are never evicted.
+"""
+import dataclasses
+import logging
+import os
+import pathlib
+import sqlite3
+from stopscompressed import manifest
+from stopscompressed import prefetch
+from stopscompressed import transport
+from typing import Any
+
+import ruamel.yaml
+
+log = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(frozen=True)
+class Entry:
+    """A file in the scratch tree."""
+
+    name: pathlib.PurePath
+    size: int
+    atime: int
+
+
+def record_access(
+    files: list[str], root: pathlib.Path = transport.SCRATCH_PATH
+) -> None:
+    """Record the access of the input files in the manifest.
+
+    Errors are only logged.
+
+    Args:
+        files (list[str]): Input files, local or on EOS
+        root (Path): Top directory of the staged files
+    """
+    names = [n for f in files if (n := prefetch.relative(f)) is not None]
+    if not names or not root.exists():
+        return
+    # only bookkeeping, the analysis does not depend on it
+    try:
+        with manifest.Manifest(root) as staged:
+            staged.touch(names)
+    except (sqlite3.Error, OSError) as e:
+        log.warning("Cannot record the access in %s: %s", root, e)
+
+
+def pinned_dirs(sample_files: list[pathlib.Path]) -> list[pathlib.PurePath]:
+    """Directories of the samples in sample files.
+
+    Args:
+        sample_files (list[Path]): Yaml files with sample definitions
+
+    Returns:
+        list[PurePath]: Directories relative to the top directory
+    """
+    dirs: list[pathlib.PurePath] = []
+
+    def walk(item: Any) -> None:
+        if isinstance(item, dict):
+            for key, value in item.items():
+                if key == "directory" and isinstance(value, str):
+                    if (name := prefetch.relative(value)) is not None:
+                        dirs.append(name)
+                else:
+                    walk(value)
+        elif isinstance(item, list):
+            for value in item:
+                walk(value)
+
+    yaml = ruamel.yaml.YAML(typ="safe")
+    for sample_file in sample_files:
+        with open(sample_file, "r") as inp:
+            for document in yaml.load_all(inp):
+                walk(document)
+    return dirs
+
+
+def scan(root: pathlib.Path, staged: manifest.Manifest) -> list[Entry]:
+    """Files in the scratch tree with their last access.
+
+    Args:
+        root (Path): Top directory of the staged files
+        staged (Manifest): Manifest of the staged files
+
+    Returns:
+        list[Entry]: The files
+    """
+    accessed = staged.accessed()
+    entries = []
+    for path in root.rglob("*.root"):
+        name = path.relative_to(root)
+        st = path.stat()
+        atime = max(accessed.get(name, 0), st.st_mtime_ns)
+        entries.append(Entry(name, st.st_size, atime))
+    return entries
+
+
+def select(
+    entries: list[Entry],
+    quota: int,
+    pinned: list[pathlib.PurePath],
+    by_tag: bool = False,
+) -> list[Entry]:
+    """Least recently used files to be evicted to stay under the quota.
+
+    Args:
+        entries (list[Entry]): Files in the scratch tree
+        quota (int): Maximal total size in bytes
+        pinned (list[PurePath]): Directories which are not evicted
+        by_tag (bool): evict all unpinned files of a tag together
+
+    Returns:
+        list[Entry]: Files to be evicted
+    """
+    total = sum(e.size for e in entries)
+    if total <= quota:
+        return []
+
+    groups: dict[pathlib.PurePath, list[Entry]] = {}
+    for e in entries:
+        if any(e.name.is_relative_to(d) for d in pinned):
+            continue
+        key = pathlib.PurePath(e.name.parts[0]) if by_tag else e.name
+        groups.setdefault(key, []).append(e)
+
+    evict: list[Entry] = []
+    for group in sorted(groups.values(), key=lambda g: max(e.atime for e in g)):
+        if total <= quota:
+            break
+        evict += group
+        total -= sum(e.size for e in group)
+    if total > quota:
+        log.warning("Pinned files exceed the quota by %d bytes", total - quota)
+    return evict
+
+
+def evict(root: pathlib.Path, staged: manifest.Manifest, entries: list[Entry]) -> None:
+    """Delete files and remove the empty directories.
+
+    Args:
+        root (Path): Top directory of the staged files
+        staged (Manifest): Manifest of the staged files
+        entries (list[Entry]): Files to be deleted
+    """
+    for e in entries:
+        log.info("Evicting %s", e.name)
+        (root / e.name).unlink(missing_ok=True)
+        staged.remove(e.name)
+        directory = (root / e.name).parent
+        while directory != root and not any(directory.iterdir()):
+            os.rmdir(directory)
+            directory = directory.parent
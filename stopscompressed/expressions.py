@@ -0,0 +1,124 @@
+"""Compiled functions for the expressions of Define and Filter.
+
+An expression passed as string to Define or Filter is jitted for every
+dataframe, i.e. for every sample, even if the same string was compiled
+before. Here each expression is declared once per process as a typed C++
+function of the columns it references, the dataframe then only jits the
+call. Values, which differ between the samples, like the luminosity, are
+defined as constant columns by a compiled helper instead of being
+formatted into the expression, so that the expression is the same for all
+samples and the function is shared.
+
+The declarations are guarded by a macro named after the hash of the
+function, declaring it again is cheap. No state is kept in Python, which
+would not survive the pickling of the analysis for the workers.
+"""
+import hashlib
+import logging
+from stopscompressed import columns
+from typing import Any
+
+import ROOT
+
+DataFrame = Any
+
+log = logging.getLogger(__name__)
+
+CONSTANT = """
+#ifndef EXPRESSIONS_DEFINE_CONSTANT
+#define EXPRESSIONS_DEFINE_CONSTANT
+#include <ROOT/RDataFrame.hxx>
+#include <string>
+ROOT::RDF::RNode define_constant(ROOT::RDF::RNode df, const std::string& column,
+                                 double value) {
+  return df.Define(column, [value] { return value; }, {});
+}
+#endif
+"""
+
+
+def declare(df: DataFrame, expression: str) -> tuple[str, list[str]]:
+    """Declare the function of an expression.
+
+    Args:
+        df (DataFrame): Dataframe providing the columns
+        expression (str): C++ expression
+
+    Returns:
+        tuple[str, list[str]]: Name of the function and its column arguments
+    """
+    names = columns.identifiers(expression)
+    args = sorted(names.intersection(str(c) for c in df.GetColumnNames()))
+    signature = [f"const {df.GetColumnType(c)}& {c}" for c in args]
+    body = (
+        f"({', '.join(signature)}) {{\n"
+        f"    using namespace ROOT::VecOps;\n"
+        f"    return {expression};\n"
+        f"}}\n"
+    )
+    name = f"expr_{hashlib.sha1(body.encode()).hexdigest()[:16]}"
+    guard = name.upper()
+    code = f"#ifndef {guard}\n#define {guard}\nauto {name}{body}#endif\n"
+    if not ROOT.gInterpreter.Declare(code):
+        raise RuntimeError(f"Cannot compile {expression}")
+    return name, args
+
+
+def call(df: DataFrame, expression: str) -> str:
+    """Call of the function of an expression, as passed to Define or Filter.
+
+    Args:
+        df (DataFrame): Dataframe providing the columns
+        expression (str): C++ expression
+
+    Returns:
+        str: Function call
+    """
+    name, args = declare(df, expression)
+    log.debug("%s: %s", name, expression)
+    return f"{name}({', '.join(args)})"
+
+
+def define(df: DataFrame, column: str, expression: str) -> DataFrame:
+    """Define a column from a compiled expression.
+
+    Args:
+        df (DataFrame): Dataframe
+        column (str): Name of the new column
+        expression (str): C++ expression
+
+    Returns:
+        DataFrame: Dataframe with the new column
+    """
+    return df.Define(column, call(df, expression))
+
+
+def cut(df: DataFrame, expression: str) -> DataFrame:
+    """Filter on a compiled expression.
+
+    Args:
+        df (DataFrame): Dataframe
+        expression (str): C++ boolean expression
+
+    Returns:
+        DataFrame: Filtered dataframe
+    """
+    return df.Filter(call(df, expression))
+
+
+def constant(df: DataFrame, column: str, value: float) -> DataFrame:
+    """Define a column with the same value for all events.
+
+    The value is captured by a compiled lambda, nothing is jitted.
+
+    Args:
+        df (DataFrame): Dataframe
+        column (str): Name of the new column
+        value (float): Value of the column
+
+    Returns:
+        DataFrame: Dataframe with the new column
+    """
+    if not ROOT.gInterpreter.Declare(CONSTANT):
+        raise RuntimeError("Cannot compile define_constant")
+    return ROOT.define_constant(ROOT.RDF.AsRNode(df), column, float(value))
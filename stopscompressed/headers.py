@@ -0,0 +1,82 @@
+"""Analysis headers compiled once into a shared library.
+
+Instead of parsing the headers with the interpreter on every worker, they
+are compiled with ACLiC into a library. The library is keyed by a hash of
+the headers, the include directories, the libraries linked and the ROOT
+version, so that a changed header results in a new library. The first
+worker builds it under a file lock, the others only load it.
+
+Headers included by the listed headers are not part of the hash, they
+are expected to change only with the libraries.
+"""
+import fcntl
+import hashlib
+import logging
+import os
+import pathlib
+
+import ROOT
+
+log = logging.getLogger(__name__)
+
+BUILD_DIR = pathlib.Path(__file__).absolute().parent.parent / "build"
+
+
+def key(
+    headers: list[pathlib.Path],
+    include_dirs: list[pathlib.Path],
+    libraries: list[pathlib.Path],
+) -> str:
+    """Hash of headers, include directories, libraries and ROOT version."""
+    sha = hashlib.sha1(str(ROOT.gROOT.GetVersion()).encode())
+    for header in headers:
+        sha.update(str(header).encode())
+        sha.update(header.read_bytes())
+    for include_dir in include_dirs:
+        sha.update(str(include_dir).encode())
+    for library in libraries:
+        st = os.stat(library)
+        sha.update(f"{library}:{st.st_size}:{st.st_mtime_ns}".encode())
+    return sha.hexdigest()[:16]
+
+
+def load(
+    name: str,
+    headers: list[pathlib.Path],
+    include_dirs: list[pathlib.Path] | None = None,
+    libraries: list[pathlib.Path] | None = None,
+    build_dir: pathlib.Path = BUILD_DIR,
+) -> None:
+    """Load the headers as compiled library, building it if required.
+
+    Args:
+        name (str): Name of the library
+        headers (list[Path]): Headers in the order of inclusion
+        include_dirs (list[Path] | None): Additional include directories
+        libraries (list[Path] | None): Libraries used by the headers
+        build_dir (Path): Directory for the libraries
+    """
+    include_dirs = include_dirs or []
+    libraries = libraries or []
+    for include_dir in include_dirs:
+        ROOT.gInterpreter.AddIncludePath(str(include_dir))
+        ROOT.gSystem.AddIncludePath(f"-I{include_dir}")
+    for library in libraries:
+        if ROOT.gSystem.Load(str(library)) < 0:
+            raise RuntimeError(f"Cannot load {library}")
+        ROOT.gSystem.AddLinkedLibs(str(library))
+
+    directory = build_dir / f"{name}_{key(headers, include_dirs, libraries)}"
+    directory.mkdir(parents=True, exist_ok=True)
+    source = directory / f"{name}.h"
+    library = directory / f"lib{name}.so"
+    # the workers start at the same time, the first one builds the library
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not source.exists():
+            source.write_text("".join(f'#include "{h}"\n' for h in headers))
+        if not library.exists():
+            log.info("Compiling %s", library)
+        # ACLiC only loads the library, if it is up to date
+        if not ROOT.gSystem.CompileMacro(str(source), "kO", str(library)):
+            raise RuntimeError(f"Cannot compile {source}")
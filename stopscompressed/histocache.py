@@ -0,0 +1,107 @@
+"""Cache of the histograms filled per input file.
+
+For each input file a ROOT file holds its partial histograms. The file is
+keyed by the input path, its size and modification time and a fingerprint
+of the analysis. Inside, each histogram is stored under the hash of its
+definition, so that only new or changed histograms have to be filled.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+from mrtools import model
+from stopscompressed import histos
+
+import ROOT
+
+log = logging.getLogger(__name__)
+
+
+class HistoCache:
+    """Partial histograms per input file."""
+
+    directory: pathlib.Path
+
+    def __init__(self, directory: pathlib.Path) -> None:
+        """Init histogram cache.
+
+        Args:
+            directory (Path): Directory for the cache files
+        """
+        self.directory = directory
+
+    def path(self, sample: model.Sample, path: str, fingerprint: str) -> pathlib.Path:
+        """Cache file for an input file.
+
+        Args:
+            sample (Sample): Sample of the file
+            path (str): Input file
+            fingerprint (str): Fingerprint of the analysis
+        """
+        sha = hashlib.sha1()
+        sha.update(path.encode())
+        if os.path.exists(path):
+            stat = os.stat(path)
+            sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        sha.update(fingerprint.encode())
+        stem = pathlib.PurePath(path).stem
+        return self.directory / sample.name / f"{stem}_{sha.hexdigest()[:16]}.root"
+
+    def load(
+        self,
+        sample: model.Sample,
+        path: str,
+        fingerprint: str,
+        definitions: list[histos.Definition],
+    ) -> dict[str, histos.Histo]:
+        """Cached histograms of an input file.
+
+        Args:
+            sample (Sample): Sample of the file
+            path (str): Input file
+            fingerprint (str): Fingerprint of the analysis
+            definitions (list[Definition]): Histogram definitions
+
+        Returns:
+            dict[str, Histo]: Histograms found in the cache by name
+        """
+        cache_path = self.path(sample, path, fingerprint)
+        if not cache_path.exists():
+            return {}
+
+        found: dict[str, histos.Histo] = {}
+        cache_file = ROOT.TFile(str(cache_path), "READ")
+        for definition in definitions:
+            histo = cache_file.Get(histos.digest(definition))
+            if histo:
+                histo.SetDirectory(ROOT.nullptr)
+                histo.SetName(definition["name"])
+                found[definition["name"]] = histo
+        cache_file.Close()
+        log.debug("Found %d histograms for %s", len(found), path)
+        return found
+
+    def store(
+        self,
+        sample: model.Sample,
+        path: str,
+        fingerprint: str,
+        definitions: list[histos.Definition],
+        filled: dict[str, histos.Histo],
+    ) -> None:
+        """Add histograms of an input file to the cache.
+
+        Args:
+            sample (Sample): Sample of the file
+            path (str): Input file
+            fingerprint (str): Fingerprint of the analysis
+            definitions (list[Definition]): Histogram definitions
+            filled (dict[str, Histo]): Histograms by name
+        """
+        cache_path = self.path(sample, path, fingerprint)
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        cache_file = ROOT.TFile(str(cache_path), "UPDATE")
+        for definition in definitions:
+            if (histo := filled.get(definition["name"])) is not None:
+                cache_file.WriteObject(histo, histos.digest(definition), "Overwrite")
+        cache_file.Close()
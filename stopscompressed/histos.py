@@ -0,0 +1,190 @@
+"""Histograms from the yaml definitions.
+
+The definitions are flattened into one dict per histogram, containing the
+type of the histogram, the dataframe and the weight of the enclosing entry.
+"""
+import array
+import hashlib
+import json
+import logging
+import pathlib
+from mrtools import model
+from stopscompressed import expressions
+from typing import Any
+
+import ROOT
+import ruamel.yaml
+
+DataFrame = Any
+Histo = Any
+Definition = dict[str, Any]
+
+log = logging.getLogger(__name__)
+
+HISTO_TYPES = ("Histo1D", "Histo2D", "Profile1D")
+
+
+def load(histos_file: pathlib.Path) -> list[Definition]:
+    """Read the histogram definitions.
+
+    Args:
+        histos_file (Path): Yaml file with histogram definitions
+
+    Returns:
+        list[Definition]: One definition per histogram
+    """
+    yaml = ruamel.yaml.YAML(typ="safe")
+    with open(histos_file, "r") as inp:
+        entries = yaml.load(inp)
+
+    definitions: list[Definition] = []
+    for entry in entries:
+        for histo_type in HISTO_TYPES:
+            for histo in entry.get(histo_type) or []:
+                definitions.append(
+                    {
+                        "type": histo_type,
+                        "dataframe": entry["dataframe"],
+                        "weight": entry.get("weight"),
+                        "data_samples": entry.get("data_samples"),
+                        "signal_samples": entry.get("signal_samples"),
+                        **histo,
+                    }
+                )
+    return definitions
+
+
+def _sample_names(value: Any, parts: tuple[str, ...]) -> list[str] | None:
+    """Sample names of data_samples or signal_samples, None if not given.
+
+    The names can be given per period, with a default for the other periods.
+    """
+    if isinstance(value, dict):
+        value = next((v for k, v in value.items() if k in parts), value.get("default"))
+    if value is None:
+        return None
+    return [value] if isinstance(value, str) else list(value)
+
+
+def for_sample(definitions: list[Definition], sample: model.Sample) -> list[Definition]:
+    """Definitions of the histograms filled for a sample.
+
+    Data and signal samples are restricted to the data_samples and
+    signal_samples of the dataframe, if given. A sample is selected by its
+    own name or by the name of a group it belongs to.
+
+    Args:
+        definitions (list[Definition]): Histogram definitions
+        sample (Sample): The sample to be analysed
+
+    Returns:
+        list[Definition]: Definitions for the sample
+    """
+    if sample.type == model.SampleType.DATA:
+        key = "data_samples"
+    elif sample.type == model.SampleType.SIGNAL:
+        key = "signal_samples"
+    else:
+        return definitions
+    parts = sample.path.parts
+    selected = []
+    for definition in definitions:
+        names = _sample_names(definition.get(key), parts)
+        if names is None or sample.name in names or set(names) & set(parts):
+            selected.append(definition)
+    return selected
+
+
+def digest(definition: Definition) -> str:
+    """Hash of a histogram definition."""
+    text = json.dumps(definition, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+def _column(df: DataFrame, columns: set[str], column: str, expr: str) -> Any:
+    """Define a column for an expression, if it is not a column already."""
+    if expr in columns:
+        return df, expr
+    return expressions.define(df, column, expr), column
+
+
+def _model(definition: Definition) -> Any:
+    """Histogram model from the binning."""
+    name = definition["name"]
+    title = definition.get("title", name)
+    histo_type = definition["type"]
+    if histo_type == "Histo2D":
+        return ROOT.RDF.TH2DModel(name, title, *definition["bins"])
+    if "varbins" in definition:
+        edges = array.array("d", definition["varbins"])
+        bins = (len(edges) - 1, edges)
+    else:
+        bins = tuple(definition["bins"])
+    if histo_type == "Profile1D":
+        return ROOT.RDF.TProfile1DModel(name, title, *bins)
+    return ROOT.RDF.TH1DModel(name, title, *bins)
+
+
+def book(dfs: dict[str, DataFrame], definitions: list[Definition]) -> dict[str, Any]:
+    """Book the histograms on the dataframes.
+
+    Args:
+        dfs (dict[str, DataFrame]): Dataframes by name
+        definitions (list[Definition]): Histogram definitions
+
+    Returns:
+        dict[str, RResultPtr]: Booked histograms by name
+    """
+    all_columns = {n: set(str(c) for c in df.GetColumnNames()) for n, df in dfs.items()}
+    results: dict[str, Any] = {}
+    for definition in definitions:
+        name = definition["name"]
+        df = dfs[definition["dataframe"]]
+        columns = all_columns[definition["dataframe"]]
+        if when := definition.get("when"):
+            df = expressions.cut(df, when)
+
+        if definition["type"] == "Histo1D":
+            df, var = _column(df, columns, f"_{name}_var", definition.get("var", name))
+            variables = [var]
+        else:
+            variables = []
+            for key in ("var1", "var2"):
+                df, var = _column(df, columns, f"_{name}_{key}", definition[key])
+                variables.append(var)
+        if weight := definition.get("weight"):
+            variables.append(weight)
+
+        log.debug("Booking %s %s(%s)", definition["type"], name, ", ".join(variables))
+        results[name] = getattr(df, definition["type"])(_model(definition), *variables)
+
+    return results
+
+
+def values(results: dict[str, Any]) -> dict[str, Histo]:
+    """Histograms detached from the dataframes."""
+    histos: dict[str, Histo] = {}
+    for name, result in results.items():
+        histo = result.GetValue().Clone(name)
+        histo.SetDirectory(ROOT.nullptr)
+        histos[name] = histo
+    return histos
+
+
+def merge(results: list[dict[str, Histo]]) -> dict[str, Histo]:
+    """Add histograms with the same name."""
+    merged: dict[str, Histo] = {}
+    for histos in results:
+        for name, histo in histos.items():
+            if name in merged:
+                merged[name].Add(histo)
+            else:
+                merged[name] = histo.Clone(name)
+                merged[name].SetDirectory(ROOT.nullptr)
+    return merged
+
+
+def write(directory: Any, histos: dict[str, Histo]) -> None:
+    """Write histograms to a directory."""
+    for name, histo in histos.items():
+        directory.WriteObject(histo, name)
@@ -0,0 +1,99 @@
+"""Binning of the lepton scale factors.
+
+The C++ evaluators in leptonsf_inc.h flatten the corrections into tables.
+Correctionlib does not expose the bin edges in C++, therefore they are read
+here from the json files and passed as vectors to the evaluators.
+"""
+import gzip
+import json
+import logging
+import pathlib
+from typing import Any
+
+import ROOT
+
+DataFrame = Any
+
+log = logging.getLogger(__name__)
+
+
+def _edges(edges: Any) -> list[float]:
+    """Edges of a non-uniform or uniform binning."""
+    if isinstance(edges, dict):
+        width = (edges["high"] - edges["low"]) / edges["n"]
+        return [edges["low"] + i * width for i in range(edges["n"] + 1)]
+    return [float(e) for e in edges]
+
+
+def sf_edges(
+    cset_file: str | pathlib.Path, correction: str, keys: list[str]
+) -> tuple[list[float], list[float]]:
+    """Eta and pt edges of a scale factor correction.
+
+    Args:
+        cset_file (str | Path): Correctionlib json file, possibly gzipped
+        correction (str): Name of the correction
+        keys (list[str]): Values of the string inputs in order
+
+    Returns:
+        tuple[list[float], list[float]]: edges in (abs) eta and pt
+    """
+    opener = gzip.open if str(cset_file).endswith(".gz") else open
+    with opener(cset_file, "rt") as inp:
+        cset = json.load(inp)
+
+    corr = next(c for c in cset["corrections"] if c["name"] == correction)
+    string_inputs = [v["name"] for v in corr["inputs"] if v["type"] == "string"]
+    values = dict(zip(string_inputs, keys))
+
+    edges: dict[str, list[float]] = {}
+    node = corr["data"]
+    while isinstance(node, dict):
+        nodetype = node.get("nodetype")
+        if nodetype == "category":
+            key = values[node["input"]]
+            node = next(
+                (i["value"] for i in node["content"] if i["key"] == key),
+                node.get("default"),
+            )
+        elif nodetype == "multibinning":
+            for name, axis in zip(node["inputs"], node["edges"]):
+                edges[name] = _edges(axis)
+            node = node["content"][0]
+        elif nodetype == "binning":
+            # nested binnings are assumed to share the same edges
+            edges[node["input"]] = _edges(node["edges"])
+            node = node["content"][0]
+        else:
+            break
+
+    eta_edges = next((e for n, e in edges.items() if "eta" in n), None)
+    pt_edges = edges.get("pt")
+    if eta_edges is None or pt_edges is None:
+        raise ValueError(f"No eta/pt binning for {correction} in {cset_file}")
+
+    log.debug("%s %s: eta %s, pt %s", correction, keys, eta_edges, pt_edges)
+    return eta_edges, pt_edges
+
+
+def vector(values: list[float]) -> Any:
+    """std::vector of doubles, infinite edges of open bins are kept."""
+    return ROOT.std.vector["double"](values)
+
+
+def define_sf(
+    df: DataFrame, column: str, sf: Any, pt: str, eta: str
+) -> DataFrame:
+    """Define a column of scale factors without jitting.
+
+    Args:
+        df (DataFrame): Dataframe
+        column (str): Name of the new column
+        sf (BinnedSF): Scale factor object from the registry in leptonsf_inc.h
+        pt (str): Column of the lepton pt
+        eta (str): Column of the lepton eta
+
+    Returns:
+        DataFrame: Dataframe with the new column
+    """
+    return ROOT.define_sf(ROOT.RDF.AsRNode(df), column, sf, pt, eta)
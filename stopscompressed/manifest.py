@@ -0,0 +1,131 @@
+"""Manifest of the staged files.
+
+The adler32 checksums of the local files are stored in a SQLite database
+in the scratch tree, keyed by the relative path. A checksum is valid as
+long as size and modification time of the file are unchanged. The analyses
+record the last access of the files they read, which is used to evict the
+least recently used files.
+"""
+import logging
+import os
+import pathlib
+import sqlite3
+import time
+import zlib
+
+log = logging.getLogger(__name__)
+
+MANIFEST_NAME = ".manifest.db"
+
+BLOCK_SIZE = 4 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    name TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime INTEGER,
+    adler32 TEXT
+);
+CREATE TABLE IF NOT EXISTS access (
+    name TEXT PRIMARY KEY,
+    atime INTEGER
+);
+"""
+
+
+def adler32(path: pathlib.Path) -> str:
+    """Adler32 checksum of a file, formatted as by xrdadler32."""
+    value = 1
+    with open(path, "rb") as inp:
+        while block := inp.read(BLOCK_SIZE):
+            value = zlib.adler32(block, value)
+    return f"{value:08x}"
+
+
+class Manifest:
+    """Checksums of the files in a directory tree."""
+
+    root: pathlib.Path
+    con: sqlite3.Connection
+
+    def __init__(self, root: pathlib.Path) -> None:
+        """Open the manifest.
+
+        Args:
+            root (Path): Top directory of the files
+        """
+        self.root = root
+        root.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(root / MANIFEST_NAME, timeout=60)
+        self.con.executescript(SCHEMA)
+
+    def __enter__(self) -> "Manifest":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Commit and close the database."""
+        self.con.commit()
+        self.con.close()
+
+    def checksum(self, name: pathlib.PurePath) -> str | None:
+        """Stored checksum of a file, if the file is unchanged.
+
+        Args:
+            name (PurePath): Path relative to the top directory
+
+        Returns:
+            str | None: adler32 checksum
+        """
+        try:
+            st = os.stat(self.root / name)
+        except FileNotFoundError:
+            return None
+        row = self.con.execute(
+            "SELECT size, mtime, adler32 FROM files WHERE name = ?", (str(name),)
+        ).fetchone()
+        if row is None or (row[0], row[1]) != (st.st_size, st.st_mtime_ns):
+            return None
+        return row[2]
+
+    def store(self, name: pathlib.PurePath, checksum: str) -> None:
+        """Store the checksum of a file with its current size and mtime.
+
+        Args:
+            name (PurePath): Path relative to the top directory
+            checksum (str): adler32 checksum
+        """
+        st = os.stat(self.root / name)
+        self.con.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (str(name), st.st_size, st.st_mtime_ns, checksum),
+        )
+        self.con.commit()
+
+    def remove(self, name: pathlib.PurePath) -> None:
+        """Remove a file from the manifest."""
+        self.con.execute("DELETE FROM files WHERE name = ?", (str(name),))
+        self.con.execute("DELETE FROM access WHERE name = ?", (str(name),))
+        self.con.commit()
+
+    def touch(self, names: list[pathlib.PurePath]) -> None:
+        """Record the access of files.
+
+        Args:
+            names (list[PurePath]): Paths relative to the top directory
+        """
+        atime = time.time_ns()
+        self.con.executemany(
+            "INSERT OR REPLACE INTO access VALUES (?, ?)",
+            [(str(n), atime) for n in names],
+        )
+        self.con.commit()
+
+    def accessed(self) -> dict[pathlib.PurePath, int]:
+        """Last recorded access of the files in ns."""
+        return {
+            pathlib.PurePath(name): atime
+            for name, atime in self.con.execute("SELECT name, atime FROM access")
+        }
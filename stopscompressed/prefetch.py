@@ -0,0 +1,115 @@
+"""Prefetching of the input files to the scratch tree.
+
+Samples can be processed before they are staged. While a file is processed,
+the next files of the task are copied to scratch in background threads.
+Files found on scratch are read from there, files which could not be copied
+are read directly from EOS. The copies are placed in the layout of stage.py,
+so that they are staged for later runs as well.
+"""
+import asyncio
+import concurrent.futures
+import logging
+import os
+import pathlib
+import threading
+from stopscompressed import transport
+from typing import Iterator
+
+log = logging.getLogger(__name__)
+
+# Top directory of the ntuples, both on EOS and on scratch
+NANOTUPLES = "nanoTuples"
+
+
+def relative(path: str) -> pathlib.PurePath | None:
+    """Path of an input file relative to the ntuples directory."""
+    _, sep, name = path.partition(f"/{NANOTUPLES}/")
+    return pathlib.PurePath(name) if sep else None
+
+
+class Prefetcher:
+    """Copy the next input files of a task to scratch."""
+
+    depth: int
+    scratch: pathlib.Path
+    url: str
+    path: pathlib.PurePath
+
+    def __init__(
+        self,
+        depth: int,
+        scratch: pathlib.Path = transport.SCRATCH_PATH,
+        url: str = transport.EOS_URL,
+        path: pathlib.PurePath = transport.EOS_PATH,
+    ) -> None:
+        """Init prefetcher.
+
+        Args:
+            depth (int): Number of files copied ahead
+            scratch (Path): Top directory of the staged files
+            url (str): URL of the EOS server
+            path (PurePath): Top directory of the files on EOS
+        """
+        self.depth = depth
+        self.scratch = scratch
+        self.url = url
+        self.path = path
+
+    def copy(self, name: pathlib.PurePath) -> bool:
+        """Copy a file to scratch.
+
+        The file is copied to a temporary name first, so that a partial copy
+        is never read.
+
+        Args:
+            name (PurePath): Path relative to the ntuples directory
+
+        Returns:
+            bool: True on success
+        """
+        target = self.scratch / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_name(f"{target.name}.{os.getpid()}.{threading.get_ident()}")
+        remote = transport.XRootDTransport(self.url, self.path)
+        try:
+            if asyncio.run(remote.copy(name, tmp)):
+                os.replace(tmp, target)
+                return True
+        except Exception as e:
+            log.error("Exception %s prefetching %s", e, name)
+        tmp.unlink(missing_ok=True)
+        return False
+
+    def files(self, files: list[str]) -> Iterator[str]:
+        """Input files in order, prefetching the following files.
+
+        Args:
+            files (list[str]): Input files, local or on EOS
+
+        Yields:
+            str: Local file if staged or prefetched, the file on EOS otherwise
+        """
+        names = [relative(f) for f in files]
+        pending: dict[pathlib.PurePath, concurrent.futures.Future] = {}
+        with concurrent.futures.ThreadPoolExecutor(max(self.depth, 1)) as pool:
+            for i, (path, name) in enumerate(zip(files, names)):
+                for ahead in names[i + 1 : i + 1 + self.depth]:
+                    if (
+                        ahead is not None
+                        and ahead not in pending
+                        and not (self.scratch / ahead).exists()
+                    ):
+                        pending[ahead] = pool.submit(self.copy, ahead)
+
+                if name is None:
+                    yield path
+                    continue
+                # a copy in flight is faster than reading the file again
+                if (future := pending.pop(name, None)) is not None:
+                    future.result()
+                if (self.scratch / name).exists():
+                    log.debug("Reading %s from scratch", name)
+                    yield str(self.scratch / name)
+                else:
+                    log.info("Prefetch miss, reading %s from EOS", name)
+                    yield path if "://" in path else f"{self.url}/{self.path / name}"
@@ -0,0 +1,30 @@
+"""Reduction of results on the dask cluster."""
+from typing import Any
+from typing import Callable
+
+import dask.distributed as dd
+
+
+def tree_reduce(
+    client: dd.Client,
+    func: Callable[[list[Any]], Any],
+    futures: list[dd.Future],
+    width: int = 2,
+) -> dd.Future:
+    """Reduce results in a tree of tasks.
+
+    Args:
+        client (Client): Dask client
+        func (Callable): Reduces a list of results to one result
+        futures (list[Future]): Results to be reduced, not empty
+        width (int): Number of results reduced per task
+
+    Returns:
+        Future: The reduced result
+    """
+    while len(futures) > 1:
+        futures = [
+            client.submit(func, futures[i : i + width], pure=False)
+            for i in range(0, len(futures), width)
+        ]
+    return futures[0]
@@ -0,0 +1,240 @@
+"""Scheduling of file transfers with adaptive concurrency.
+
+The number of concurrent transfers is adjusted from the measured throughput
+and error rate: after each window of completed transfers the limit is
+increased by one as long as the aggregate throughput improves, decreased by
+one if it drops, and halved if too many transfers failed. An optional
+bandwidth cap is enforced by a token bucket on the transfer sizes.
+"""
+import asyncio
+import dataclasses
+import logging
+import sys
+import time
+from typing import Awaitable, Callable
+
+log = logging.getLogger(__name__)
+
+ORDERS = ["none", "largest", "smallest"]
+
+MAX_ERROR_RATE = 0.25
+# minimal number of transfers to measure the throughput
+MIN_WINDOW = 4
+# relative change of the throughput taken as significant
+THROUGHPUT_STEP = 0.05
+REPORT_INTERVAL = 10.0
+
+
+@dataclasses.dataclass
+class Transfer:
+    """A file transfer, copy returns True on success."""
+
+    name: str
+    size: int
+    copy: Callable[[], Awaitable[bool]]
+
+
+def order(transfers: list[Transfer], how: str) -> list[Transfer]:
+    """Order transfers by size.
+
+    Args:
+        transfers (list[Transfer]): The transfers
+        how (str): none, largest or smallest (first)
+
+    Returns:
+        list[Transfer]: Ordered transfers
+    """
+    if how == "largest":
+        return sorted(transfers, key=lambda t: t.size, reverse=True)
+    if how == "smallest":
+        return sorted(transfers, key=lambda t: t.size)
+    return list(transfers)
+
+
+def format_bytes(value: float) -> str:
+    """Format a number of bytes."""
+    for unit in ["B", "kB", "MB", "GB"]:
+        if value < 1000:
+            return f"{value:.1f} {unit}"
+        value /= 1000
+    return f"{value:.1f} TB"
+
+
+def format_time(seconds: float) -> str:
+    """Format a duration as h:mm:ss."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02}:{seconds:02}"
+
+
+class Scheduler:
+    """Run transfers with an adaptive limit on the concurrency."""
+
+    limit: int
+    minimum: int
+    maximum: int
+    bandwidth: float | None
+
+    def __init__(
+        self,
+        maximum: int,
+        minimum: int = 1,
+        initial: int = 2,
+        bandwidth: float | None = None,
+    ) -> None:
+        """Init scheduler.
+
+        Args:
+            maximum (int): Maximal number of concurrent transfers
+            minimum (int): Minimal number of concurrent transfers
+            initial (int): Initial number of concurrent transfers
+            bandwidth (float | None): Cap on the aggregate rate in bytes/s
+        """
+        self.minimum = minimum
+        self.maximum = max(maximum, minimum)
+        self.limit = min(max(initial, minimum), self.maximum)
+        self.bandwidth = bandwidth
+
+        self._active = 0
+        self._slot = asyncio.Condition()
+        self._tokens = 0.0
+        self._tokens_time = time.monotonic()
+
+        self._window: list[tuple[int, bool]] = []
+        self._window_start = time.monotonic()
+        self._throughput: float | None = None
+
+        self._start = time.monotonic()
+        self._total_files = 0
+        self._total_bytes = 0
+        self._done_files = 0
+        self._done_bytes = 0
+        self._failed = 0
+        self._failed_bytes = 0
+
+    async def run(self, transfers: list[Transfer]) -> int:
+        """Run the transfers in the given order.
+
+        Args:
+            transfers (list[Transfer]): The transfers
+
+        Returns:
+            int: Number of failed transfers
+        """
+        self._start = self._window_start = time.monotonic()
+        self._total_files = len(transfers)
+        self._total_bytes = sum(t.size for t in transfers)
+
+        reporter = asyncio.create_task(self._report())
+        tasks = []
+        try:
+            for transfer in transfers:
+                await self._reserve_bandwidth(transfer.size)
+                await self._acquire()
+                tasks.append(asyncio.create_task(self._run(transfer)))
+            await asyncio.gather(*tasks)
+        finally:
+            reporter.cancel()
+            self._print_status(final=True)
+        return self._failed
+
+    async def _run(self, transfer: Transfer) -> None:
+        """Run a single transfer."""
+        ok = False
+        try:
+            ok = await transfer.copy()
+        except Exception as e:
+            log.error("Exception %s transferring %s", e, transfer.name)
+        finally:
+            await self._release(transfer.size, ok)
+
+    async def _reserve_bandwidth(self, size: int) -> None:
+        """Wait until the transfer fits into the bandwidth cap."""
+        if self.bandwidth is None:
+            return
+        now = time.monotonic()
+        # allow a burst of one second
+        self._tokens = min(
+            self._tokens + (now - self._tokens_time) * self.bandwidth, self.bandwidth
+        )
+        self._tokens_time = now
+        self._tokens -= size
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.bandwidth)
+
+    async def _acquire(self) -> None:
+        """Wait for a free transfer slot."""
+        async with self._slot:
+            await self._slot.wait_for(lambda: self._active < self.limit)
+            self._active += 1
+
+    async def _release(self, size: int, ok: bool) -> None:
+        """Free a transfer slot and adapt the limit."""
+        async with self._slot:
+            self._active -= 1
+            self._done_files += 1
+            if ok:
+                self._done_bytes += size
+            else:
+                self._failed += 1
+                self._failed_bytes += size
+            self._window.append((size, ok))
+            if len(self._window) >= max(self.limit, MIN_WINDOW):
+                self._adapt()
+            self._slot.notify_all()
+
+    def _adapt(self) -> None:
+        """Adjust the limit from the last window of transfers."""
+        now = time.monotonic()
+        elapsed = max(now - self._window_start, 1e-6)
+        throughput = sum(s for s, ok in self._window if ok) / elapsed
+        error_rate = sum(not ok for _, ok in self._window) / len(self._window)
+
+        limit = self.limit
+        if error_rate > MAX_ERROR_RATE:
+            limit = limit // 2
+        elif self.bandwidth is not None and throughput >= 0.9 * self.bandwidth:
+            pass
+        elif self._throughput is None or throughput > self._throughput * (
+            1 + THROUGHPUT_STEP
+        ):
+            limit += 1
+        elif throughput < self._throughput * (1 - THROUGHPUT_STEP):
+            limit -= 1
+        limit = min(max(limit, self.minimum), self.maximum)
+
+        if limit != self.limit:
+            log.info(
+                "Concurrency %d -> %d (%s/s, %.0f%% errors)",
+                self.limit,
+                limit,
+                format_bytes(throughput),
+                100 * error_rate,
+            )
+        self.limit = limit
+        self._throughput = throughput
+        self._window = []
+        self._window_start = now
+
+    async def _report(self) -> None:
+        """Print the status periodically."""
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            self._print_status()
+
+    def _print_status(self, final: bool = False) -> None:
+        """Print aggregate rate and ETA."""
+        elapsed = max(time.monotonic() - self._start, 1e-6)
+        rate = self._done_bytes / elapsed
+        remaining = self._total_bytes - self._done_bytes - self._failed_bytes
+        eta = format_time(remaining / rate) if rate > 0 else "-"
+        line = (
+            f"{self._done_files}/{self._total_files} files, "
+            f"{format_bytes(self._done_bytes)}/{format_bytes(self._total_bytes)}, "
+            f"{format_bytes(rate)}/s, {self._active} active (limit {self.limit}), "
+            f"{self._failed} failed, ETA {eta}"
+        )
+        if sys.stderr.isatty():
+            print(f"\r{line}\033[K", end="\n" if final else "", file=sys.stderr)
+        else:
+            print(line, file=sys.stderr)
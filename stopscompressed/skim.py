@@ -0,0 +1,112 @@
+"""Cache of preselected events.
+
+For each input file the events passing the preselection are written with the
+required columns only to a local skim file. The skim is keyed by the sample,
+the input file and a hash of the selection and the columns, so that a change
+of any of them results in a new skim.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+from mrtools import model
+from typing import Any
+
+import ROOT
+
+DataFrame = Any
+
+log = logging.getLogger(__name__)
+
+TREE_NAME = "Events"
+
+
+def chain_files(chain: Any) -> list[str]:
+    """Names of the files of a TChain."""
+    return [str(e.GetTitle()) for e in chain.GetListOfFiles()]
+
+
+class SkimCache:
+    """Skims of the preselected events."""
+
+    directory: pathlib.Path
+    selection: str
+
+    def __init__(self, directory: pathlib.Path, selection: str) -> None:
+        """Init skim cache.
+
+        Args:
+            directory (Path): Directory for the skim files
+            selection (str): Preselection applied to the events
+        """
+        self.directory = directory
+        self.selection = selection
+
+    def key(self, path: str, columns: list[str]) -> str:
+        """Hash of input file, selection and columns.
+
+        Size and modification time are included for local files, so that
+        a restaged file leads to a new skim.
+
+        Args:
+            path (str): Input file
+            columns (list[str]): Columns to be written
+        """
+        sha = hashlib.sha1()
+        sha.update(path.encode())
+        if os.path.exists(path):
+            stat = os.stat(path)
+            sha.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+        sha.update(self.selection.encode())
+        sha.update(",".join(columns).encode())
+        return sha.hexdigest()[:16]
+
+    def skim_file(self, sample: model.Sample, path: str, columns: list[str]) -> str:
+        """Return the skim for an input file, creating it if required.
+
+        Args:
+            sample (Sample): Sample of the file
+            path (str): Input file
+            columns (list[str]): Columns to be written
+
+        Returns:
+            str: Path of the skim file
+        """
+        stem = pathlib.PurePath(path).stem
+        skim_path = (
+            self.directory / sample.name / f"{stem}_{self.key(path, columns)}.root"
+        )
+        if skim_path.exists():
+            log.debug("Using skim %s", skim_path)
+            return str(skim_path)
+
+        skim_path.parent.mkdir(parents=True, exist_ok=True)
+        df = ROOT.RDataFrame(TREE_NAME, path)
+        present = set(str(c) for c in df.GetColumnNames())
+        if missing := [c for c in columns if c not in present]:
+            log.debug("Columns missing in %s: %s", path, ", ".join(missing))
+
+        # write to a temporary file, as other workers might read the same skim
+        tmp_path = skim_path.with_suffix(f".{os.getpid()}.tmp")
+        log.info("Writing skim %s", skim_path)
+        df.Filter(self.selection).Snapshot(
+            TREE_NAME, str(tmp_path), [c for c in columns if c in present]
+        )
+        os.replace(tmp_path, skim_path)
+        return str(skim_path)
+
+    def source(
+        self, sample: model.Sample, files: list[str], columns: list[str]
+    ) -> DataFrame:
+        """Dataframe reading the skims of a sample.
+
+        Args:
+            sample (Sample): The sample to be analysed
+            files (list[str]): Input files
+            columns (list[str]): Columns to be written
+
+        Returns:
+            DataFrame: Dataframe of the skimmed events
+        """
+        skims = [self.skim_file(sample, f, columns) for f in files]
+        return ROOT.RDataFrame(TREE_NAME, skims)
@@ -0,0 +1,262 @@
+"""Stitching of inclusive and binned samples.
+
+Samples are stitched by the `stitch` attribute in the sample definitions.
+Inclusive samples give the group, the variable and the bin edges::
+
+    stitch: {group: DY_M50, variable: LHE_HT, edges: [70, 100, 200]}
+
+Binned samples give the group and their range, which is otherwise taken
+from the sample name (e.g. `_HT100to200`)::
+
+    stitch: {group: DY_M50, range: [100, 200]}
+
+Each sample is normalised to the full phase space. In every region of the
+variable the events of a sample are weighted with its share of the events
+of all samples covering that region, so that no region is counted twice.
+The counts are taken from the ntuples; the skim efficiency is assumed to be
+the same for all samples within a region.
+
+The weight column is multiplied with the factors by a helper compiled once
+per column types, the factors and edges are passed as arguments, so that
+nothing depending on the sample is jitted.
+"""
+import array
+import dataclasses
+import hashlib
+import logging
+import math
+import re
+from mrtools import analysis
+from mrtools import model
+from typing import Any
+
+import ROOT
+import dask.distributed as dd
+
+log = logging.getLogger(__name__)
+
+SMALL_MAX_FILES = 1
+
+DEFAULT_VARIABLE = "LHE_HT"
+
+RANGE = re.compile(r"_HT(\d+)to(\d+|Inf)")
+
+Counts = dict[str, dict[str, Any]]
+DataFrame = Any
+
+# Multiplies the weight with the factor of the region of the variable
+STITCH = """
+#ifndef {guard}
+#define {guard}
+#include <ROOT/RDataFrame.hxx>
+#include <algorithm>
+#include <string>
+#include <vector>
+ROOT::RDF::RNode {name}(ROOT::RDF::RNode df, const std::string& variable,
+                        std::vector<double> edges, std::vector<double> factors) {{
+  auto stitch = [edges, factors](const {weight}& weight, const {variable}& x) {{
+    const auto r = std::upper_bound(edges.begin(), edges.end(), x) - edges.begin();
+    return static_cast<{weight}>(weight * factors[r]);
+  }};
+  return df.Redefine("weight", stitch, {{"weight", variable}});
+}}
+#endif
+"""
+
+# Multiplies the weight with a single factor
+SCALE = """
+#ifndef {guard}
+#define {guard}
+#include <ROOT/RDataFrame.hxx>
+#include <string>
+#include <vector>
+ROOT::RDF::RNode {name}(ROOT::RDF::RNode df, const std::string&,
+                        std::vector<double>, std::vector<double> factors) {{
+  const double factor = factors.at(0);
+  auto scale = [factor](const {weight}& weight) {{
+    return static_cast<{weight}>(weight * factor);
+  }};
+  return df.Redefine("weight", scale, {{"weight"}});
+}}
+#endif
+"""
+
+
+@dataclasses.dataclass(frozen=True)
+class Weight:
+    """Stitching weight of a sample.
+
+    The factor of a region is used for values of the variable from the
+    lower edge of the region up to, not including, its upper edge. Binned
+    samples have a single factor and no variable.
+    """
+
+    factors: list[float]
+    variable: str | None = None
+    edges: list[float] = dataclasses.field(default_factory=list)
+
+    def __str__(self) -> str:
+        """Factors by region."""
+        if self.variable is None:
+            return repr(self.factors[0])
+        return f"{self.variable} {self.edges}: {self.factors}"
+
+
+def sample_range(sample: model.Sample, info: dict[str, Any]) -> tuple[float, float]:
+    """Range of a binned sample."""
+    if "range" in info:
+        low, high = info["range"]
+        return float(low), float(high)
+    if match := RANGE.search(sample.name):
+        return float(match[1]), float(match[2])
+    raise ValueError(f"No stitching range for {sample.name}")
+
+
+class StitchCounts(analysis.Analysis):
+    """Count the events of the stitched samples per region."""
+
+    small: bool
+    counts: Counts
+
+    def __init__(self, small: bool = False) -> None:
+        """Init stitch counts.
+
+        Args:
+            small (bool): reduce sample size for debugging
+        """
+        self.small = small
+        self.counts = {}
+
+    def map(self, sample: model.Sample) -> Counts:
+        """Count the events of a sample.
+
+        Inclusive samples are counted per region, including the regions
+        below and above the edges.
+
+        Args:
+            sample (Sample): The sample
+
+        Returns:
+            Counts: Counts by sample name, empty if the sample is not stitched
+        """
+        if not (info := sample.attrs.get("stitch")):
+            return {}
+
+        chain = sample.chain(SMALL_MAX_FILES) if self.small else sample.chain()
+        df = ROOT.RDataFrame(chain)
+        result: dict[str, Any] = {"group": info["group"]}
+        if "edges" in info:
+            edges = [float(e) for e in info["edges"]]
+            variable = info.get("variable", DEFAULT_VARIABLE)
+            histo_model = ROOT.RDF.TH1DModel(
+                "stitch", "", len(edges) - 1, array.array("d", edges)
+            )
+            h = df.Histo1D(histo_model, variable).GetValue()
+            result["variable"] = variable
+            result["edges"] = edges
+            result["counts"] = [h.GetBinContent(i) for i in range(len(edges) + 1)]
+        else:
+            result["range"] = sample_range(sample, info)
+            result["counts"] = df.Count().GetValue()
+        log.debug("Stitch counts %s: %s", sample.name, result)
+        return {sample.name: result}
+
+    def reduce(self, sample: model.SampleBase, results: list[Counts]) -> Counts:
+        """Combine the counts of the children of a SampleGroup."""
+        combined: Counts = {}
+        for r in results:
+            combined.update(r)
+        return combined
+
+    def gather(self, future_to_sample: dict[dd.Future, model.SampleBase]) -> None:
+        """Collect the counts of all samples."""
+        dd.wait(future_to_sample.keys())
+        for future in future_to_sample.keys():
+            self.counts.update(future.result())
+
+
+def _regions(edges: list[float]) -> list[tuple[float, float]]:
+    """Regions of an inclusive sample, including under- and overflow."""
+    bounds = [-math.inf] + edges + [math.inf]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def weights(counts: Counts) -> dict[str, Weight]:
+    """Stitching weights of the samples.
+
+    Args:
+        counts (Counts): Counts by sample name
+
+    Returns:
+        dict[str, Weight]: Weight by sample name
+    """
+    groups: dict[str, dict[str, dict[str, Any]]] = {}
+    for name, info in counts.items():
+        groups.setdefault(info["group"], {})[name] = info
+
+    result: dict[str, Weight] = {}
+    for group, samples in groups.items():
+        inclusive = {n: i for n, i in samples.items() if "edges" in i}
+        binned = {n: i for n, i in samples.items() if "range" in i}
+        if not inclusive:
+            log.warning("No inclusive sample for stitching group %s", group)
+            continue
+        variable = next(iter(inclusive.values()))["variable"]
+        edges = next(iter(inclusive.values()))["edges"]
+        regions = _regions(edges)
+
+        totals = [
+            sum(i["counts"][r] for i in inclusive.values())
+            for r in range(len(regions))
+        ]
+        for name, info in binned.items():
+            region = tuple(info["range"])
+            if region not in regions:
+                raise ValueError(f"Range {region} of {name} not in edges {edges}")
+            totals[regions.index(region)] += info["counts"]
+
+        def share(n: float, r: int) -> float:
+            return n / totals[r] if totals[r] > 0 else 0.0
+
+        for name, info in inclusive.items():
+            factors = [share(info["counts"][r], r) for r in range(len(regions))]
+            result[name] = Weight(factors, variable, edges)
+        for name, info in binned.items():
+            r = regions.index(tuple(info["range"]))
+            result[name] = Weight([share(info["counts"], r)])
+
+        log.info("Stitching group %s: %s", group, ", ".join(sorted(samples)))
+        for name in sorted(samples):
+            log.debug("Stitching weight %s: %s", name, result[name])
+
+    return result
+
+
+def apply(df: DataFrame, weight: Weight) -> DataFrame:
+    """Multiply the weight column with a stitching weight.
+
+    Args:
+        df (DataFrame): Dataframe
+        weight (Weight): Stitching weight of the sample
+
+    Returns:
+        DataFrame: Dataframe with the redefined weight
+    """
+    types = {"weight": str(df.GetColumnType("weight"))}
+    if weight.variable is None:
+        template = SCALE
+    else:
+        template = STITCH
+        types["variable"] = str(df.GetColumnType(weight.variable))
+    sha = hashlib.sha1(template.format(guard="", name="", **types).encode())
+    name = f"stitch_{sha.hexdigest()[:16]}"
+    code = template.format(guard=name.upper(), name=name, **types)
+    if not ROOT.gInterpreter.Declare(code):
+        raise RuntimeError(f"Cannot compile {name}")
+    vector = ROOT.std.vector["double"]
+    return getattr(ROOT, name)(
+        ROOT.RDF.AsRNode(df),
+        weight.variable or "",
+        vector(weight.edges),
+        vector(weight.factors),
+    )
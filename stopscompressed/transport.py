@@ -0,0 +1,176 @@
+"""Transports of the ntuple files to the scratch tree.
+
+A transport provides checksum, size and copy of the remote files. The
+xrootd transport wraps the xrootd command line tools. The local transport
+uses a directory as stand-in for the remote storage, so that staging can be
+tested and benchmarked without EOS.
+"""
+import abc
+import asyncio
+import concurrent.futures
+import logging
+import os
+import pathlib
+import shutil
+from stopscompressed import manifest
+
+log = logging.getLogger(__name__)
+
+EOS_URL = "root://eos.grid.vbc.ac.at"
+EOS_PATH = pathlib.PurePath(
+    "/eos/vbc/experiments/cms/store/user/liko/StopsCompressed/nanoTuples"
+)
+SCRATCH_PATH = pathlib.Path(
+    "/scratch-cbe/users/dietrich.liko/StopsCompressed/nanoTuples"
+)
+
+XRD_BIN = pathlib.Path(
+    "/groups/hephy/cms/dietrich.liko/conda/envs/mrt-root626-py310/bin"
+)
+
+
+class Transport(abc.ABC):
+    """Access to the remote files."""
+
+    @abc.abstractmethod
+    async def checksum(self, name: pathlib.PurePath) -> str:
+        """Adler32 checksum of a remote file."""
+
+    @abc.abstractmethod
+    async def size(self, name: pathlib.PurePath) -> int:
+        """Size of a remote file."""
+
+    @abc.abstractmethod
+    async def copy(self, name: pathlib.PurePath, target: pathlib.Path) -> bool:
+        """Copy a remote file and verify its checksum.
+
+        Args:
+            name (PurePath): Path relative to the remote top directory
+            target (Path): Local file
+
+        Returns:
+            bool: True on success
+        """
+
+
+class XRootDTransport(Transport):
+    """Remote files on a xrootd server."""
+
+    url: str
+    path: pathlib.PurePath
+    xrd_bin: pathlib.Path
+
+    def __init__(
+        self, url: str, path: pathlib.PurePath, xrd_bin: pathlib.Path = XRD_BIN
+    ) -> None:
+        """Init transport.
+
+        Args:
+            url (str): Server URL
+            path (PurePath): Top directory on the server
+            xrd_bin (Path): Directory of the xrootd tools
+        """
+        self.url = url
+        self.path = path
+        self.xrd_bin = xrd_bin
+
+    async def checksum(self, name: pathlib.PurePath) -> str:
+        """Wrapper xrdadler32."""
+        proc = await asyncio.create_subprocess_exec(
+            self.xrd_bin / "xrdadler32",
+            f"{self.url}/{self.path / name}",
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+        if proc.returncode:
+            raise Exception(
+                f"Return code {proc.returncode} getting remote adler32 for {name}"
+            )
+        return stdout.decode("UTF-8").split()[0]
+
+    async def size(self, name: pathlib.PurePath) -> int:
+        """Wrapper xrdfs stat."""
+        proc = await asyncio.create_subprocess_exec(
+            self.xrd_bin / "xrdfs",
+            self.url,
+            "stat",
+            str(self.path / name),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proc.communicate()
+        if proc.returncode:
+            raise Exception(f"Return code {proc.returncode} getting size for {name}")
+        for line in stdout.decode("UTF-8").splitlines():
+            key, _, value = line.partition(":")
+            if key.strip() == "Size":
+                return int(value)
+        raise Exception(f"No size for {name}")
+
+    async def copy(self, name: pathlib.PurePath, target: pathlib.Path) -> bool:
+        """Wrapper xrdcp."""
+        source = f"{self.url}/{self.path / name}"
+        proc = await asyncio.create_subprocess_exec(
+            self.xrd_bin / "xrdcp",
+            "--nopbar",
+            "--parallel",
+            "4",
+            "--retry",
+            "3",
+            "--cksum",
+            "adler32",
+            "--force",
+            source,
+            str(target),
+        )
+        status = await proc.wait()
+        if status:
+            log.error(f"Return code {status} copying {source}")
+        return not status
+
+
+class LocalTransport(Transport):
+    """Remote files in a local directory."""
+
+    path: pathlib.Path
+    pool: concurrent.futures.Executor
+
+    def __init__(self, path: pathlib.Path, pool: concurrent.futures.Executor) -> None:
+        """Init transport.
+
+        Args:
+            path (Path): Top directory of the files
+            pool (Executor): Threads for copy and checksum
+        """
+        self.path = path
+        self.pool = pool
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.pool, func, *args)
+
+    async def checksum(self, name: pathlib.PurePath) -> str:
+        """Checksum with zlib."""
+        return await self._run(manifest.adler32, self.path / name)
+
+    async def size(self, name: pathlib.PurePath) -> int:
+        """Size from stat."""
+        return os.stat(self.path / name).st_size
+
+    async def copy(self, name: pathlib.PurePath, target: pathlib.Path) -> bool:
+        """Copy with shutil and compare the checksums."""
+        source = self.path / name
+        try:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            await self._run(shutil.copyfile, source, target)
+            chksums = await asyncio.gather(
+                self.checksum(name), self._run(manifest.adler32, target)
+            )
+        except OSError as e:
+            log.error("Exception %s copying %s", e, source)
+            return False
+        if chksums[0] != chksums[1]:
+            log.error("Checksum mismatch copying %s", source)
+            return False
+        return True
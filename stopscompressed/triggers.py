@@ -0,0 +1,54 @@
+"""Trigger selection with per file trigger availability.
+
+Triggers can be missing in some files of a sample. The files are grouped
+by the triggers present, as known from the schemas in the file catalog, and
+each group is read by its own dataframe. In a group absent triggers are
+false. The OR of the triggers is evaluated by FilterAnyTrigger from
+triggers_inc.h, which is compiled once per worker, so no expression is
+compiled per sample.
+"""
+import logging
+from typing import Any
+
+import ROOT
+
+DataFrame = Any
+
+log = logging.getLogger(__name__)
+
+
+def group_files(files: list[str], present: dict[str, set[str]]) -> list[list[str]]:
+    """Group files by the triggers present.
+
+    Args:
+        files (list[str]): Input files
+        present (dict[str, set[str]]): Triggers present by file
+
+    Returns:
+        list[list[str]]: Groups of files, in the order of the files
+    """
+    groups: dict[frozenset[str], list[str]] = {}
+    for f in files:
+        groups.setdefault(frozenset(present[f]), []).append(f)
+    return list(groups.values())
+
+
+def filter_flags(df: DataFrame, flags: list[str]) -> DataFrame:
+    """DF Filter on the OR of the flags present in the input files.
+
+    Args:
+        df (RDataFrame): ROOT dataframe
+        flags (list[str]): List of flags
+
+    Returns:
+        DataFrame: Filtered dataframe
+    """
+    cols = set(str(c) for c in df.GetColumnNames())
+    if bad := ", ".join(t for t in flags if t not in cols):
+        log.debug("Missing flags: %s", bad)
+
+    good = [t for t in flags if t in cols]
+    if not good:
+        log.warning("No valid flags, no events selected.")
+    log.debug("Flag Selection: %s", " || ".join(good))
+    return ROOT.FilterAnyTrigger(ROOT.RDF.AsRNode(df), good)
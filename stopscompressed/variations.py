@@ -0,0 +1,92 @@
+"""Selection variations booked in the same computation graph.
+
+Each variation provides its own dataframes, named ``<dataframe>__<variation>``.
+The histogram definitions are expanded accordingly, so that all histograms
+are filled in a single event loop. Afterwards the histograms of the
+variations are moved into subdirectories named after the variation.
+"""
+import copy
+import logging
+import pathlib
+from stopscompressed import histos
+from typing import Any
+
+import ROOT
+import ruamel.yaml
+
+log = logging.getLogger(__name__)
+
+SEPARATOR = "__"
+
+
+def name(base: str, variation: str) -> str:
+    """Name of a dataframe or histogram for a variation."""
+    return f"{base}{SEPARATOR}{variation}"
+
+
+def expand_histos(
+    histos_file: pathlib.Path, variations: list[str], output: pathlib.Path
+) -> pathlib.Path:
+    """Add the histograms of the variations to the histogram definitions.
+
+    Args:
+        histos_file (Path): Yaml file with histogram definitions
+        variations (list[str]): Names of the variations
+        output (Path): Yaml file with the expanded definitions
+
+    Returns:
+        Path: the expanded definitions
+    """
+    yaml = ruamel.yaml.YAML(typ="safe")
+    with open(histos_file, "r") as inp:
+        definitions = yaml.load(inp)
+
+    expanded = list(definitions)
+    for variation in variations:
+        for entry in definitions:
+            entry = copy.deepcopy(entry)
+            entry["dataframe"] = name(entry["dataframe"], variation)
+            for histo_type in histos.HISTO_TYPES:
+                for histo in entry.get(histo_type) or []:
+                    # variable defaults to the name of the histogram
+                    if "var" not in histo and "var1" not in histo:
+                        histo["var"] = histo["name"]
+                    histo["name"] = name(histo["name"], variation)
+            expanded.append(entry)
+
+    log.debug("Writing histogram definitions %s", output)
+    yaml.explicit_start = True
+    yaml.default_flow_style = False
+    with open(output, "w") as out:
+        yaml.dump(expanded, out)
+
+    return output
+
+
+def move_to_subdirs(root_path: pathlib.Path, variations: list[str]) -> None:
+    """Move histograms of the variations into subdirectories.
+
+    Args:
+        root_path (Path): ROOT file with the histograms
+        variations (list[str]): Names of the variations
+    """
+    log.info("Moving variations to subdirectories in %s", root_path)
+    root_file = ROOT.TFile(str(root_path), "UPDATE")
+    _move_to_subdirs(root_file, variations)
+    root_file.Close()
+
+
+def _move_to_subdirs(directory: Any, variations: list[str]) -> None:
+    for key in list(directory.GetListOfKeys()):
+        key_name = str(key.GetName())
+        if key.IsFolder():
+            _move_to_subdirs(directory.GetDirectory(key_name), variations)
+            continue
+        base, sep, variation = key_name.rpartition(SEPARATOR)
+        if not sep or variation not in variations:
+            continue
+        subdir = directory.GetDirectory(variation) or directory.mkdir(variation)
+        obj = key.ReadObj()
+        obj.SetName(base)
+        subdir.WriteObject(obj, base)
+        directory.Delete(f"{key_name};*")
@@ -0,0 +1,54 @@
+"""Tests of the splitting of samples into chunks."""
+from stopscompressed import chunks
+
+import pytest
+
+
+def test_small_files_are_grouped() -> None:
+    """Files are grouped until the next file exceeds the chunk size."""
+    result = chunks.split({"a": 2, "b": 2, "c": 2}, 5)
+    assert result == [chunks.Chunk(["a", "b"]), chunks.Chunk(["c"])]
+
+
+def test_file_of_chunk_size_is_not_split() -> None:
+    """A file with exactly the chunk size is a chunk of its own."""
+    result = chunks.split({"a": 1, "b": 4, "c": 1}, 4)
+    assert result == [chunks.Chunk(["a"]), chunks.Chunk(["b"]), chunks.Chunk(["c"])]
+
+
+def test_large_file_is_split_into_ranges() -> None:
+    """A large file ends the group and is split into entry ranges."""
+    result = chunks.split({"a": 1, "b": 11}, 4)
+    assert result == [
+        chunks.Chunk(["a"]),
+        chunks.Chunk(["b"], (0, 4)),
+        chunks.Chunk(["b"], (4, 8)),
+        chunks.Chunk(["b"], (8, 11)),
+    ]
+
+
+def test_number_of_ranges_is_rounded() -> None:
+    """A file slightly above the chunk size stays one range."""
+    assert chunks.split({"a": 5}, 4) == [chunks.Chunk(["a"], (0, 5))]
+
+
+def test_large_file_without_splitting() -> None:
+    """Without splitting a large file is grouped as a whole."""
+    result = chunks.split({"a": 1, "b": 11}, 4, split_files=False)
+    assert result == [chunks.Chunk(["a"]), chunks.Chunk(["b"])]
+
+
+@pytest.mark.parametrize("entries", [5, 7, 10, 11, 99, 100, 101, 12345])
+@pytest.mark.parametrize("chunk_entries", [2, 3, 4, 10])
+def test_ranges_cover_the_file(entries: int, chunk_entries: int) -> None:
+    """The ranges of a file are contiguous and cover all entries."""
+    result = chunks.split({"a": entries}, chunk_entries)
+    ranges = [c.entry_range for c in result if c.entry_range is not None]
+    if not ranges:
+        assert result == [chunks.Chunk(["a"])]
+        return
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == entries
+    for (_, stop), (start, _) in zip(ranges[:-1], ranges[1:]):
+        assert stop == start
+    assert all(start < stop for start, stop in ranges)
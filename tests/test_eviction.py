@@ -0,0 +1,68 @@
+"""Tests of the selection of the files to be evicted."""
+import logging
+import pathlib
+from stopscompressed import eviction
+
+import pytest
+
+
+def entry(name: str, size: int, atime: int) -> eviction.Entry:
+    """Entry of a file in the scratch tree."""
+    return eviction.Entry(pathlib.PurePath(name), size, atime)
+
+
+def names(entries: list[eviction.Entry]) -> list[str]:
+    """Names of entries."""
+    return [str(e.name) for e in entries]
+
+
+ENTRIES = [
+    entry("tag1/Met/A/A_0.root", 10, 3),
+    entry("tag1/Met/A/A_1.root", 10, 1),
+    entry("tag1/Met/B/B.root", 10, 5),
+    entry("tag2/Met/C/C.root", 10, 2),
+]
+
+
+def test_under_quota() -> None:
+    """Nothing is evicted under the quota."""
+    assert eviction.select(ENTRIES, 40, []) == []
+
+
+def test_least_recently_used_first() -> None:
+    """The oldest files are evicted until the quota is met."""
+    assert names(eviction.select(ENTRIES, 20, [])) == [
+        "tag1/Met/A/A_1.root",
+        "tag2/Met/C/C.root",
+    ]
+
+
+def test_pinned_files_are_kept() -> None:
+    """Files in pinned directories are never evicted."""
+    pinned = [pathlib.PurePath("tag1/Met/A")]
+    assert names(eviction.select(ENTRIES, 20, pinned)) == [
+        "tag2/Met/C/C.root",
+        "tag1/Met/B/B.root",
+    ]
+
+
+def test_pinned_files_over_quota(caplog: pytest.LogCaptureFixture) -> None:
+    """All unpinned files are evicted, if the pinned files exceed the quota."""
+    pinned = [pathlib.PurePath("tag1")]
+    with caplog.at_level(logging.WARNING):
+        evict = eviction.select(ENTRIES, 20, pinned)
+    assert names(evict) == ["tag2/Met/C/C.root"]
+    assert "exceed the quota by 10 bytes" in caplog.text
+
+
+def test_by_tag() -> None:
+    """All files of a tag are evicted together, by their last access."""
+    assert names(eviction.select(ENTRIES, 30, [], by_tag=True)) == [
+        "tag2/Met/C/C.root",
+    ]
+    assert names(eviction.select(ENTRIES, 10, [], by_tag=True)) == [
+        "tag2/Met/C/C.root",
+        "tag1/Met/A/A_0.root",
+        "tag1/Met/A/A_1.root",
+        "tag1/Met/B/B.root",
+    ]
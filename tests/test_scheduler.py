@@ -0,0 +1,43 @@
+"""Tests of the order of the transfers."""
+from stopscompressed import scheduler
+
+import pytest
+
+
+async def copy() -> bool:
+    """Transfer doing nothing."""
+    return True
+
+
+TRANSFERS = [
+    scheduler.Transfer("a", 2, copy),
+    scheduler.Transfer("b", 3, copy),
+    scheduler.Transfer("c", 1, copy),
+    scheduler.Transfer("d", 3, copy),
+]
+
+
+@pytest.mark.parametrize(
+    "how,expected",
+    [
+        ("none", ["a", "b", "c", "d"]),
+        ("largest", ["b", "d", "a", "c"]),
+        ("smallest", ["c", "a", "b", "d"]),
+    ],
+)
+def test_order(how: str, expected: list[str]) -> None:
+    """Transfers of equal size keep their order."""
+    assert [t.name for t in scheduler.order(TRANSFERS, how)] == expected
+
+
+def test_order_returns_a_copy() -> None:
+    """The input list is not modified."""
+    transfers = list(TRANSFERS)
+    assert scheduler.order(transfers, "none") is not transfers
+    scheduler.order(transfers, "largest")
+    assert transfers == TRANSFERS
+
+
+def test_orders_are_known() -> None:
+    """All orders offered by stage.py are handled."""
+    assert scheduler.ORDERS == ["none", "largest", "smallest"]
@@ -0,0 +1,79 @@
+"""Tests of the stitching weights."""
+import bisect
+
+import pytest
+
+pytest.importorskip("ROOT")
+pytest.importorskip("mrtools")
+pytest.importorskip("dask.distributed")
+
+from stopscompressed import stitching  # noqa: E402
+
+INCLUSIVE = {
+    "group": "DY",
+    "variable": "LHE_HT",
+    "edges": [70.0, 100.0, 200.0],
+    "counts": [50, 30, 20, 10],
+}
+
+
+def factor(weight: stitching.Weight, value: float) -> float:
+    """Factor of a weight for a value of the variable."""
+    return weight.factors[bisect.bisect_right(weight.edges, value)]
+
+
+def test_inclusive_only() -> None:
+    """An inclusive sample alone has unit weights."""
+    weights = stitching.weights({"inc": INCLUSIVE})
+    assert weights["inc"] == stitching.Weight([1.0] * 4, "LHE_HT", [70.0, 100.0, 200.0])
+
+
+def test_binned_sample_shares_its_region() -> None:
+    """A binned sample shares the events of its region with the inclusive one."""
+    weights = stitching.weights(
+        {
+            "inc": INCLUSIVE,
+            "HT100to200": {"group": "DY", "range": (100.0, 200.0), "counts": 60},
+        }
+    )
+    assert weights["HT100to200"] == stitching.Weight([0.75])
+    assert weights["inc"].factors == [1.0, 1.0, 0.25, 1.0]
+
+
+def test_lower_edge_belongs_to_the_region() -> None:
+    """A value at an edge uses the factor of the region above."""
+    weights = stitching.weights(
+        {
+            "inc": INCLUSIVE,
+            "HT100to200": {"group": "DY", "range": (100.0, 200.0), "counts": 60},
+        }
+    )
+    assert factor(weights["inc"], 99.9) == 1.0
+    assert factor(weights["inc"], 100.0) == 0.25
+    assert factor(weights["inc"], 200.0) == 1.0
+
+
+def test_range_from_the_sample_name() -> None:
+    """The range of a binned sample is taken from its name."""
+
+    class Sample:
+        name = "DYJetsToLL_M50_HT200toInf"
+
+    assert stitching.sample_range(Sample(), {}) == (200.0, float("inf"))
+
+
+def test_range_not_in_the_edges() -> None:
+    """A binned range not matching the edges is an error."""
+    with pytest.raises(ValueError, match="not in edges"):
+        stitching.weights(
+            {
+                "inc": INCLUSIVE,
+                "HT100to300": {"group": "DY", "range": (100.0, 300.0), "counts": 1},
+            }
+        )
+
+
+def test_group_without_inclusive_sample() -> None:
+    """A group without an inclusive sample gets no weights."""
+    binned = {"group": "DY", "range": (100.0, 200.0), "counts": 1}
+    assert stitching.weights({"HT100to200": binned}) == {}
@@ -0,0 +1,64 @@
+#ifndef TRIGGERS_INC_H
+#define TRIGGERS_INC_H
+
+#include <ROOT/RDataFrame.hxx>
+
+#include <cstddef>
+#include <stdexcept>
+#include <string>
+#include <utility>
+
+// Filter on the OR of trigger flags, compiled once per process
+//
+// The trigger columns are passed by name, so that the same compiled code is
+// used for any combination of triggers. Triggers absent in the input files
+// are left out by the caller; without any trigger no event passes.
+//
+// Usage: df = FilterAnyTrigger(ROOT.RDF.AsRNode(df), ["HLT_a", "HLT_b"])
+
+namespace triggers {
+
+constexpr std::size_t kMaxTriggers = 16;
+
+template <std::size_t>
+using Flag = bool;
+
+template <typename Seq>
+struct AnyOf;
+
+template <std::size_t... I>
+struct AnyOf<std::index_sequence<I...>> {
+  static ROOT::RDF::RNode Filter(ROOT::RDF::RNode df,
+                                 const ROOT::RDF::ColumnNames_t& columns) {
+    return df.Filter([](Flag<I>... flags) { return (false || ... || flags); },
+                     columns, "trigger");
+  }
+};
+
+template <std::size_t... N>
+ROOT::RDF::RNode FilterAnyImpl(ROOT::RDF::RNode df,
+                               const ROOT::RDF::ColumnNames_t& columns,
+                               std::index_sequence<N...>) {
+  using FilterFunc = ROOT::RDF::RNode (*)(ROOT::RDF::RNode,
+                                          const ROOT::RDF::ColumnNames_t&);
+  static const FilterFunc filters[] = {
+      &AnyOf<std::make_index_sequence<N + 1>>::Filter...};
+  return filters[columns.size() - 1](df, columns);
+}
+
+}  // namespace triggers
+
+inline ROOT::RDF::RNode FilterAnyTrigger(
+    ROOT::RDF::RNode df, const ROOT::RDF::ColumnNames_t& columns) {
+  if (columns.empty()) {
+    return df.Filter([]() { return false; }, {}, "trigger");
+  }
+  if (columns.size() > triggers::kMaxTriggers) {
+    throw std::invalid_argument("Too many triggers: " +
+                                std::to_string(columns.size()));
+  }
+  return triggers::FilterAnyImpl(
+      df, columns, std::make_index_sequence<triggers::kMaxTriggers>{});
+}
+
+#endif
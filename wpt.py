@@ -9,6 +9,11 @@ from mrtools import config
 from mrtools import model
 from mrtools import plotter
 from mrtools import utils
+from stopscompressed import base
+from stopscompressed import expressions
+from stopscompressed import headers
+from stopscompressed import triggers
+from stopscompressed import variations
 from typing import Any
 
 import click
@@ -32,6 +37,11 @@ CORRECTIONLIB_DIR = (
     pathlib.Path(os.environ["CONDA_PREFIX"])
     / "lib/python3.11/site-packages/correctionlib"
 )
+HEADERS = [
+    BASE_DIR / "wpt_inc.h",
+    BASE_DIR / "triggers_inc.h",
+    BASE_DIR / "leptonsf_inc.h",
+]
 DEFAULT_OUTPUT = pathlib.Path(
     "/scratch-cbe/users", os.environ["USER"], "StopsCompressed/plots"
 )
@@ -48,32 +58,20 @@ DEFAULT_NAME = "wpt"
 DEFAULT_SAMPLE_FILE = BASE_DIR / "samples/MetLepEnergy_nanoNtuple_v7.yaml"
 DEFAULT_HISTOS_FILE = BASE_DIR / "wpt_histos.yaml"
 
+PRESELECTION = "HT>200. && met_pt>100. && nBTag == 0"
 
-def filter_flags(df: Any, flags: list[str]) -> Any:
-    """DF Filter from flags.
-
-    Check if flgas are present in the file before applying the filter.
-    Not so clear, why this is necessary.
-
-    Args:
-        df (RDataFrame): ROOT dataframe
-        flags (list[str]): List of flags
-    """
-    cols = df.GetColumnNames()
-    if bad := ", ".join(t for t in flags if t not in cols):
-        log.warning("Missing flags: %s", bad)
-
-    if good := " || ".join(t for t in flags if t in cols):
-        log.debug("Flag Selection: %s", good)
-        return df.Filter(good)
-    else:
-        log.error("No valid flags.")
-        return df
+# Lepton selections, which can be filled in the same event loop
+VARIATIONS = {
+    "tight": {"tight": True},
+    "medium": {"tight": False},
+}
 
 
-class WPTAnalysis(analysis.HistoAnalysis):
+class WPTAnalysis(base.BaseAnalysis):
     """W_pt analysis."""
 
+    cpp_headers = HEADERS
+
     tight: bool
     muon_lumi: float
     elec_lumi: float
@@ -90,6 +88,14 @@ class WPTAnalysis(analysis.HistoAnalysis):
         elec_int_lumi: float,
         muon_trigger: list[str],
         elec_trigger: list[str],
+        skim_dir: pathlib.Path | None = None,
+        variations: list[str] | None = None,
+        histo_cache_dir: pathlib.Path | None = None,
+        checkpoint_dir: pathlib.Path | None = None,
+        resume: bool = False,
+        chunk_entries: int = 0,
+        catalog_file: pathlib.Path | None = None,
+        prefetch_depth: int = 0,
     ) -> None:
         """Init w_pt analysis.
 
@@ -102,104 +108,151 @@ class WPTAnalysis(analysis.HistoAnalysis):
             elec_int_lumi (float): Integrated luminosity for electron sample
             muon_trigger (list[str]): Muon trigger selection
             elec_trigger (list[str]): Electron trigger selection
+            skim_dir (Path | None): Directory for skims of preselected events
+            variations (list[str] | None): Variations filled in addition
+            histo_cache_dir (Path | None): Directory for histograms per file
+            checkpoint_dir (Path | None): Directory for histograms per sample
+            resume (bool): take completed samples from the checkpoints
+            chunk_entries (int): Entries per task, 0 for one task per sample
+            catalog_file (Path | None): File catalog with the entries per file
+            prefetch_depth (int): Files copied ahead to scratch, 0 to disable
         """
-        super().__init__(histo_file, output, small)
+        super().__init__(
+            histo_file,
+            output,
+            small,
+            PRESELECTION,
+            muon_trigger + elec_trigger,
+            {"tight": tight},
+            skim_dir,
+            {v: VARIATIONS[v] for v in variations or []},
+            histo_cache_dir,
+            checkpoint_dir,
+            resume,
+            chunk_entries,
+            catalog_file,
+            prefetch_depth=prefetch_depth,
+        )
         self.tight = tight
         self.muon_int_lumi = muon_int_lumi
         self.elec_int_lumi = elec_int_lumi
         self.muon_trigger = muon_trigger
         self.elec_trigger = elec_trigger
 
-    def define(self, sample: model.Sample, df: DataFrame) -> dict[str, DataFrame]:
+    def select(
+        self, sample: model.Sample, df: DataFrame, tight: bool
+    ) -> dict[str, DataFrame]:
         """Define dataframes.
 
         A number of different dataframes can be defined for various histograms.
 
         Args:
             sample (Sample): The sample to be analysed
-            dataframe (RDataFrame): ROOT Dataframe of the sample
+            dataframe (RDataFrame): Dataframe of the preselected events
+            tight (bool): use tight lepton definitions
 
         Returns:
             dict[str, DataFrame]: Dict of dataframes
         """
-        #       Event selection
-        df = df.Filter("HT>200. && met_pt>100. && nBTag == 0")
         #       Lepton selection
-        if self.tight:
-            df = df.Define(
+        if tight:
+            df = expressions.define(
+                df,
                 "GoodMuon",
                 "Muon_tightId && abs(Muon_eta) < 1.5 && Muon_pfRelIso03_all < 0.1",
-            ).Define(
+            )
+            df = expressions.define(
+                df,
                 "GoodElectron",
                 "Electron_cutBased > 2 && abs(Electron_eta) < 1.5 && Electron_pfRelIso03_all < 0.1",  # noqa: B950
             )
         else:
-            df = df.Define(
+            df = expressions.define(
+                df,
                 "GoodMuon",
                 "Muon_mediumId && abs(Muon_eta) < 1.5 && Muon_pfRelIso03_all < 0.1",
-            ).Define(
+            )
+            df = expressions.define(
+                df,
                 "GoodElectron",
                 "Electron_cutBased > 1 && abs(Electron_eta) < 1.5 && Electron_pfRelIso03_all < 0.1",  # noqa: B950
             )
 
-        df = (
-            df.Define("GoodMuon_pt", "Muon_pt[GoodMuon]")
-            .Define("GoodMuon_phi", "Muon_phi[GoodMuon]")
-            .Define("GoodMuon_eta", "Muon_eta[GoodMuon]")
-            .Define("GoodElectron_pt", "Electron_pt[GoodElectron]")
-            .Define("GoodElectron_phi", "Electron_phi[GoodElectron]")
-            .Define("GoodElectron_eta", "Electron_eta[GoodElectron]")
-        )
+        for column, expression in [
+            ("GoodMuon_pt", "Muon_pt[GoodMuon]"),
+            ("GoodMuon_phi", "Muon_phi[GoodMuon]"),
+            ("GoodMuon_eta", "Muon_eta[GoodMuon]"),
+            ("GoodElectron_pt", "Electron_pt[GoodElectron]"),
+            ("GoodElectron_phi", "Electron_phi[GoodElectron]"),
+            ("GoodElectron_eta", "Electron_eta[GoodElectron]"),
+        ]:
+            df = expressions.define(df, column, expression)
 
         # Event weights
 
-        df_muon = filter_flags(df, self.muon_trigger)
-        df_elec = filter_flags(df, self.elec_trigger)
+        df_muon = triggers.filter_flags(df, self.muon_trigger)
+        df_elec = triggers.filter_flags(df, self.elec_trigger)
 
         if sample.type == model.SampleType.DATA:
-            muon_weight = "1"
-            elec_weight = "1"
+            weight = "1"
         else:
-            weights = [
-                "weight",
-                "reweightPU",
-                "reweightBTag_SF",
-                "reweightL1Prefire",
-                "reweightLeptonSF",
-                "{}",
-            ]
-            muon_weight = "*".join(weights).format(self.muon_int_lumi)
-            elec_weight = "*".join(weights).format(self.elec_int_lumi)
-        log.debug("Muon weight %s", muon_weight)
-        log.debug("Electron weight %s", elec_weight)
-        df_muon = df_muon.Define("the_weight", muon_weight)
-        df_elec = df_elec.Define("the_weight", elec_weight)
-
-        df_muon = (
-            df_muon.Filter("Sum(GoodMuon_pt > 50.) > 0")
-            .Filter("Sum(GoodElectron_pt > 50.) == 0")
-            .Define("ll_idx", "ArgMax(GoodMuon_pt)")
-            .Define("ll_pt", "GoodMuon_pt[ll_idx]")
-            .Define("ll_phi", "GoodMuon_phi[ll_idx]")
-            .Define("ll_eta", "GoodMuon_eta[ll_idx]")
-            .Define("LT", "ll_pt + met_pt")
-            .Define("W_pt", "pt_lep_met(ll_pt, ll_phi, met_pt, met_phi)")
-            .Define("W_mt", "mt_lep_met(ll_pt, ll_phi, met_pt, met_phi)")
-        )
+            weight = "*".join(
+                [
+                    "weight",
+                    "reweightPU",
+                    "reweightBTag_SF",
+                    "reweightL1Prefire",
+                    "reweightLeptonSF",
+                    "lumi",
+                ]
+            )
+        log.debug("Weight %s", weight)
+        # the luminosity is a column, so that the periods share the function
+        df_muon = expressions.constant(df_muon, "lumi", self.muon_int_lumi)
+        df_elec = expressions.constant(df_elec, "lumi", self.elec_int_lumi)
+        df_muon = expressions.define(df_muon, "the_weight", weight)
+        df_elec = expressions.define(df_elec, "the_weight", weight)
+
+        df_muon = expressions.cut(df_muon, "Sum(GoodMuon_pt > 50.) > 0")
+        df_muon = expressions.cut(df_muon, "Sum(GoodElectron_pt > 50.) == 0")
+        df_muon = self.w_candidate(df_muon, "GoodMuon")
+
+        df_elec = expressions.cut(df_elec, "Sum(GoodElectron_pt > 50.) > 0")
+        df_elec = expressions.cut(df_elec, "Sum(GoodMuon_pt > 50.) == 0")
+        df_elec = self.w_candidate(df_elec, "GoodElectron")
 
-        df_elec = (
-            df_elec.Filter("Sum(GoodElectron_pt > 50.) > 0")
-            .Filter("Sum(GoodMuon_pt > 50.) == 0")
-            .Define("ll_idx", "ArgMax(GoodElectron_pt)")
-            .Define("ll_pt", "GoodElectron_pt[ll_idx]")
-            .Define("ll_phi", "GoodElectron_phi[ll_idx]")
-            .Define("ll_eta", "GoodElectron_eta[ll_idx]")
-            .Define("LT", "ll_pt + met_pt")
-            .Define("W_pt", "pt_lep_met(ll_pt, ll_phi, met_pt, met_phi)")
-            .Define("W_mt", "mt_lep_met(ll_pt, ll_phi, met_pt, met_phi)")
-        )
         return {"muon": df_muon, "elec": df_elec}
 
+    def w_candidate(self, df: DataFrame, lepton: str) -> DataFrame:
+        """Define the W candidate from the leading lepton and MET.
+
+        The candidate is built by w_candidate in wpt_inc.h, the columns only
+        read its members.
+
+        Args:
+            df (DataFrame): Dataframe
+            lepton (str): Prefix of the good lepton columns
+
+        Returns:
+            DataFrame: Dataframe with the W candidate
+        """
+        df = expressions.define(
+            df,
+            "W",
+            f"w_candidate({lepton}_pt, {lepton}_eta, {lepton}_phi, met_pt, met_phi)",
+        )
+        for column, expression in [
+            ("ll_idx", "W.idx"),
+            ("ll_pt", "W.pt"),
+            ("ll_phi", "W.phi"),
+            ("ll_eta", "W.eta"),
+            ("LT", "W.LT"),
+            ("W_pt", "W.W_pt"),
+            ("W_mt", "W.W_mt"),
+        ]:
+            df = expressions.define(df, column, expression)
+        return df
+
 
 class MyWorkerPlugin(analysis.WorkerPlugin):
     """Worker plugin for initialisation of workers."""
@@ -207,10 +260,12 @@ class MyWorkerPlugin(analysis.WorkerPlugin):
     def setup(self, worker: dd.Worker) -> None:
         """Setup ROOT on worker process."""
         super().setup(worker)
-        ROOT.gROOT.ProcessLine(f'#include "{BASE_DIR}/wpt_inc.h"')
-        ROOT.gROOT.ProcessLine(f".include {CORRECTIONLIB_DIR}/include")
-        ROOT.gSystem.Load(f"{CORRECTIONLIB_DIR}/lib/libcorrectionlib.so")
-        ROOT.gROOT.ProcessLine(f'#include "{BASE_DIR}/leptonsf_inc.h"')
+        headers.load(
+            "wpt",
+            HEADERS,
+            [CORRECTIONLIB_DIR / "include"],
+            [CORRECTIONLIB_DIR / "lib/libcorrectionlib.so"],
+        )
 
 @click.command(context_settings=dict(max_content_width=120))
 @click.argument("dataset", nargs=-1)
@@ -261,6 +316,44 @@ class MyWorkerPlugin(analysis.WorkerPlugin):
 @click.option("--histos/--no-histos", default=True, help="Fill histograms.")
 @click.option("--plots/--no-plots", default=True, help="Make plots from histograms.")
 @click.option("--tight/--no-tight", default=True, help="Tight lepton selection.")
+@click.option("--skim/--no-skim", default=False, help="Cache preselected events.")
+@click.option(
+    "--histo-cache/--no-histo-cache",
+    default=False,
+    help="Fill histograms only for new files or definitions.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=False,
+    help="Skip samples completed in a previous run.",
+)
+@click.option(
+    "--chunk-entries",
+    metavar="N",
+    default=0,
+    type=click.IntRange(0, None),
+    help="Split samples into tasks of about N entries [default: per sample]",
+)
+@click.option(
+    "--prefetch",
+    metavar="N",
+    default=0,
+    type=click.IntRange(0, None),
+    help="Copy the next N files of a task to scratch [default: no prefetch]",
+)
+@click.option(
+    "--catalog",
+    "catalog_file",
+    metavar="FILE",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    help="File catalog for the chunks and trigger groups [default: none]",
+)
+@click.option(
+    "--variations/--no-variations",
+    "fill_variations",
+    default=False,
+    help="Fill also the other lepton selections.",
+)
 @config.click_options()
 @cache.click_options()
 @analysis.click_options()
@@ -276,6 +369,13 @@ def main(
     histos: bool,
     plots: bool,
     tight: bool,
+    skim: bool,
+    histo_cache: bool,
+    resume: bool,
+    chunk_entries: int,
+    prefetch: int,
+    catalog_file: pathlib.Path | None,
+    fill_variations: bool,
 ):
     """W_pt Analysis."""
     cfg.load()
@@ -287,6 +387,16 @@ def main(
             sc.load(sf)
 
         if histos:
+            if fill_variations:
+                var_names = [v for v, o in VARIATIONS.items() if o["tight"] != tight]
+                var_histos_file = variations.expand_histos(
+                    histos_file, var_names, output / f"{name}_histos.yaml"
+                )
+                log.info("Filling also variations %s", ", ".join(var_names))
+            else:
+                var_names = []
+                var_histos_file = histos_file
+
             proc = analysis.Processor(MyWorkerPlugin())
             for p in period:
                 log.info("Filling histos for %s", p)
@@ -305,7 +415,7 @@ def main(
                 log.debug("Electron inv lumi: %.2f", elec_int_lumi)
 
                 wpt_analysis = WPTAnalysis(
-                    histos_file,
+                    var_histos_file,
                     output / f"{name}_{p}",
                     small,
                     tight,
@@ -313,8 +423,19 @@ def main(
                     elec_int_lumi,
                     muon_trigger,
                     elec_trigger,
+                    output / "skim" if skim else None,
+                    var_names,
+                    output / "histo_cache" if histo_cache else None,
+                    output / "checkpoints" / f"{name}_{p}",
+                    resume,
+                    chunk_entries,
+                    catalog_file,
+                    prefetch,
                 )
+                wpt_analysis.fill_catalog(sc.list(p))
                 proc.run(sc, p, wpt_analysis, dataset)
+                if var_names:
+                    variations.move_to_subdirs(output / f"{name}_{p}.root", var_names)
 
             del proc  # shutdown dask cluster
 
@@ -1,5 +1,9 @@
 #ifndef WPT_INC_H_
 #define WPT_INC_H_
+#include <ROOT/RVec.hxx>
+
+#include <cmath>
+
 // Transverse momentum of lepton and MET 
 // Usage: pt = pt_lep_met(lep_pt, lep_phi, met_pt, met_phi)
 // Lepton can be vector
@@ -18,4 +22,43 @@ T mt_lep_met(const T & pt1, const T & phi1, const float pt2, const float phi2)
     return sqrt(2. * pt1 * pt2 * (1. - cos(phi1 - phi2)));
 }
 
-#endif
\ No newline at end of file
+// W candidate from the leading lepton and MET
+// idx is -1 if there is no lepton, the kinematics are then zero.
+struct WCandidate {
+    int idx = -1;
+    float pt = 0.;
+    float eta = 0.;
+    float phi = 0.;
+    float LT = 0.;
+    float W_pt = 0.;
+    float W_mt = 0.;
+};
+
+// Build the W candidate in one pass, sharing cos(dphi) between pt and mt
+// Usage: W = w_candidate(GoodMuon_pt, GoodMuon_eta, GoodMuon_phi,
+//                        met_pt, met_phi)
+inline WCandidate w_candidate(
+    const ROOT::RVecF & pt,
+    const ROOT::RVecF & eta,
+    const ROOT::RVecF & phi,
+    const float met_pt,
+    const float met_phi)
+{
+    WCandidate w;
+    for (int i = 0; i < static_cast<int>(pt.size()); i++) {
+        if (w.idx == -1 || pt[i] > pt[w.idx]) w.idx = i;
+    }
+    if (w.idx == -1) return w;
+
+    w.pt = pt[w.idx];
+    w.eta = eta[w.idx];
+    w.phi = phi[w.idx];
+    w.LT = w.pt + met_pt;
+    const float cos_dphi = std::cos(w.phi - met_phi);
+    const float pt_met = 2.f * w.pt * met_pt;
+    w.W_pt = std::sqrt(w.pt * w.pt + met_pt * met_pt + pt_met * cos_dphi);
+    w.W_mt = std::sqrt(pt_met * (1.f - cos_dphi));
+    return w;
+}
+
+#endif